@@ -0,0 +1,151 @@
+import gzip
+import io
+import json
+import os
+import time
+import boto3
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+from decimal import Decimal
+
+# Get the table and bucket names from environment variables
+TABLE_NAME = os.getenv('TABLE_NAME')
+ARCHIVE_BUCKET_NAME = os.getenv('ARCHIVE_BUCKET_NAME')
+
+# Finished migrations older than this are moved out of the hot table
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '30'))
+
+# Record rows stay readable for a while after archival; DynamoDB deletes them after expire_at
+ROW_EXPIRY_GRACE_SECONDS = 24 * 60 * 60
+
+# Sort key of the per-migration summary item holding the progress counters
+SUMMARY_RECORD = '#SUMMARY'
+
+# Records in these states may still change, the migration is archived on a later run
+ACTIVE_STATUSES = {'STARTED', 'SUCCEEDED', 'ROLLING_BACK'}
+
+# Records in any other state that still own resources can be rolled back, which needs the table rows
+SETTLED_STATUSES = {'COMPLETED', 'ROLLED_BACK'}
+
+# Deleted secrets can still be restored for this long
+CLOUDFLARE_SECRET_RECOVERY_DAYS = 7
+
+dynamodb = boto3.resource('dynamodb')
+s3_client = boto3.client('s3')
+secrets_client = boto3.client('secretsmanager')
+
+# Function to convert Decimal types to int or float for JSON serialization
+def decimal_to_num(obj):
+    if isinstance(obj, Decimal):
+        return int(obj) if obj % 1 == 0 else float(obj)
+    raise TypeError("Object of type %s is not JSON serializable" % type(obj))
+
+def archive_key(migration_id):
+    return f"archive/{migration_id}.jsonl.gz"
+
+def find_archivable_summaries(table, cutoff):
+    kwargs = {
+        'FilterExpression': Attr('dns_record').eq(SUMMARY_RECORD) & Attr('start_time').lt(cutoff) & Attr('archive').not_exists()
+    }
+    while True:
+        response = table.scan(**kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def query_records(table, migration_id):
+    records = []
+    kwargs = {'KeyConditionExpression': Key('migration_id').eq(migration_id)}
+    while True:
+        response = table.query(**kwargs)
+        records.extend(item for item in response['Items'] if item['dns_record'] != SUMMARY_RECORD)
+        if 'LastEvaluatedKey' not in response:
+            return records
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def write_archive(migration_id, summary, records):
+    # One gzip JSONL object per migration: the summary on the first line, then one record per line
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
+        for item in [summary] + records:
+            f.write((json.dumps(item, default=decimal_to_num) + '\n').encode('utf-8'))
+    body = buffer.getvalue()
+    s3_client.put_object(
+        Bucket=ARCHIVE_BUCKET_NAME,
+        Key=archive_key(migration_id),
+        Body=body,
+        ContentType='application/gzip'
+    )
+    return len(body)
+
+def delete_cloudflare_api_token(secret_id):
+    # Archived migrations can no longer be rolled back, nothing reads their Cloudflare token again
+    try:
+        secrets_client.delete_secret(SecretId=secret_id, RecoveryWindowInDays=CLOUDFLARE_SECRET_RECOVERY_DAYS)
+    except ClientError as e:
+        # Already deleted, or already scheduled for deletion by a rollback
+        if e.response['Error']['Code'] not in ('ResourceNotFoundException', 'InvalidRequestException'):
+            raise
+
+def archive_migration(table, summary):
+    migration_id = summary['migration_id']
+    records = query_records(table, migration_id)
+    if any(record.get('status') in ACTIVE_STATUSES for record in records):
+        print(f"Skipping {migration_id}, records are still in progress")
+        return False
+    if any(record.get('resources') and record.get('status') not in SETTLED_STATUSES for record in records):
+        print(f"Skipping {migration_id}, records still own resources that were not rolled back")
+        return False
+
+    # Before the summary points at the archive, so a failed deletion is retried on the next run
+    if summary.get('cloudflare_secret_id'):
+        delete_cloudflare_api_token(summary['cloudflare_secret_id'])
+
+    size = write_archive(migration_id, summary, records)
+
+    # The summary row stays in the table and points at the archive; readers switch to S3 from here on
+    table.update_item(
+        Key={'migration_id': migration_id, 'dns_record': SUMMARY_RECORD},
+        UpdateExpression='SET #archive = :a ADD version :one',
+        ExpressionAttributeNames={'#archive': 'archive'},  # reserved word
+        ExpressionAttributeValues={
+            ':a': {
+                'bucket': ARCHIVE_BUCKET_NAME,
+                'key': archive_key(migration_id),
+                'records': len(records),
+                'bytes': size,
+                'archived_at': int(time.time())
+            },
+            ':one': 1
+        }
+    )
+
+    expire_at = int(time.time()) + ROW_EXPIRY_GRACE_SECONDS
+    for record in records:
+        table.update_item(
+            Key={'migration_id': migration_id, 'dns_record': record['dns_record']},
+            UpdateExpression='SET expire_at = :e',
+            ExpressionAttributeValues={':e': expire_at}
+        )
+
+    print(f"Archived {migration_id}: {len(records)} records, {size} bytes")
+    return True
+
+def lambda_handler(event, context):
+    table = dynamodb.Table(TABLE_NAME)
+    cutoff = int(time.time()) - RETENTION_DAYS * 24 * 60 * 60
+
+    archived = 0
+    for summary in find_archivable_summaries(table, cutoff):
+        # Leave enough time to finish the migration at hand, the next run picks up the rest
+        if context and context.get_remaining_time_in_millis() < 60 * 1000:
+            print("Running out of time, stopping for this run")
+            break
+        try:
+            if archive_migration(table, summary):
+                archived += 1
+        except Exception as e:
+            print(f"Error archiving {summary['migration_id']}: {e}")
+
+    return {'archived': archived}
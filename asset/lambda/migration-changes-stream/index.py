@@ -0,0 +1,45 @@
+import os
+import time
+import boto3
+from boto3.dynamodb.types import TypeDeserializer
+
+# Get the change feed table name from environment variables
+CHANGES_TABLE_NAME = os.getenv('CHANGES_TABLE_NAME')
+
+# Changes only need to outlive the longest time a page can go without polling
+CHANGE_RETENTION_SECONDS = 24 * 60 * 60
+
+# Attributes the migration-history page displays; everything else stays out of the feed
+RECORD_FIELDS = ['dns_record', 'status', 'step_name', 'error_message', 'time', 'failed_at', 'execution_arn', 'verification']
+# Progress counters of the summary item, plus its per-step counters (step_*); zone ids, the
+# Cloudflare secret and the cache plan are set once at start and stay out of the feed
+SUMMARY_FIELDS = ['dns_record', 'zone_name', 'start_time', 'total', 'started', 'completed', 'failed', 'version']
+SUMMARY_RECORD = '#SUMMARY'
+
+dynamodb = boto3.resource('dynamodb')
+deserializer = TypeDeserializer()
+
+def to_change(image):
+    if image['dns_record'] == SUMMARY_RECORD:
+        return {k: v for k, v in image.items() if k in SUMMARY_FIELDS or k.startswith('step_')}
+    return {k: image[k] for k in RECORD_FIELDS if k in image}
+
+def lambda_handler(event, context):
+    table = dynamodb.Table(CHANGES_TABLE_NAME)
+    now_ms = int(time.time() * 1000)
+
+    with table.batch_writer() as batch:
+        for record in event.get('Records', []):
+            if record['eventName'] not in ('INSERT', 'MODIFY'):
+                continue
+
+            new_image = {k: deserializer.deserialize(v) for k, v in record['dynamodb']['NewImage'].items()}
+            batch.put_item(
+                Item={
+                    'migration_id': new_image['migration_id'],
+                    # Ordered by arrival time, the sequence number keeps ids unique within a batch
+                    'change_id': f"{now_ms:013d}-{record['dynamodb']['SequenceNumber']}",
+                    'change': to_change(new_image),
+                    'expire_at': int(time.time()) + CHANGE_RETENTION_SECONDS
+                }
+            )
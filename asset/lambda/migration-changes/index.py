@@ -0,0 +1,103 @@
+import json
+import os
+import time
+import boto3
+from botocore.exceptions import ClientError
+from decimal import Decimal
+from boto3.dynamodb.conditions import Key
+
+# Get the change feed table name from environment variables
+CHANGES_TABLE_NAME = os.getenv('CHANGES_TABLE_NAME')
+
+# Hold the request open this long waiting for changes (API Gateway allows 29 seconds)
+LONG_POLL_SECONDS = 20
+POLL_INTERVAL_SECONDS = 1
+
+# Stream shards are written independently, so re-read a small window behind the cursor.
+# The page keeps the newest change_id per row and ignores anything older it sees twice.
+CURSOR_OVERLAP_MS = 5000
+
+# Create a DynamoDB resource
+dynamodb = boto3.resource('dynamodb')
+
+# Function to convert Decimal types to int or float for JSON serialization
+def decimal_to_num(obj):
+    if isinstance(obj, Decimal):
+        # Convert to int if there are no decimal places
+        if obj % 1 == 0:
+            return int(obj)
+        else:
+            return float(obj)
+    raise TypeError("Object of type %s is not JSON serializable" % type(obj))
+
+def query_changes(table, migration_id, after):
+    changes = []
+    kwargs = {
+        'KeyConditionExpression': Key('migration_id').eq(migration_id) & Key('change_id').gt(after),
+        'ProjectionExpression': 'change_id, change'
+    }
+    while True:
+        response = table.query(**kwargs)
+        changes.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return changes
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def lambda_handler(event, context):
+    table = dynamodb.Table(CHANGES_TABLE_NAME)
+
+    query_params = event.get('queryStringParameters') or {}
+    migration_id = query_params.get('migration_id', None)
+    cursor = query_params.get('cursor', None)
+
+    if not migration_id or not cursor:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'message': 'migration_id and cursor are required'})
+        }
+
+    try:
+        after = f"{max(int(cursor.split('-')[0]) - CURSOR_OVERLAP_MS, 0):013d}"
+        deadline = time.time() + LONG_POLL_SECONDS
+
+        changes = query_changes(table, migration_id, after)
+        while not any(change['change_id'] > cursor for change in changes) and time.time() < deadline:
+            time.sleep(POLL_INTERVAL_SECONDS)
+            changes = query_changes(table, migration_id, after)
+
+        new_cursor = max([cursor] + [change['change_id'] for change in changes])
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': 'Migration changes fetched successfully',
+                'data': {
+                    'changes': changes,
+                    'cursor': new_cursor
+                }
+            }, default=decimal_to_num)
+        }
+
+    except ClientError as e:
+        # Handle errors related to DynamoDB
+        print(f'error: {str(e)}')
+
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'message': 'Error fetching migration changes from DynamoDB',
+                'error': str(e)
+            })
+        }
+
+    except Exception as e:
+        # Handle any other general errors
+        print(f'error: {str(e)}')
+
+        return {
+            'statusCode': 500,
+            'body': json.dumps({
+                'message': 'An unexpected error occurred',
+                'error': str(e)
+            })
+        }
@@ -1,5 +1,8 @@
+import gzip
+import hashlib
 import json
 import os
+import time
 import boto3
 from botocore.exceptions import ClientError
 from decimal import Decimal
@@ -8,8 +11,18 @@ from boto3.dynamodb.conditions import Key, Attr
 # Get the DynamoDB table name from environment variables
 TABLE_NAME = os.getenv('TABLE_NAME')
 
+# Sort key of the per-migration summary item holding the progress counters
+SUMMARY_RECORD = '#SUMMARY'
+
+# Archived migrations never change again. Finished ones only change on a rollback, which
+# CloudFront picks up once s-maxage runs out. Anything else is revalidated on every request.
+ARCHIVED_CACHE_CONTROL = 'public, max-age=300, s-maxage=86400'
+FINISHED_CACHE_CONTROL = 'public, max-age=60, s-maxage=300'
+LIVE_CACHE_CONTROL = 'no-cache'
+
 # Create a DynamoDB resource
 dynamodb = boto3.resource('dynamodb')
+s3_client = boto3.client('s3')
 
 # Function to convert Decimal types to int or float for JSON serialization
 def decimal_to_num(obj):
@@ -21,6 +34,77 @@ def decimal_to_num(obj):
             return float(obj)
     raise TypeError("Object of type %s is not JSON serializable" % type(obj))
 
+# Split the items of a migration into its summary item and its DNS record rows
+def split_summary(items):
+    summary = next((item for item in items if item['dns_record'] == SUMMARY_RECORD), None)
+    dns_records = [item for item in items if item['dns_record'] != SUMMARY_RECORD]
+    return summary, dns_records
+
+# Archived migrations keep only their summary row in the table, the records are read from the
+# gzip JSONL archive. The object is decompressed while it streams in, never buffered whole.
+def read_archived_records(archive):
+    response = s3_client.get_object(Bucket=archive['bucket'], Key=archive['key'])
+    with gzip.GzipFile(fileobj=response['Body']) as f:
+        lines = iter(f)
+        next(lines)  # summary line, the table's summary row is the current one
+        return [json.loads(line) for line in lines]
+
+# Summary and DNS records of a migration, from the table or from its archive
+def load_migration(table, migration_id):
+    items = []
+    kwargs = {'KeyConditionExpression': Key('migration_id').eq(migration_id)}
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    summary, dns_records = split_summary(items)
+    if summary and 'archive' in summary:
+        dns_records = read_archived_records(summary['archive'])
+    return summary, dns_records
+
+# Strong ETag over the summary versions a response was built from and the request options
+def compute_etag(*parts):
+    digest = hashlib.sha256(json.dumps(parts, default=decimal_to_num).encode('utf-8')).hexdigest()[:32]
+    return f'"{digest}"'
+
+def request_etags(event):
+    headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    # CloudFront may hand back the weak form after compressing the response
+    return {tag.strip().removeprefix('W/') for tag in headers.get('if-none-match', '').split(',') if tag.strip()}
+
+def parse_fields(query_params):
+    # ?fields=status,step_name keeps only those attributes of the DNS records (dns_record always stays)
+    fields = query_params.get('fields')
+    if not fields:
+        return None
+    return {'dns_record'} | {field.strip() for field in fields.split(',') if field.strip()}
+
+def project(items, fields):
+    if fields is None:
+        return items
+    return [{name: value for name, value in item.items() if name in fields} for item in items]
+
+def cache_control_for(summary):
+    if not summary:
+        return LIVE_CACHE_CONTROL
+    if 'archive' in summary:
+        return ARCHIVED_CACHE_CONTROL
+    if summary.get('completed', 0) + summary.get('failed', 0) >= summary.get('total', 0):
+        return FINISHED_CACHE_CONTROL
+    return LIVE_CACHE_CONTROL
+
+def respond(status_code, body=None, etag=None, cache_control=LIVE_CACHE_CONTROL):
+    headers = {'Cache-Control': cache_control}
+    if etag:
+        headers['ETag'] = etag
+    response = {'statusCode': status_code, 'headers': headers}
+    if body is not None:
+        response['body'] = json.dumps(body, default=decimal_to_num)
+    return response
+
 def lambda_handler(event, context):
     # Create a DynamoDB table object
     table = dynamodb.Table(TABLE_NAME)
@@ -28,55 +112,78 @@ def lambda_handler(event, context):
     # Extract the query string parameters, if present
     query_params = event.get('queryStringParameters') or {}
     migration_id = query_params.get('migration_id', None)
+    view = query_params.get('view', None)
+    fields = parse_fields(query_params)
+
+    # Change feed cursor taken before reading, so the page's /api/migration-changes polling
+    # picks up every write that lands after this snapshot
+    cursor = f"{int(time.time() * 1000):013d}"
 
     try:
         if migration_id:
-            # Query for specific migration_id if it's provided in the query string
-            dns_records_response = table.query(
-                KeyConditionExpression=Key('migration_id').eq(migration_id)
-            )
+            # The summary's version is bumped on every write to the migration: a matching
+            # If-None-Match is answered before anything else is read or serialized
+            summary = table.get_item(
+                Key={'migration_id': migration_id, 'dns_record': SUMMARY_RECORD}
+            ).get('Item')
+            etag = compute_etag(migration_id, summary.get('version', 0) if summary else None, view, sorted(fields or []))
+            cache_control = cache_control_for(summary)
+            if etag in request_etags(event):
+                return respond(304, etag=etag, cache_control=cache_control)
 
-            # Return the DNS records for the specific migration_id
+            if view == 'progress':
+                # Progress polling only needs the counters, a single GetItem whatever the zone size
+                return respond(200, {
+                    'message': 'Migration progress fetched successfully',
+                    'data': {'summary': summary}
+                }, etag, cache_control)
+
+            # Return the summary and DNS records for the specific migration_id
+            summary, dns_records = load_migration(table, migration_id)
             result = {
-                'dns_records': dns_records_response['Items']
-            }
-            
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'DNS records fetched successfully',
-                    'data': result
-                }, default=decimal_to_num)
+                'summary': summary,
+                'dns_records': project(dns_records, fields),
+                'cursor': cursor
             }
+
+            return respond(200, {
+                'message': 'DNS records fetched successfully',
+                'data': result
+            }, etag, cache_control)
         else:
-            # Scan all items from the DynamoDB table, filtering start_time > 0
-            response = table.scan(
-                ProjectionExpression='migration_id, zone_name, start_time',  # Retrieve only required attributes
-                FilterExpression=Attr('start_time').gt(0),  # Filter items where start_time > 0
-            )
-
-            # Extract the scanned data
-            data = response.get('Items', [])
-            print(data)
+            # Scan the summary items, one per migration. Archival keeps the table to recent
+            # migrations plus one row per archived one, so this stays a small scan.
+            data = []
+            scan_kwargs = {
+                'ProjectionExpression': 'migration_id, zone_name, start_time, version',  # Retrieve only required attributes
+                'FilterExpression': Attr('dns_record').eq(SUMMARY_RECORD),
+            }
+            while True:
+                response = table.scan(**scan_kwargs)
+                data.extend(response.get('Items', []))
+                if 'LastEvaluatedKey' not in response:
+                    break
+                scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
             
             # If no migration history is found, return a message indicating that no migration has occurred
             if not data:
-                return {
-                    'statusCode': 204,
-                }
+                return respond(204)
 
             # Sort the data manually by start_time in descending order
             sorted_data = sorted(data, key=lambda x: x['start_time'], reverse=True)
 
+            # New migrations and writes to any of them change the list, so it is never cached at the edge
+            etag = compute_etag([(item['migration_id'], item.get('version', 0)) for item in sorted_data], sorted(fields or []))
+            if etag in request_etags(event):
+                return respond(304, etag=etag)
+
             # Get the latest migration_id and zone_name
             latest_item = sorted_data[0]
             latest_migration_id = latest_item['migration_id']
             latest_zone_name = latest_item['zone_name']
 
             # Retrieve all dns_records for the latest migration_id
-            dns_records_response = table.query(
-                KeyConditionExpression=Key('migration_id').eq(latest_migration_id)
-            )
+            summary, dns_records = load_migration(table, latest_migration_id)
 
             # Retrieve the list of other migration_ids with their zone_names (excluding the latest one)
             other_migration_ids = [
@@ -89,39 +196,32 @@ def lambda_handler(event, context):
                     'migration_id': latest_migration_id,
                     'zone_name': latest_zone_name
                 },
-                'dns_records': dns_records_response['Items'],
-                'other_migration_ids': other_migration_ids
+                'summary': summary,
+                'dns_records': project(dns_records, fields),
+                'other_migration_ids': other_migration_ids,
+                'cursor': cursor
             }
 
             # Return a successful response
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'Migration history fetched successfully',
-                    'data': result
-                }, default=decimal_to_num)  # Use the custom converter for Decimal
-            }
+            return respond(200, {
+                'message': 'Migration history fetched successfully',
+                'data': result
+            }, etag)
     
     except ClientError as e:
         # Handle errors related to DynamoDB
         print(f'error: {str(e)}')
         
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'message': 'Error fetching migration history from DynamoDB',
-                'error': str(e)
-            })
-        }
+        return respond(500, {
+            'message': 'Error fetching migration history from DynamoDB',
+            'error': str(e)
+        }, cache_control='no-store')
     
     except Exception as e:
         # Handle any other general errors
         print(f'error: {str(e)}')
         
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'message': 'An unexpected error occurred',
-                'error': str(e)
-            })
-        }
+        return respond(500, {
+            'message': 'An unexpected error occurred',
+            'error': str(e)
+        }, cache_control='no-store')
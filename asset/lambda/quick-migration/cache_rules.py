@@ -0,0 +1,394 @@
+import hashlib
+import json
+import re
+import urllib.error
+import urllib.request
+from botocore.exceptions import ClientError
+
+# Translates a Cloudflare zone's cache configuration (zone settings, cache rules and page rules)
+# into a cache plan: path-pattern behaviors pointing at deduplicated CloudFront cache policies.
+# The plan is built once per migration, stored on the summary item and read by every record's
+# CreateCloudFrontDistribution step. Anything that cannot be expressed is listed under 'unmapped'.
+
+CLOUDFLARE_API = "https://api.cloudflare.com/client/v4"
+
+# Managed cache policies
+CACHING_DISABLED_POLICY_ID = '4135ea2d-6df8-44a3-9df3-4b5a84be39ad'
+ORIGIN_HEADERS_QUERY_STRINGS_POLICY_ID = '4cc15a8a-d715-48a4-82b8-cc0b614638fe'  # UseOriginCacheControlHeaders-QueryStrings
+ORIGIN_HEADERS_POLICY_ID = '83da9c7e-98b4-4e11-a168-04f0df8e2c65'  # UseOriginCacheControlHeaders
+
+# Cloudflare caches these by default for 120 minutes when the origin sends no Cache-Control
+DEFAULT_PATH_PATTERNS = [
+    '*.html', '*.css', '*.js', '*.json', '*.svg', '*.jpg', '*.jpeg',
+    '*.gif', '*.webp', '*.woff', '*.woff2', '*.mp4', '*.webm'
+]
+DEFAULT_EDGE_TTL = 7200
+MAX_TTL = 31536000
+
+# CloudFront default quota of cache behaviors per distribution
+MAX_CACHE_BEHAVIORS = 25
+
+CACHE_KEY_HEADERS = ['x-method-override', 'origin', 'host', 'x-http-method', 'x-http-method-override']
+
+CACHE_POLICY_PREFIX = 'cflare-'
+
+
+def cloudflare_get(api_token, path):
+    req = urllib.request.Request(
+        f"{CLOUDFLARE_API}{path}",
+        headers={
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json"
+        }
+    )
+    with urllib.request.urlopen(req) as response:
+        return json.loads(response.read().decode('utf-8'))['result']
+
+
+def fetch_cache_configuration(api_token, cloudflare_zone_id, unmapped):
+    # Each source is optional: a token without the matching read permission leaves it out of the plan
+    settings = {}
+    try:
+        settings = {s['id']: s['value'] for s in cloudflare_get(api_token, f"/zones/{cloudflare_zone_id}/settings")}
+    except Exception as e:
+        unmapped.append(f"Zone settings could not be read, Cloudflare defaults assumed: {e}")
+
+    cache_rules = []
+    try:
+        ruleset = cloudflare_get(api_token, f"/zones/{cloudflare_zone_id}/rulesets/phases/http_request_cache_settings/entrypoint")
+        cache_rules = [rule for rule in ruleset.get('rules', []) if rule.get('enabled', True)]
+    except urllib.error.HTTPError as e:
+        if e.code != 404:  # no cache rules configured
+            unmapped.append(f"Cache rules could not be read: {e}")
+    except Exception as e:
+        unmapped.append(f"Cache rules could not be read: {e}")
+
+    page_rules = []
+    try:
+        page_rules = cloudflare_get(api_token, f"/zones/{cloudflare_zone_id}/pagerules?status=active")
+    except Exception as e:
+        unmapped.append(f"Page rules could not be read: {e}")
+
+    return settings, cache_rules, page_rules
+
+
+def _split_top_level(expression, keyword):
+    # Split on ' or ' / ' and ' outside of parentheses, braces and quoted strings
+    parts, depth, quoted, start, i = [], 0, False, 0, 0
+    token = f' {keyword} '
+    while i < len(expression):
+        c = expression[i]
+        if c == '"':
+            quoted = not quoted
+        elif not quoted and c in '({':
+            depth += 1
+        elif not quoted and c in ')}':
+            depth -= 1
+        elif not quoted and depth == 0 and expression.startswith(token, i):
+            parts.append(expression[start:i])
+            i += len(token)
+            start = i
+            continue
+        i += 1
+    parts.append(expression[start:])
+    return [part.strip() for part in parts]
+
+
+def _strip_parens(term):
+    # Drop parentheses wrapping the whole term, but not the ones of '(a) or (b)'
+    while term.startswith('(') and term.endswith(')'):
+        depth = 0
+        for i, c in enumerate(term):
+            depth += c == '('
+            depth -= c == ')'
+            if depth == 0 and i < len(term) - 1:
+                return term
+        term = term[1:-1].strip()
+    return term
+
+
+def _string_set(value):
+    return re.findall(r'"((?:[^"\\]|\\.)*)"', value)
+
+
+CONDITION_PATTERNS = [
+    (re.compile(r'^http\.request\.uri\.path\.extension eq "([^"]*)"$'), lambda m: ('path', [f'*.{m.group(1)}'])),
+    (re.compile(r'^http\.request\.uri\.path\.extension in \{(.*)\}$'), lambda m: ('path', [f'*.{e}' for e in _string_set(m.group(1))])),
+    (re.compile(r'^http\.request\.uri\.path eq "([^"]*)"$'), lambda m: ('path', [m.group(1)])),
+    (re.compile(r'^http\.request\.uri\.path in \{(.*)\}$'), lambda m: ('path', _string_set(m.group(1)))),
+    (re.compile(r'^http\.request\.uri\.path wildcard "([^"]*)"$'), lambda m: ('path', [m.group(1)])),
+    (re.compile(r'^starts_with\(http\.request\.uri\.path, "([^"]*)"\)$'), lambda m: ('path', [f'{m.group(1)}*'])),
+    (re.compile(r'^ends_with\(http\.request\.uri\.path, "([^"]*)"\)$'), lambda m: ('path', [f'*{m.group(1)}'])),
+    (re.compile(r'^http\.host eq "([^"]*)"$'), lambda m: ('host', [m.group(1)])),
+    (re.compile(r'^http\.host in \{(.*)\}$'), lambda m: ('host', _string_set(m.group(1)))),
+    (re.compile(r'^true$'), lambda m: ('path', ['*'])),
+]
+
+
+def translate_expression(expression):
+    # Returns a list of (path patterns, hosts) pairs, hosts being None for every hostname,
+    # or raises ValueError for expressions CloudFront path patterns cannot express
+    matches = []
+    for disjunct in _split_top_level(_strip_parens(expression.strip()), 'or'):
+        paths, hosts = None, None
+        for conjunct in _split_top_level(_strip_parens(disjunct), 'and'):
+            conjunct = _strip_parens(conjunct)
+            for pattern, build in CONDITION_PATTERNS:
+                m = pattern.match(conjunct)
+                if m:
+                    kind, values = build(m)
+                    break
+            else:
+                raise ValueError(f'unsupported condition "{conjunct}"')
+
+            if kind == 'path':
+                if paths is not None:
+                    raise ValueError('more than one path condition')
+                paths = values
+            else:
+                if hosts is not None:
+                    raise ValueError('more than one host condition')
+                hosts = [host.lower() for host in values]
+        matches.append((paths or ['*'], hosts))
+    return matches
+
+
+def query_string_policy(cache_level):
+    # Cloudflare cache levels: Standard (aggressive) keys on the full query string,
+    # Ignore Query String (simplified) drops it
+    if cache_level == 'simplified':
+        return ('none', [])
+    return ('all', [])
+
+
+def policy_spec(min_ttl, default_ttl, max_ttl, query_strings):
+    return {
+        'min_ttl': int(min_ttl),
+        'default_ttl': int(default_ttl),
+        'max_ttl': int(max_ttl),
+        'query_string_behavior': query_strings[0],
+        'query_strings': sorted(query_strings[1])
+    }
+
+
+def _query_string_list(value):
+    # {"list": [...]} / {"all": true} / "*"
+    if value == '*' or (isinstance(value, dict) and value.get('all')):
+        return None
+    return value.get('list', []) if isinstance(value, dict) else list(value)
+
+
+def translate_cache_rule(rule, zone_query_strings, notes):
+    params = rule.get('action_parameters', {})
+    if rule.get('action') != 'set_cache_settings':
+        raise ValueError(f"unsupported action {rule.get('action')}")
+    if params.get('cache') is False:
+        return 'disabled'
+
+    query_strings = zone_query_strings
+    cache_key = params.get('cache_key', {})
+    custom_key = cache_key.get('custom_key', {})
+    query_string = custom_key.get('query_string')
+    if query_string:
+        if 'include' in query_string:
+            names = _query_string_list(query_string['include'])
+            query_strings = ('all', []) if names is None else ('whitelist', names)
+        elif 'exclude' in query_string:
+            names = _query_string_list(query_string['exclude'])
+            query_strings = ('none', []) if names is None else ('allExcept', names)
+    for key in ('header', 'cookie', 'user', 'host'):
+        if key in custom_key:
+            notes.append(f'custom cache key {key} settings are not carried over')
+
+    edge_ttl = params.get('edge_ttl', {})
+    mode = edge_ttl.get('mode', 'respect_origin')
+    if mode == 'override_origin':
+        # Equal min/default/max makes CloudFront ignore the origin's Cache-Control
+        ttl = edge_ttl.get('default', DEFAULT_EDGE_TTL)
+        spec = policy_spec(ttl, ttl, ttl, query_strings)
+    elif mode == 'bypass_by_default':
+        spec = policy_spec(0, 0, MAX_TTL, query_strings)
+    else:
+        spec = policy_spec(0, DEFAULT_EDGE_TTL, MAX_TTL, query_strings)
+    if edge_ttl.get('status_code_ttl'):
+        notes.append('per status code edge TTLs are not carried over')
+
+    if params.get('browser_ttl', {}).get('mode', 'respect_origin') != 'respect_origin':
+        notes.append('browser TTL overrides are not carried over')
+
+    if spec['max_ttl'] == 0:
+        return 'disabled'
+    return spec
+
+
+def translate_page_rule(rule, zone_query_strings, notes):
+    actions = {action['id']: action.get('value') for action in rule.get('actions', [])}
+    cache_level = actions.get('cache_level')
+    if cache_level is None and 'edge_cache_ttl' not in actions:
+        return None  # not cache related
+
+    if cache_level == 'bypass':
+        return 'disabled'
+
+    query_strings = query_string_policy(cache_level) if cache_level in ('simplified', 'aggressive') else zone_query_strings
+    if cache_level == 'basic':
+        notes.append('the No Query String cache level is cached with the full query string')
+
+    if 'edge_cache_ttl' in actions:
+        ttl = actions['edge_cache_ttl']
+        spec = policy_spec(ttl, ttl, ttl, query_strings)
+    elif cache_level == 'cache_everything':
+        spec = policy_spec(0, DEFAULT_EDGE_TTL, MAX_TTL, query_strings)
+    else:
+        spec = policy_spec(1, DEFAULT_EDGE_TTL, MAX_TTL, query_strings)
+
+    if 'browser_cache_ttl' in actions:
+        notes.append('browser cache TTL is not carried over')
+    return spec
+
+
+def page_rule_matches(rule):
+    # Page rule targets look like '*example.com/static/*'
+    target = rule['targets'][0]['constraint']['value']
+    target = re.sub(r'^https?://', '', target)
+    host, _, path = target.partition('/')
+    hosts = None if '*' in host else [host.lower()]
+    return [([f'/{path}' if path else '*'], hosts)]
+
+
+def policy_name(spec):
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+    return f"{CACHE_POLICY_PREFIX}{digest[:24]}"
+
+
+def find_cache_policy(cloudfront_client, name):
+    kwargs = {'Type': 'custom'}
+    while True:
+        response = cloudfront_client.list_cache_policies(**kwargs)['CachePolicyList']
+        for item in response.get('Items', []):
+            if item['CachePolicy']['CachePolicyConfig']['Name'] == name:
+                return item['CachePolicy']['Id']
+        if not response.get('NextMarker'):
+            return None
+        kwargs['Marker'] = response['NextMarker']
+
+
+def ensure_cache_policy(cloudfront_client, spec):
+    # Policies are named after their settings, so identical policies are shared across
+    # rules, zones and migrations instead of using up the account's cache policy quota
+    name = policy_name(spec)
+    policy_id = find_cache_policy(cloudfront_client, name)
+    if policy_id:
+        return policy_id
+
+    query_strings_config = {'QueryStringBehavior': spec['query_string_behavior']}
+    if spec['query_strings']:
+        query_strings_config['QueryStrings'] = {'Quantity': len(spec['query_strings']), 'Items': spec['query_strings']}
+    try:
+        response = cloudfront_client.create_cache_policy(
+            CachePolicyConfig={
+                'Name': name,
+                'Comment': 'Translated from Cloudflare cache settings',
+                'MinTTL': spec['min_ttl'],
+                'DefaultTTL': spec['default_ttl'],
+                'MaxTTL': spec['max_ttl'],
+                'ParametersInCacheKeyAndForwardedToOrigin': {
+                    'EnableAcceptEncodingGzip': True,
+                    'EnableAcceptEncodingBrotli': True,
+                    'HeadersConfig': {
+                        'HeaderBehavior': 'whitelist',
+                        'Headers': {'Quantity': len(CACHE_KEY_HEADERS), 'Items': CACHE_KEY_HEADERS}
+                    },
+                    'CookiesConfig': {'CookieBehavior': 'none'},
+                    'QueryStringsConfig': query_strings_config
+                }
+            }
+        )
+        return response['CachePolicy']['Id']
+    except ClientError as e:
+        # Created by a concurrent migration
+        if e.response['Error']['Code'] == 'CachePolicyAlreadyExists':
+            return find_cache_policy(cloudfront_client, name)
+        raise
+
+
+def fallback_cache_plan(error):
+    # No behaviors: every distribution gets the default behaviors of CreateCloudFrontDistribution
+    return {
+        'unmapped': [f"Cloudflare cache settings could not be translated ({error}), the default cache behaviors are used"]
+    }
+
+
+def build_cache_plan(api_token, cloudflare_zone_id, cloudfront_client):
+    unmapped = []
+    settings, cache_rules, page_rules = fetch_cache_configuration(api_token, cloudflare_zone_id, unmapped)
+
+    cache_level = settings.get('cache_level', 'aggressive')
+    zone_query_strings = query_string_policy(cache_level)
+    if cache_level == 'basic':
+        unmapped.append('Zone cache level "No Query String" is cached with the full query string')
+    if settings.get('browser_cache_ttl'):
+        unmapped.append(f"Zone browser cache TTL of {settings['browser_cache_ttl']}s is not carried over")
+
+    # (matches, spec or 'disabled', source) in first-match order. Later cache rules override
+    # earlier ones and cache rules override page rules, while CloudFront picks the first match.
+    translated = []
+    for rule in reversed(cache_rules):
+        source = f"Cache rule \"{rule.get('description') or rule.get('id')}\""
+        notes = []
+        try:
+            matches = translate_expression(rule.get('expression', ''))
+            action = translate_cache_rule(rule, zone_query_strings, notes)
+        except ValueError as e:
+            unmapped.append(f"{source}: {e}")
+            continue
+        unmapped.extend(f"{source}: {note}" for note in notes)
+        translated.append((matches, action, source))
+
+    for rule in sorted(page_rules, key=lambda r: r.get('priority', 0), reverse=True):
+        source = f"Page rule {rule['targets'][0]['constraint']['value']}"
+        notes = []
+        action = translate_page_rule(rule, zone_query_strings, notes)
+        if action is None:
+            continue
+        unmapped.extend(f"{source}: {note}" for note in notes)
+        translated.append((page_rule_matches(rule), action, source))
+
+    default_spec = policy_spec(1, DEFAULT_EDGE_TTL, MAX_TTL, zone_query_strings)
+    translated.append(([(DEFAULT_PATH_PATTERNS, None)], default_spec, 'Cloudflare default cached extensions'))
+
+    policy_ids = {}
+
+    def policy_id_for(action):
+        if action == 'disabled':
+            return CACHING_DISABLED_POLICY_ID
+        name = policy_name(action)
+        if name not in policy_ids:
+            policy_ids[name] = ensure_cache_policy(cloudfront_client, action)
+        return policy_ids[name]
+
+    behaviors = []
+    seen = set()
+    for matches, action, source in translated:
+        policy_id = policy_id_for(action)
+        for paths, hosts in matches:
+            for path in paths:
+                key = (path, tuple(hosts or ()))
+                if key in seen:
+                    continue
+                seen.add(key)
+                behavior = {'path_pattern': path, 'cache_policy_id': policy_id}
+                if hosts:
+                    behavior['hosts'] = hosts
+                behaviors.append(behavior)
+
+    global_patterns = {b['path_pattern'] for b in behaviors if 'hosts' not in b and b['path_pattern'] != '*'}
+    if len(global_patterns) > MAX_CACHE_BEHAVIORS:
+        unmapped.append(f"{len(global_patterns)} path patterns exceed the {MAX_CACHE_BEHAVIORS} cache behaviors of a distribution, the last ones are dropped")
+
+    return {
+        'default_cache_policy_id': ORIGIN_HEADERS_POLICY_ID if zone_query_strings[0] == 'none' else ORIGIN_HEADERS_QUERY_STRINGS_POLICY_ID,
+        'behaviors': behaviors,
+        'policy_count': len(policy_ids),
+        'unmapped': unmapped
+    }
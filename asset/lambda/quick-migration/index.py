@@ -6,6 +6,25 @@ import time
 import os
 import uuid
 from botocore.exceptions import ClientError
+from cache_rules import build_cache_plan, fallback_cache_plan
+from zone_graph import plan_migration
+
+# Sort key of the per-migration summary item holding the progress counters
+SUMMARY_RECORD = '#SUMMARY'
+
+# Prefix of the per-migration secrets holding the Cloudflare API token
+CLOUDFLARE_SECRET_PREFIX = 'cflare-auto-migration/'
+
+# Deleted secrets can still be restored for this long
+CLOUDFLARE_SECRET_RECOVERY_DAYS = 7
+
+# Cloudflare reports an automatic TTL as 1, which it serves as 300 seconds
+CLOUDFLARE_AUTO_TTL = 1
+AUTO_TTL_SECONDS = 300
+
+# Proxied hostnames are imported with this TTL, so resolvers already hold short-lived
+# answers when the workflow flips them to CloudFront
+CUTOVER_TTL = int(os.getenv('CUTOVER_TTL', '60'))
 
 def create_route53_hosted_zone(route53_client, zone_name):
     caller_reference = str(time.time())
@@ -23,18 +42,36 @@ def create_route53_hosted_zone(route53_client, zone_name):
         print(f"Error creating Route53 hosted zone: {e}")
         return None
 
+def route53_ttl(record):
+    ttl = AUTO_TTL_SECONDS if record['ttl'] == CLOUDFLARE_AUTO_TTL else record['ttl']
+    if record.get('proxied'):
+        return min(ttl, CUTOVER_TTL)
+    return ttl
+
 def import_dns_records_to_route53(route53_client, aws_zone_id, dns_records):
-    changes = [
-        {
-            'Action': 'CREATE',
-            'ResourceRecordSet': {
+    # Cloudflare keeps one record per value, Route53 one record set per name and type:
+    # round-robin records have to be merged or the change batch is rejected as a duplicate
+    record_sets = {}
+    for record in dns_records:
+        key = (record['name'], record['type'])
+        if key not in record_sets:
+            record_sets[key] = {
                 'Name': record['name'],
                 'Type': record['type'],
-                'TTL': record['ttl'],
-                'ResourceRecords': [{'Value': record['content']}]
+                'TTL': route53_ttl(record),
+                'ResourceRecords': []
             }
+        else:
+            # Route53 has a single TTL per record set, the shortest one wins
+            record_sets[key]['TTL'] = min(record_sets[key]['TTL'], route53_ttl(record))
+        record_sets[key]['ResourceRecords'].append({'Value': record['content']})
+
+    changes = [
+        {
+            'Action': 'CREATE',
+            'ResourceRecordSet': record_set
         }
-        for record in dns_records
+        for record_set in record_sets.values()
     ]
 
     if changes:
@@ -65,10 +102,32 @@ def fetch_cloudflare_dns_records(api_token, cloudflare_zone_id):
         print(f"Failed to fetch DNS records from Cloudflare: {e}")
     return None
 
-def start_step_function(step_functions_client, input_data, step_function_arn):
+def store_cloudflare_api_token(secrets_client, migration_id, api_token):
+    # The token is stored once per migration and executions only carry the secret id,
+    # which keeps it out of state payloads and execution history
+    try:
+        response = secrets_client.create_secret(
+            Name=f"{CLOUDFLARE_SECRET_PREFIX}{migration_id}",
+            Description='Cloudflare API token used by a Cloudflare to CloudFront migration',
+            SecretString=api_token
+        )
+        return response['ARN']
+    except ClientError as e:
+        print(f"Error storing Cloudflare API token in Secrets Manager: {e}")
+        return None
+
+def delete_cloudflare_api_token(secrets_client, secret_id):
+    # Nothing will read the token of a migration that did not start
+    try:
+        secrets_client.delete_secret(SecretId=secret_id, RecoveryWindowInDays=CLOUDFLARE_SECRET_RECOVERY_DAYS)
+    except ClientError as e:
+        print(f"Error deleting the Cloudflare API token from Secrets Manager: {e}")
+
+def start_step_function(step_functions_client, input_data, step_function_arn, execution_name):
     try:
         response = step_functions_client.start_execution(
             stateMachineArn=step_function_arn,
+            name=execution_name,
             input=json.dumps(input_data)
         )
         return response['executionArn']
@@ -76,7 +135,91 @@ def start_step_function(step_functions_client, input_data, step_function_arn):
         print(f"Error starting Step Function: {e}")
         return None
 
-def start_put_ddb_item(ddb_table, zone_name, migration_id, dns_record, execution_arn, start_time):
+def execution_arn_for(step_function_arn, execution_name):
+    # Executions are started with a known name so the record row can be written before the
+    # execution starts updating it
+    return f"{step_function_arn.replace(':stateMachine:', ':execution:')}:{execution_name}"
+
+def put_migration_summary(ddb_table, zone_name, migration_id, total, start_time, zone_ids, cache_plan):
+    try:
+        ddb_table.put_item(
+            Item={
+                'migration_id': migration_id,
+                'dns_record': SUMMARY_RECORD,
+                'zone_name': zone_name,
+                'start_time': start_time,
+                **zone_ids,
+                'cache_plan': cache_plan,
+                'total': total,
+                'started': 0,
+                'completed': 0,
+                'failed': 0
+            }
+        )
+        return True
+    except ClientError as e:
+        print(f"Error adding migration summary to DynamoDB: {e}")
+        return False
+
+def update_migration_summary_counters(ddb_table, migration_id, started, failed):
+    try:
+        ddb_table.update_item(
+            Key={
+                'migration_id': migration_id,
+                'dns_record': SUMMARY_RECORD
+            },
+            UpdateExpression="ADD started :started, failed :failed, version :one",
+            ExpressionAttributeValues={
+                ':started': started,
+                ':failed': failed,
+                ':one': 1
+            }
+        )
+    except ClientError as e:
+        print(f"Error updating migration summary in DynamoDB: {e}")
+
+def put_unplannable_ddb_item(ddb_table, zone_name, migration_id, dns_record, start_time, error_message):
+    # Hostnames whose origin cannot be resolved get a FAILED row and no execution
+    try:
+        ddb_table.put_item(
+            Item={
+                'migration_id': migration_id,
+                'zone_name': zone_name,
+                'dns_record': dns_record,
+                'status': 'FAILED',
+                'step_name': 'Plan Migration',
+                'time': start_time,
+                'start_time': start_time,
+                'execution_arn': '',
+                'error_message': error_message,
+                'resources': {}
+            }
+        )
+    except ClientError as e:
+        print(f"Error adding item to DynamoDB for {dns_record}: {e}")
+
+def fail_ddb_item(ddb_table, migration_id, dns_record, error_message):
+    try:
+        ddb_table.update_item(
+            Key={
+                'migration_id': migration_id,
+                'dns_record': dns_record
+            },
+            UpdateExpression="SET #status = :s, error_message = :e, #time = :t",
+            ExpressionAttributeNames={
+                '#status': 'status',
+                '#time': 'time'
+            },
+            ExpressionAttributeValues={
+                ':s': 'FAILED',
+                ':e': error_message,
+                ':t': int(time.time())
+            }
+        )
+    except ClientError as e:
+        print(f"Error updating item in DynamoDB for {dns_record}: {e}")
+
+def start_put_ddb_item(ddb_table, zone_name, migration_id, dns_record, execution_arn, start_time, origin_chain):
     try:
         ddb_table.put_item(
             Item={
@@ -87,7 +230,9 @@ def start_put_ddb_item(ddb_table, zone_name, migration_id, dns_record, execution
                 'time': start_time,
                 'start_time': start_time,
                 'execution_arn': execution_arn,
-                'error_message': ''
+                'error_message': '',
+                'origin_chain': origin_chain,  # names followed from the hostname to its origin
+                'resources': {}  # resource ledger filled in by the workflow steps
             }
         )
         print(f"Successfully added item to DynamoDB for {dns_record}")
@@ -99,6 +244,7 @@ def start_put_ddb_item(ddb_table, zone_name, migration_id, dns_record, execution
 def lambda_handler(event, context):
     state_machine_arn = os.environ.get('STEP_FUNCTION_ARN')
     ddb_table_name = os.environ.get('TABLE_NAME')
+    cloudflare_secret_id = None
     
     try:
         body = json.loads(event.get('body', '{}'))
@@ -114,6 +260,8 @@ def lambda_handler(event, context):
         session = boto3.Session()
         route53_client = session.client('route53')
         step_functions_client = session.client('stepfunctions')
+        secrets_client = session.client('secretsmanager')
+        cloudfront_client = session.client('cloudfront')
         dynamodb = session.resource('dynamodb')
         ddb_table = dynamodb.Table(ddb_table_name)
 
@@ -139,47 +287,84 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'Failed to import DNS records to Route 53.'})
             }
 
-        proxied_records = [record for record in dns_records if record.get('proxied')]
+        # CNAME chains inside the zone are resolved to their final origin, origins come before their dependents
+        proxied_hostnames, unplannable_hostnames = plan_migration(dns_records, zone_name)
         migration_id = str(uuid.uuid4())
+        start_time = int(time.time())
         execution_arns = []
+        failed_count = 0
+
+        cloudflare_secret_id = store_cloudflare_api_token(secrets_client, migration_id, api_token)
+        if not cloudflare_secret_id:
+            return {
+                'statusCode': 500,
+                'body': json.dumps({'error': 'Failed to store the Cloudflare API token.'})
+            }
+
+        # Kept on the summary item so a rollback can reach both zones without the original request
+        zone_ids = {
+            'route53_zone_id': aws_zone_id,
+            'cloudflare_zone_id': cloudflare_zone_id,
+            'cloudflare_secret_id': cloudflare_secret_id
+        }
+        # Translated once per migration; every record's distribution reads it from the summary item.
+        # The cache settings are not worth failing the migration for (e.g. the cache policy quota).
+        try:
+            cache_plan = build_cache_plan(api_token, cloudflare_zone_id, cloudfront_client)
+        except Exception as e:
+            print(f"Error translating Cloudflare cache settings: {e}")
+            cache_plan = fallback_cache_plan(e)
+        for note in cache_plan['unmapped']:
+            print(f"Unmapped cache setting: {note}")
 
-        first_iteration = True
-        for record in proxied_records:
+        if not put_migration_summary(ddb_table, zone_name, migration_id, len(proxied_hostnames) + len(unplannable_hostnames), start_time, zone_ids, cache_plan):
+            delete_cloudflare_api_token(secrets_client, cloudflare_secret_id)
+            return {
+                'statusCode': 500,
+                'body': json.dumps({'error': 'Failed to add migration summary to DynamoDB.'})
+            }
+
+        for hostname, error_message in unplannable_hostnames.items():
+            print(f"Not migrating {hostname}: {error_message}")
+            put_unplannable_ddb_item(ddb_table, zone_name, migration_id, hostname, start_time, error_message)
+            failed_count += 1
+
+        for index, group in enumerate(proxied_hostnames):
+            hostname = group["hostname"]
             input_data = {
-                "viewer_domain": record["name"],
+                "viewer_domain": hostname,
                 "migration_id": migration_id,
-                "origin_info": {
-                    "type": record["type"],
-                    "value": record["content"]
-                },
+                "origin_info": group["origin_info"],
                 "ZoneID": aws_zone_id,
                 "CloudflareZoneID": cloudflare_zone_id,
-                "CloudflareAPIKey": api_token
-            }
-            
-            execution_arn = start_step_function(step_functions_client, input_data, state_machine_arn)
-            if execution_arn:
-                if first_iteration:
-                    start_time = int(time.time())
-                    first_iteration = False
-                else:
-                    start_time = 0
-                
-                if start_put_ddb_item(ddb_table, zone_name, migration_id, record["name"], execution_arn, start_time):
-                    execution_arns.append(execution_arn)
-                else:
-                    print(f"Failed to add item to DynamoDB for {record['name']}")
-            #break
+                "CloudflareSecretId": cloudflare_secret_id
+            }
+
+            execution_name = f"{migration_id}-{index}"
+            execution_arn = execution_arn_for(state_machine_arn, execution_name)
+            if not start_put_ddb_item(ddb_table, zone_name, migration_id, hostname, execution_arn, start_time, group["chain"]):
+                print(f"Failed to add item to DynamoDB for {hostname}")
+                continue
+
+            if start_step_function(step_functions_client, input_data, state_machine_arn, execution_name):
+                execution_arns.append(execution_arn)
+            else:
+                fail_ddb_item(ddb_table, migration_id, hostname, 'Failed to start Step Function')
+                failed_count += 1
+
+        update_migration_summary_counters(ddb_table, migration_id, len(execution_arns), failed_count)
 
         if execution_arns:
             return {
                 'statusCode': 200,
                 'body': json.dumps({
                     'message': 'DNS records imported and Step Functions started successfully',
-                    'executionArns': execution_arns
+                    'executionArns': execution_arns,
+                    'unmappedCacheRules': cache_plan['unmapped']
                 })
             }
         else:
+            delete_cloudflare_api_token(secrets_client, cloudflare_secret_id)
             return {
                 'statusCode': 500,
                 'body': json.dumps({'error': 'Failed to start Step Functions or add items to DynamoDB.'})
@@ -187,6 +372,8 @@ def lambda_handler(event, context):
 
     except Exception as e:
         print(f"Unexpected error: {e}")
+        if cloudflare_secret_id and not execution_arns:
+            delete_cloudflare_api_token(secrets_client, cloudflare_secret_id)
         return {
             'statusCode': 500,
             'body': json.dumps({'error': str(e)})
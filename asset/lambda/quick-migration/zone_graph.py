@@ -0,0 +1,123 @@
+from collections import deque
+
+# In-memory graph of a zone's DNS records, built once per migration. Proxied CNAMEs that point
+# at other names of the zone are resolved to the origin at the end of the chain, so a new
+# distribution never fetches through a hostname that is still on Cloudflare or mid-migration.
+
+
+class UnresolvableOriginError(Exception):
+    pass
+
+
+def normalize_name(name):
+    return name.rstrip('.').lower()
+
+
+def build_zone_index(dns_records):
+    # name -> records of the name, every type
+    index = {}
+    for record in dns_records:
+        index.setdefault(normalize_name(record['name']), []).append(record)
+    return index
+
+
+def in_zone(name, zone_name):
+    zone_name = normalize_name(zone_name)
+    return name == zone_name or name.endswith('.' + zone_name)
+
+
+def resolve_origin(index, zone_name, hostname, resolved):
+    # Follows CNAMEs inside the zone until it reaches addresses or a name outside the zone.
+    # Returns (origin records, chain of names followed); results are memoized in `resolved`.
+    chain = []
+    name = hostname
+    while True:
+        if name in resolved:
+            records, rest = resolved[name]
+            result = (records, chain + rest)
+            break
+        if name in chain:
+            raise UnresolvableOriginError(f"CNAME cycle: {' -> '.join(chain + [name])}")
+        chain.append(name)
+
+        records = index.get(name, [])
+        addresses = [{'type': r['type'], 'value': r['content']} for r in records if r['type'] in ('A', 'AAAA')]
+        cnames = [normalize_name(r['content']) for r in records if r['type'] == 'CNAME']
+        if addresses:
+            result = (addresses, chain)
+            break
+        if not cnames:
+            raise UnresolvableOriginError(f"{name} has no A, AAAA or CNAME record (chain: {' -> '.join(chain)})")
+
+        target = cnames[0]
+        if not in_zone(target, zone_name):
+            result = ([{'type': 'CNAME', 'value': target}], chain)
+            break
+        name = target
+
+    # Every name on the way resolves to the same origin
+    for i, name in enumerate(result[1]):
+        resolved.setdefault(name, (result[0], result[1][i:]))
+    return result
+
+
+def topological_order(hostnames, dependencies):
+    # Kahn's algorithm: a hostname comes after the proxied hostnames its chain goes through,
+    # so origins are scheduled before their dependents. Ties keep the zone's record order.
+    dependents = {hostname: [] for hostname in hostnames}
+    remaining = {hostname: 0 for hostname in hostnames}
+    for hostname in hostnames:
+        for dependency in dependencies.get(hostname, []):
+            dependents[dependency].append(hostname)
+            remaining[hostname] += 1
+
+    queue = deque(hostname for hostname in hostnames if remaining[hostname] == 0)
+    order = []
+    while queue:
+        hostname = queue.popleft()
+        order.append(hostname)
+        for dependent in dependents[hostname]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                queue.append(dependent)
+    return order
+
+
+def plan_migration(dns_records, zone_name):
+    # Returns (groups in migration order, {hostname: error} for hostnames that cannot be migrated).
+    # One group per proxied hostname: several A/AAAA records for a name are round-robin origins
+    # of the same site and end up in a single multi-value origin record.
+    index = build_zone_index(dns_records)
+    hostnames = list(dict.fromkeys(normalize_name(r['name']) for r in dns_records if r.get('proxied')))
+    proxied = set(hostnames)
+
+    resolved = {}
+    origins = {}
+    dependencies = {}
+    failures = {}
+    for hostname in hostnames:
+        try:
+            records, chain = resolve_origin(index, zone_name, hostname, resolved)
+        except UnresolvableOriginError as e:
+            failures[hostname] = str(e)
+            continue
+        origins[hostname] = (records, chain)
+        dependencies[hostname] = [name for name in chain[1:] if name in proxied]
+
+    order = topological_order([hostname for hostname in hostnames if hostname in origins], dependencies)
+
+    groups = []
+    for hostname in order:
+        records, chain = origins[hostname]
+        is_ip = all(record['type'] in ('A', 'AAAA') for record in records)
+        groups.append({
+            'hostname': hostname,
+            'chain': chain,
+            'origin_info': {
+                # 'A' routes IP origins through Create Origin Record, whatever the address family
+                'type': 'A' if is_ip else records[0]['type'],
+                'value': records[0]['value'],
+                'records': records
+            }
+        })
+    return groups, failures
@@ -0,0 +1,47 @@
+import json
+import boto3
+import os
+import time
+from botocore.exceptions import ClientError
+
+def lambda_handler(event, context):
+    state_machine_arn = os.environ.get('STEP_FUNCTION_ARN')
+
+    try:
+        body = json.loads(event.get('body') or '{}')
+        migration_id = body.get('migrationId')
+
+        if not migration_id:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'migrationId is required'})
+            }
+
+        step_functions_client = boto3.client('stepfunctions')
+        response = step_functions_client.start_execution(
+            stateMachineArn=state_machine_arn,
+            name=f"rollback-{migration_id}-{int(time.time())}",
+            input=json.dumps({'migration_id': migration_id})
+        )
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': 'Rollback started successfully',
+                'executionArn': response['executionArn']
+            })
+        }
+
+    except ClientError as e:
+        print(f"Error starting rollback Step Function: {e}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
+
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
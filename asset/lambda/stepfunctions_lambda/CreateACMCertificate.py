@@ -1,38 +1,28 @@
 import boto3
-import os
-import time
+import hashlib
+from api_trace import traced
+from admission_control import acquire_token
+from migration_table import update_record_status
+from migration_errors import classify_error, RetryableError, TerminalError
 
+@traced
 def lambda_handler(event, context):
     acm_client = boto3.client('acm', region_name='us-east-1')
-    dynamodb = boto3.resource('dynamodb')
     
     viewer_domain = event['viewer_domain']
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
     migration_id = event['migration_id']
     
     try:
+        acquire_token('acm:RequestCertificate')
         response = acm_client.request_certificate(
             DomainName=viewer_domain,
-            ValidationMethod='DNS'
+            ValidationMethod='DNS',
+            # A retried task gets the certificate requested by the first attempt back
+            IdempotencyToken=hashlib.md5(f'{migration_id}{viewer_domain}'.encode('utf-8')).hexdigest()
         )
         
         # Update DynamoDB record
-        table.update_item(
-            Key={
-                'migration_id': migration_id,
-                'dns_record': viewer_domain
-            },
-            UpdateExpression="SET step_name = :n, #status = :s, #time = :t",
-            ExpressionAttributeNames={
-                '#status': 'status',
-                '#time': 'time'
-            },
-            ExpressionAttributeValues={
-                ':n': 'Create ACM Certificate',
-                ':s': 'SUCCEEDED',
-                ':t': int(time.time())
-            }
-        )
+        update_record_status(migration_id, viewer_domain, 'Create ACM Certificate', 'SUCCEEDED', resources={'certificate_arn': response['CertificateArn']})
         
         return {
             'status': 'success',
@@ -42,29 +32,19 @@ def lambda_handler(event, context):
         }
         
     except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            # Leave the record untouched; Step Functions retries the task with backoff
+            print(f"Retryable error, the task will be retried: {str(e)}")
+            raise error from e
+
         print(f"An unexpected error occurred: {str(e)}")
         error_message = str(e)
         
         # Update DynamoDB record with error state
         try:
-            table.update_item(
-                Key={
-                    'migration_id': migration_id,
-                    'dns_record': viewer_domain
-                },
-                UpdateExpression="SET step_name = :n, #status = :s, error_message = :e, #time = :t",
-                ExpressionAttributeNames={
-                    '#status': 'status',
-                    '#time': 'time'
-                },
-                ExpressionAttributeValues={
-                    ':n': 'Create ACM Certificate',
-                    ':s': 'FAILED',
-                    ':e': str(e),
-                    ':t': int(time.time())
-                }
-            )
+            update_record_status(migration_id, viewer_domain, 'Create ACM Certificate', 'FAILED', str(e))
         except Exception as ddb_error:
             error_message += f" Additionally, failed to update DynamoDB: {str(ddb_error)}"
         
-        raise Exception(f'Error occurred: {error_message}')        
+        raise TerminalError(f'Error occurred: {error_message}')        
@@ -1,7 +1,12 @@
-import json
 import boto3
-import time
 import os
+from botocore.exceptions import ClientError
+from api_trace import traced
+from admission_control import acquire_token
+from migration_table import SUMMARY_RECORD, update_record_status
+from migration_errors import classify_error, RetryableError, TerminalError
+from distribution_pool import pool_enabled, claim_distribution, apply_distribution_config
+from origin_geo import origin_addresses, select_origin_placement, DEFAULT_PRICE_CLASS
 
 def create_cache_behavior(origin_domain, cache_policy_id, origin_request_policy_id):
     return {
@@ -19,59 +24,106 @@ def create_cache_behavior(origin_domain, cache_policy_id, origin_request_policy_
         'OriginRequestPolicyId': origin_request_policy_id
     }
 
-def lambda_handler(event, context):
-    cloudfront_client = boto3.client('cloudfront')
-    dynamodb = boto3.resource('dynamodb')
-    
-    cert_arn = event['CertificateArn']
-    domain_name = event['DomainName']
-    origin_domain = event['OriginDomain']
-    web_acl_arn = event['webAclArn']
-    cache_policy_id = os.environ['CACHE_POLICY_ID'] # custom Cache Policy for the cloudflare default TTL
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
-    migration_id = event['migration_id']
-    
+# Cloudflare default cached extensions, used when the migration has no cache plan
+DEFAULT_PATH_PATTERNS = [
+    '*.html', '*.css', '*.js', '*.json', '*.svg', '*.jpg', '*.jpeg',
+    '*.gif', '*.webp', '*.woff', '*.woff2', '*.mp4', '*.webm'
+]
+
+# AllViewer managed policy
+ORIGIN_REQUEST_POLICY_ID = '216adef6-5c7f-47e4-b989-5492eafa07d3'
+
+# UseOriginCacheControlHeaders-QueryStrings managed policy
+MANAGED_DEFAULT_CACHE_POLICY_ID = '4cc15a8a-d715-48a4-82b8-cc0b614638fe'
+
+# CloudFront default quota of cache behaviors per distribution
+MAX_CACHE_BEHAVIORS = 25
+
+# The cache plan of a migration never changes once written, so warm invocations
+# for the other records of the zone reuse it
+cache_plans = {}
+
+def get_cache_plan(migration_id):
+    if migration_id not in cache_plans:
+        table = boto3.resource('dynamodb').Table(os.environ['TABLE_NAME'])
+        item = table.get_item(
+            Key={'migration_id': migration_id, 'dns_record': SUMMARY_RECORD},
+            ProjectionExpression='cache_plan'
+        ).get('Item', {})
+        cache_plans[migration_id] = item.get('cache_plan')
+    return cache_plans[migration_id]
+
+def select_cache_behaviors(cache_plan, domain_name):
+    # Behaviors scoped to other hostnames are left out; the first behavior for a path pattern wins
+    default_cache_policy_id = cache_plan['default_cache_policy_id']
+    behaviors = []
+    seen = set()
+    for behavior in cache_plan['behaviors']:
+        if 'hosts' in behavior and domain_name.lower() not in behavior['hosts']:
+            continue
+        if behavior['path_pattern'] in seen:
+            continue
+        seen.add(behavior['path_pattern'])
+        if behavior['path_pattern'] == '*':
+            default_cache_policy_id = behavior['cache_policy_id']
+            continue
+        behaviors.append((behavior['path_pattern'], behavior['cache_policy_id']))
+
+    if len(behaviors) > MAX_CACHE_BEHAVIORS:
+        print(f"Dropping cache behaviors beyond the first {MAX_CACHE_BEHAVIORS}: {[pattern for pattern, _ in behaviors[MAX_CACHE_BEHAVIORS:]]}")
+    return default_cache_policy_id, behaviors[:MAX_CACHE_BEHAVIORS]
+
+def build_distribution_config(caller_reference, origin_domain, default_cache_policy_id, path_policies, domain_name=None, cert_arn=None, web_acl_arn='',
+                              origin_shield_region=None, price_class=DEFAULT_PRICE_CLASS):
     # default cache behavior
-    default_cache_policy_id = '4cc15a8a-d715-48a4-82b8-cc0b614638fe'  # UseOriginCacheControlHeaders-QueryStrings managed policy
-    origin_request_policy_id = '216adef6-5c7f-47e4-b989-5492eafa07d3'  # AllViewer managed policy
-    default_cache_behavior = create_cache_behavior(origin_domain, default_cache_policy_id, origin_request_policy_id)
-    
+    default_cache_behavior = create_cache_behavior(origin_domain, default_cache_policy_id, ORIGIN_REQUEST_POLICY_ID)
+
     # additional cache behaviors
-    cache_behavior_path_patterns = [
-        '*.html', '*.css', '*.js', '*.json', '*.svg', '*.jpg', '*.jpeg',
-        '*.gif', '*.webp', '*.woff', '*.woff2', '*.mp4', '*.webm'
-    ]
     cache_behaviors = []
-    for pattern in cache_behavior_path_patterns:
-        behavior = create_cache_behavior(origin_domain, cache_policy_id, origin_request_policy_id)
+    for pattern, cache_policy_id in path_policies:
+        behavior = create_cache_behavior(origin_domain, cache_policy_id, ORIGIN_REQUEST_POLICY_ID)
         behavior['PathPattern'] = pattern
         cache_behaviors.append(behavior)
-    
-    
-    distribution_config = {
-        'CallerReference': str(time.time()),
+
+    if cert_arn:
+        viewer_certificate = {
+            'ACMCertificateArn': cert_arn,
+            'SSLSupportMethod': 'sni-only',
+            'MinimumProtocolVersion': 'TLSv1.2_2018'
+        }
+    else:
+        # Pooled distributions have no alias yet
+        viewer_certificate = {'CloudFrontDefaultCertificate': True}
+
+    origin = {
+        'Id': origin_domain,
+        'DomainName': origin_domain,
+        'CustomOriginConfig': {
+            'HTTPPort': 80,
+            'HTTPSPort': 443,
+            'OriginProtocolPolicy': 'match-viewer',
+            'OriginSslProtocols': {
+                'Quantity': 1,
+                'Items': ['TLSv1.2']
+            }
+        }
+    }
+    if origin_shield_region:
+        origin['OriginShield'] = {
+            'Enabled': True,
+            'OriginShieldRegion': origin_shield_region
+        }
+
+    return {
+        'CallerReference': caller_reference,
         'Aliases': {
-            'Quantity': 1,
-            'Items': [domain_name]
+            'Quantity': 1 if domain_name else 0,
+            'Items': [domain_name] if domain_name else []
         },
         'DefaultRootObject': '',
         'Origins': {
             'Quantity': 1,
-            'Items': [
-                {
-                    'Id': origin_domain,
-                    'DomainName': origin_domain,
-                    'CustomOriginConfig': {
-                        'HTTPPort': 80,
-                        'HTTPSPort': 443,
-                        'OriginProtocolPolicy': 'match-viewer',
-                        'OriginSslProtocols': {
-                            'Quantity': 1,
-                            'Items': ['TLSv1.2']
-                        }
-                    }
-                }
-            ]
+            'Items': [origin]
         },
         'DefaultCacheBehavior': default_cache_behavior,
         'CacheBehaviors': {
@@ -80,69 +132,116 @@ def lambda_handler(event, context):
         },
         'Comment': 'CloudFront distribution created by Step Functions',
         'Enabled': True,
-        'ViewerCertificate': {
-            'ACMCertificateArn': cert_arn,
-            'SSLSupportMethod': 'sni-only',
-            'MinimumProtocolVersion': 'TLSv1.2_2018'
-        },
-        'PriceClass': 'PriceClass_100',
+        'ViewerCertificate': viewer_certificate,
+        'PriceClass': price_class,
         'WebACLId': web_acl_arn
     }
+
+def find_distribution_by_alias(cloudfront_client, domain_name):
+    # An alternate domain name belongs to at most one distribution
+    paginator = cloudfront_client.get_paginator('list_distributions')
+    for page in paginator.paginate():
+        for summary in page['DistributionList'].get('Items', []):
+            if domain_name in summary['Aliases'].get('Items', []):
+                return summary
+    return None
+
+def create_distribution(cloudfront_client, distribution_config, domain_name):
+    try:
+        return cloudfront_client.create_distribution(DistributionConfig=distribution_config)['Distribution']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'DistributionAlreadyExists':
+            raise
+        # The CallerReference was used by an earlier attempt whose distribution never reached the ledger
+        existing = find_distribution_by_alias(cloudfront_client, domain_name)
+        if not existing:
+            raise
+        print(f"Distribution {existing['Id']} was created by an earlier attempt")
+        return existing
+
+def default_path_policies():
+    cache_policy_id = os.environ['CACHE_POLICY_ID'] # custom Cache Policy for the cloudflare default TTL
+    return [(pattern, cache_policy_id) for pattern in DEFAULT_PATH_PATTERNS]
+
+@traced
+def lambda_handler(event, context):
+    cloudfront_client = boto3.client('cloudfront')
     
+    cert_arn = event['CertificateArn']
+    domain_name = event['DomainName']
+    origin_domain = event['OriginDomain']
+    web_acl_arn = event['webAclArn']
+    migration_id = event['migration_id']
+
     try:
-        response = cloudfront_client.create_distribution(
-            DistributionConfig=distribution_config
+        cache_plan = get_cache_plan(migration_id)
+    except Exception as e:
+        print(f"Error reading the cache plan: {str(e)}")
+        raise classify_error(e) from e
+
+    if cache_plan and 'behaviors' in cache_plan:
+        # Behaviors and policies translated from the zone's Cloudflare cache settings by quick-migration
+        default_cache_policy_id, path_policies = select_cache_behaviors(cache_plan, domain_name)
+    else:
+        # Migrations without a plan, or whose cache settings could not be translated
+        default_cache_policy_id = MANAGED_DEFAULT_CACHE_POLICY_ID
+        path_policies = default_path_policies()
+
+    distribution_id = None
+    try:
+        # Origin Shield in the region nearest to the origin, and edge locations where its viewers are
+        origin_shield_region, price_class = None, DEFAULT_PRICE_CLASS
+        if event.get('origin_info'):
+            origin_shield_region, price_class = select_origin_placement(origin_addresses(event['origin_info']))
+            print(f"Origin Shield region: {origin_shield_region}, price class: {price_class}")
+
+        distribution_config = build_distribution_config(
+            f'{migration_id}-{domain_name}',  # a retried task gets DistributionAlreadyExists and looks the distribution up
+            origin_domain, default_cache_policy_id, path_policies,
+            domain_name=domain_name, cert_arn=cert_arn, web_acl_arn=web_acl_arn,
+            origin_shield_region=origin_shield_region, price_class=price_class
         )
-        
+
+        # A pooled distribution is already Deployed, updating it is faster than creating one
+        if pool_enabled():
+            distribution_id = claim_distribution(migration_id, domain_name)
+        if distribution_id:
+            # GetDistributionConfig and UpdateDistribution
+            acquire_token('cloudfront:UpdateDistribution', cost=2)
+            distribution = apply_distribution_config(cloudfront_client, distribution_id, distribution_config)
+            source = 'pool'
+        else:
+            acquire_token('cloudfront:CreateDistribution')
+            distribution = create_distribution(cloudfront_client, distribution_config, domain_name)
+            source = 'created'
+
         # Update DynamoDB record
-        table.update_item(
-            Key={
-                'migration_id': migration_id,
-                'dns_record': domain_name
-            },
-            UpdateExpression="SET step_name = :n, #status = :s, #time = :t",
-            ExpressionAttributeNames={
-                '#status': 'status',
-                '#time': 'time'
-            },
-            ExpressionAttributeValues={
-                ':n': 'Create CloudFront Distribution',
-                ':s': 'SUCCEEDED',
-                ':t': int(time.time())
-            }
-        )
-        
+        update_record_status(migration_id, domain_name, 'Create CloudFront Distribution', 'SUCCEEDED', resources={'distribution_id': distribution['Id']})
+
         return {
             'status': 'success',
-            'message': 'CloudFront distribution successfully created',
-            'DistributionId': response['Distribution']['Id'],
-            'DistributionCname': response['Distribution']['DomainName']
+            'message': f'CloudFront distribution successfully {"claimed from the pool" if source == "pool" else "created"}',
+            'DistributionId': distribution['Id'],
+            'DistributionCname': distribution['DomainName'],
+            'DistributionSource': source
         }
-        
+
     except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            # Leave the record untouched; Step Functions retries the task with backoff
+            print(f"Retryable error, the task will be retried: {str(e)}")
+            raise error from e
+
         print(f"An unexpected error occurred: {str(e)}")
         error_message = str(e)
         
         # Update DynamoDB record with error state
         try:
-            table.update_item(
-                Key={
-                    'migration_id': migration_id,
-                    'dns_record': domain_name
-                },
-                UpdateExpression="SET step_name = :n, #status = :s, error_message = :e, #time = :t",
-                ExpressionAttributeNames={
-                    '#status': 'status',
-                    '#time': 'time'
-                },
-                ExpressionAttributeValues={
-                    ':n': 'Create CloudFront Distribution',
-                    ':s': 'FAILED',
-                    ':e': str(e),
-                    ':t': int(time.time())
-                }
-            )
+            # A claimed distribution belongs to the record from here on, so a rollback deletes it
+            resources = {'distribution_id': distribution_id} if distribution_id else None
+            update_record_status(migration_id, domain_name, 'Create CloudFront Distribution', 'FAILED', str(e), resources=resources)
         except Exception as ddb_error:
             error_message += f" Additionally, failed to update DynamoDB: {str(ddb_error)}"
         
-        raise Exception(f'Error occurred: {error_message}')   
+        raise TerminalError(f'Error occurred: {error_message}')   
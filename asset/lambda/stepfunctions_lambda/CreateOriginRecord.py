@@ -1,133 +1,101 @@
-import json
 import boto3
-import random
-import string
-import urllib.request
-import urllib.parse
-import os
-import time
+import hashlib
+from api_trace import traced
+from admission_control import acquire_tokens, cloudflare_bucket
+from cloudflare_credentials import get_cloudflare_api_token
+from cloudflare_dns import find_or_create_record, CALLS_PER_RECORD
+from migration_table import update_record_status
+from migration_errors import classify_error, RetryableError, TerminalError
 
-def generate_random_string(length=8):
-    characters = string.ascii_lowercase + string.digits
-    return ''.join(random.choice(characters) for i in range(length))
+def origin_label(migration_id, domain_name):
+    # Hard to guess without the migration id, and the same for every attempt of the task
+    return hashlib.sha256(f'{migration_id}#{domain_name}'.encode('utf-8')).hexdigest()[:16]
 
+@traced
 def lambda_handler(event, context):
     route53_client = boto3.client('route53')
-    dynamodb = boto3.resource('dynamodb')
     
     # Input parameters from the event
     origin_info = event['origin_info']
     domain_name = event['DomainName']
-    ip_address = origin_info['value'] # IP Address
+    # All A/AAAA records of the hostname (round-robin origins); older inputs carry a single value
+    origin_records = origin_info.get('records') or [{'type': origin_info['type'], 'value': origin_info['value']}]
     route53zoneID = event['ZoneID']
-    cloudflare_api_key = event['CloudflareAPIKey']
+    cloudflare_secret_id = event['CloudflareSecretId']
     cloudflare_zone_id = event['CloudflareZoneID']
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
     migration_id = event['migration_id']
     
-    # Secure origin domain name with a random string
-    random_string = generate_random_string()
-    origin_domain = f"{random_string}.origin.{domain_name}"
+    # Secure origin domain name with a label derived from the migration
+    origin_domain = f"{origin_label(migration_id, domain_name)}.origin.{domain_name}"
+    created_resources = {}  # resource ledger for rollback, written with the status update
 
     try:
-        # 1. create Origindomain record in Route53
+        cloudflare_api_key = get_cloudflare_api_token(cloudflare_secret_id)
+
+        # Every call must be admitted before any is made, so a retry never repeats half the work.
+        # Cloudflare tokens are taken per record, a round-robin origin may need more than a burst.
+        acquire_tokens(
+            [('route53:ChangeResourceRecordSets', None, 1)]
+            + [('cloudflare', cloudflare_bucket(cloudflare_api_key), CALLS_PER_RECORD) for _ in origin_records]
+        )
+
+        # 1. create Origindomain records in Route53, one multi-value record set per address family.
+        # CloudFront resolves the origin domain and spreads connections over the returned addresses.
+        route53_records = []
+        for record_type in ('A', 'AAAA'):
+            values = [record['value'] for record in origin_records if record['type'] == record_type]
+            if values:
+                route53_records.append({
+                    'Name': origin_domain,
+                    'Type': record_type,
+                    'TTL': 300,
+                    'ResourceRecords': [{'Value': value} for value in values]
+                })
         response = route53_client.change_resource_record_sets(
             HostedZoneId=route53zoneID,
             ChangeBatch={
                 'Changes': [
                     {
                         'Action': 'UPSERT',
-                        'ResourceRecordSet': {
-                            'Name': origin_domain,
-                            'Type': 'A',
-                            'TTL': 300,
-                            'ResourceRecords': [{'Value': ip_address}]
-                        }
+                        'ResourceRecordSet': route53_record
                     }
+                    for route53_record in route53_records
                 ]
             }
         )
+        created_resources['origin_route53_records'] = route53_records
         
-        # 2. create Origindomain record in Cloudflare
-        # Create the DNS record data payload
-        dns_record_data = {
-            "type": 'A',
-            "name": origin_domain,
-            "content": ip_address,
-            "ttl": 300
-        }
-
-        # Cloudflare API URL to create a DNS record
-        cloudflare_api_url = f"https://api.cloudflare.com/client/v4/zones/{cloudflare_zone_id}/dns_records"
-
-        # Convert the data to JSON format
-        json_data = json.dumps(dns_record_data).encode('utf-8')
+        # 2. create Origindomain records in Cloudflare, which keeps one record per value.
+        # A retried task finds the records created by the first attempt.
+        cloudflare_record_ids = []
+        for record in origin_records:
+            cloudflare_record_ids.append(find_or_create_record(
+                cloudflare_api_key, cloudflare_zone_id, record['type'], origin_domain, record['value']
+            ))
+            created_resources['origin_cloudflare_record_ids'] = cloudflare_record_ids
 
-        # Cloudflare API headers
-        headers = {
-            "Authorization": f"Bearer {cloudflare_api_key}",
-            "Content-Type": "application/json"
+        # Update DynamoDB with success status
+        update_record_status(migration_id, domain_name, 'Create Origin Record', 'SUCCEEDED', resources=created_resources)
+        return {
+            'status': 'success',
+            'message': 'Origindomain records created successfully in Cloudflare',
+            'OriginDomain': origin_domain
         }
-    
-        # Send a request to Cloudflare API to create the DNS record
-        req = urllib.request.Request(cloudflare_api_url, data=json_data, headers=headers)
-        
-        # Send the request and get the response
-        with urllib.request.urlopen(req) as response:
-            status_code = response.getcode()
-            response_data = response.read().decode('utf-8')
-            response_json = json.loads(response_data)
-
-            if status_code == 200:
-                # Update DynamoDB with success status
-                table.update_item(
-                    Key={
-                        'migration_id': migration_id,
-                        'dns_record': domain_name
-                    },
-                    UpdateExpression="SET step_name = :n, #status = :s, #time = :t",
-                    ExpressionAttributeNames={
-                        '#status': 'status',
-                        '#time': 'time'
-                    },
-                    ExpressionAttributeValues={
-                        ':n': 'Create Origin Record',
-                        ':s': 'SUCCEEDED',
-                        ':t': int(time.time())
-                    }
-                )
-                return {
-                    'status': 'success',
-                    'message': 'Origindomain record created successfully in Cloudflare',
-                    'OriginDomain': origin_domain
-                }
-            else:
-                raise Exception(f'Failed to create Origindomain record in Cloudflare, Status code: {status_code}')
 
     except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            # Leave the record untouched; Step Functions retries the task with backoff
+            print(f"Retryable error, the task will be retried: {str(e)}")
+            raise error from e
+
         print(f"An unexpected error occurred: {str(e)}")
         error_message = str(e)
         
         # Update DynamoDB record with error state
         try:
-            table.update_item(
-                Key={
-                    'migration_id': migration_id,
-                    'dns_record': domain_name
-                },
-                UpdateExpression="SET step_name = :n, #status = :s, error_message = :e, #time = :t",
-                ExpressionAttributeNames={
-                    '#status': 'status',
-                    '#time': 'time'
-                },
-                ExpressionAttributeValues={
-                    ':n': 'Create Origin Record',
-                    ':s': 'FAILED',
-                    ':e': str(e),
-                    ':t': int(time.time())
-                }
-            )
+            update_record_status(migration_id, domain_name, 'Create Origin Record', 'FAILED', str(e), resources=created_resources)
         except Exception as ddb_error:
             error_message += f" Additionally, failed to update DynamoDB: {str(ddb_error)}"
         
-        raise Exception(f'Error occurred: {error_message}')   
\ No newline at end of file
+        raise TerminalError(f'Error occurred: {error_message}')   
\ No newline at end of file
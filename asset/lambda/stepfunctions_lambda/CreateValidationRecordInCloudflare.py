@@ -1,126 +1,84 @@
-import json
-import urllib.request
-import urllib.parse
 import boto3
-import os
-import time
+from api_trace import traced
+from admission_control import acquire_tokens, cloudflare_bucket
+from cloudflare_credentials import get_cloudflare_api_token
+from cloudflare_dns import find_or_create_record, CALLS_PER_RECORD
+from migration_table import update_record_status
+from migration_errors import classify_error, RetryableError, TerminalError
 
+@traced
 def lambda_handler(event, context):
     route53_client = boto3.client('route53')
     acm_client = boto3.client('acm', region_name='us-east-1')
-    dynamodb = boto3.resource('dynamodb')
     
     # Input parameters from the event
     cert_arn = event['CertificateArn']
     route53zoneID = event['ZoneID']
-    cloudflare_api_key = event['CloudflareAPIKey']
+    cloudflare_secret_id = event['CloudflareSecretId']
     cloudflare_zone_id = event['CloudflareZoneID']
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
     migration_id = event['migration_id']
     domain_name = ""
+    created_resources = {}  # resource ledger for rollback, written with the status update
     
     try:
         cert_details = acm_client.describe_certificate(CertificateArn=cert_arn)
         validation_record = cert_details['Certificate']['DomainValidationOptions'][0]['ResourceRecord']
         domain_name = cert_details['Certificate']['DomainName']
+        cloudflare_api_key = get_cloudflare_api_token(cloudflare_secret_id)
         
+        # Both calls must be admitted before either is made, so a retry never repeats half the work
+        acquire_tokens([
+            ('route53:ChangeResourceRecordSets', None, 1),
+            ('cloudflare', cloudflare_bucket(cloudflare_api_key), CALLS_PER_RECORD)
+        ])
+
         # Route53
+        route53_record = {
+            'Name': validation_record['Name'],
+            'Type': validation_record['Type'],
+            'TTL': 300,
+            'ResourceRecords': [{'Value': validation_record['Value']}]
+        }
         response = route53_client.change_resource_record_sets(
             HostedZoneId = route53zoneID,
             ChangeBatch={
                 'Changes': [
                     {
                         'Action': 'UPSERT',
-                        'ResourceRecordSet': {
-                            'Name': validation_record['Name'],
-                            'Type': validation_record['Type'],
-                            'TTL': 300,
-                            'ResourceRecords': [{'Value': validation_record['Value']}]
-                        }
+                        'ResourceRecordSet': route53_record
                     }
                 ]
             }
         )
+        created_resources['validation_route53_record'] = route53_record
         
-        # Cloudflare API URL to create a DNS record
-        cloudflare_api_url = f"https://api.cloudflare.com/client/v4/zones/{cloudflare_zone_id}/dns_records"
+        # A retried task finds the record created by the first attempt
+        created_resources['validation_cloudflare_record_id'] = find_or_create_record(
+            cloudflare_api_key, cloudflare_zone_id, validation_record['Type'], validation_record['Name'], validation_record['Value']
+        )
 
-        # Create the DNS record data payload
-        dns_record_data = {
-            "type": validation_record['Type'],
-            "name": validation_record['Name'],
-            "content": validation_record['Value'],
-            "ttl": 300
+        # Update DynamoDB with success status
+        update_record_status(migration_id, domain_name, 'Create Validation Record in Cloudflare', 'SUCCEEDED', resources=created_resources)
+        return {
+            'status': 'success',
+            'message': 'ACM certificate Validation record created successfully in Cloudflare'
         }
-        
-        # Convert the data to JSON format
-        json_data = json.dumps(dns_record_data).encode('utf-8')
-
-        # Cloudflare API headers
-        headers = {
-            "Authorization": f"Bearer {cloudflare_api_key}",
-            "Content-Type": "application/json"
-        }
-    
-        # Send a request to Cloudflare API to create the DNS record
-        req = urllib.request.Request(cloudflare_api_url, data=json_data, headers=headers)
-        
-        # Send the request and get the response
-        with urllib.request.urlopen(req) as response:
-            status_code = response.getcode()
-            response_data = response.read().decode('utf-8')
-            response_json = json.loads(response_data)
-
-            if status_code == 200:
-                # Update DynamoDB with success status
-                table.update_item(
-                    Key={
-                        'migration_id': migration_id,
-                        'dns_record': domain_name
-                    },
-                    UpdateExpression="SET step_name = :n, #status = :s, #time = :t",
-                    ExpressionAttributeNames={
-                        '#status': 'status',
-                        '#time': 'time'
-                    },
-                    ExpressionAttributeValues={
-                        ':n': 'Create Validation Record in Cloudflare',
-                        ':s': 'SUCCEEDED',
-                        ':t': int(time.time())
-                    }
-                )
-                return {
-                    'status': 'success',
-                    'message': 'ACM certificate Validation record created successfully in Cloudflare'
-                }
-            else:
-                raise Exception(f'Failed to create ACM certificate validation record in Cloudflare, Status code: {status_code}')
 
     except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            # Leave the record untouched; Step Functions retries the task with backoff
+            print(f"Retryable error, the task will be retried: {str(e)}")
+            raise error from e
+
         print(f"An unexpected error occurred: {str(e)}")
         error_message = str(e)
         
         # Update DynamoDB record with error state
         try:
-            table.update_item(
-                Key={
-                    'migration_id': migration_id,
-                    'dns_record': domain_name
-                },
-                UpdateExpression="SET step_name = :n, #status = :s, error_message = :e, #time = :t",
-                ExpressionAttributeNames={
-                    '#status': 'status',
-                    '#time': 'time'
-                },
-                ExpressionAttributeValues={
-                    ':n': 'Create Validation Record in Cloudflare',
-                    ':s': 'FAILED',
-                    ':e': str(e),
-                    ':t': int(time.time())
-                }
-            )
+            update_record_status(migration_id, domain_name, 'Create Validation Record in Cloudflare', 'FAILED', str(e), resources=created_resources)
         except Exception as ddb_error:
             error_message += f" Additionally, failed to update DynamoDB: {str(ddb_error)}"
         
-        raise Exception(f'Error occurred: {error_message}')
+        raise TerminalError(f'Error occurred: {error_message}')
 
@@ -0,0 +1,148 @@
+import boto3
+import os
+import urllib.error
+import urllib.request
+from botocore.exceptions import ClientError
+from api_trace import traced
+from admission_control import acquire_token, cloudflare_bucket
+from cloudflare_credentials import get_cloudflare_api_token
+from migration_table import set_rollback_status
+from migration_errors import classify_error, RetryableError, TerminalError
+
+# Every delete below treats "already gone" as success, so a retried task simply carries on
+
+def delete_distribution(cloudfront_client, distribution_id):
+    try:
+        # GetDistribution and DeleteDistribution
+        acquire_token('cloudfront:DeleteDistribution', cost=2)
+        response = cloudfront_client.get_distribution(Id=distribution_id)
+        cloudfront_client.delete_distribution(Id=distribution_id, IfMatch=response['ETag'])
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchDistribution':
+            raise
+
+def delete_web_acl(wafv2_client, web_acl):
+    try:
+        # GetWebACL and DeleteWebACL
+        acquire_token('wafv2:DeleteWebACL', cost=2)
+        response = wafv2_client.get_web_acl(Name=web_acl['Name'], Scope='CLOUDFRONT', Id=web_acl['Id'])
+        wafv2_client.delete_web_acl(
+            Name=web_acl['Name'],
+            Scope='CLOUDFRONT',
+            Id=web_acl['Id'],
+            LockToken=response['LockToken']
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'WAFNonexistentItemException':
+            raise
+
+def delete_certificate(acm_client, certificate_arn):
+    try:
+        acquire_token('acm:DeleteCertificate')
+        acm_client.delete_certificate(CertificateArn=certificate_arn)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ResourceNotFoundException':
+            raise
+
+def delete_route53_records(route53_client, hosted_zone_id, record_sets):
+    def change_batch(records):
+        acquire_token('route53:ChangeResourceRecordSets')
+        route53_client.change_resource_record_sets(
+            HostedZoneId=hosted_zone_id,
+            ChangeBatch={'Changes': [{'Action': 'DELETE', 'ResourceRecordSet': record} for record in records]}
+        )
+
+    try:
+        # One batch for all of the record's validation and origin records
+        change_batch(record_sets)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidChangeBatch':
+            raise
+        # Some of them are gone already (the batch is atomic), delete the rest one by one
+        for record in record_sets:
+            try:
+                change_batch([record])
+            except ClientError as record_error:
+                if record_error.response['Error']['Code'] != 'InvalidChangeBatch':
+                    raise
+
+def delete_cloudflare_record(cloudflare_api_key, cloudflare_zone_id, record_id):
+    acquire_token('cloudflare', cloudflare_bucket(cloudflare_api_key))
+    req = urllib.request.Request(
+        f"https://api.cloudflare.com/client/v4/zones/{cloudflare_zone_id}/dns_records/{record_id}",
+        headers={
+            "Authorization": f"Bearer {cloudflare_api_key}",
+            "Content-Type": "application/json"
+        },
+        method='DELETE'
+    )
+    try:
+        with urllib.request.urlopen(req) as response:
+            response.read()
+    except urllib.error.HTTPError as e:
+        if e.code != 404:
+            raise
+
+@traced
+def lambda_handler(event, context):
+    cloudfront_client = boto3.client('cloudfront')
+    wafv2_client = boto3.client('wafv2')
+    acm_client = boto3.client('acm', region_name='us-east-1')
+    route53_client = boto3.client('route53')
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.Table(os.environ['TABLE_NAME'])
+
+    migration_id = event['migration_id']
+    dns_record = event['dns_record']
+
+    try:
+        item = table.get_item(
+            Key={'migration_id': migration_id, 'dns_record': dns_record},
+            ConsistentRead=True
+        )['Item']
+        resources = item.get('resources', {})
+
+        # Order matters: the WebACL and certificate stay in use until the distribution is gone
+        if resources.get('distribution_id'):
+            delete_distribution(cloudfront_client, resources['distribution_id'])
+        if resources.get('web_acl'):
+            delete_web_acl(wafv2_client, resources['web_acl'])
+        if resources.get('certificate_arn'):
+            delete_certificate(acm_client, resources['certificate_arn'])
+
+        route53_records = [resources['validation_route53_record']] if 'validation_route53_record' in resources else []
+        route53_records += resources.get('origin_route53_records', [])
+        # DynamoDB hands numbers back as Decimal, Route53 wants an int TTL
+        route53_records = [{**record, 'TTL': int(record['TTL'])} for record in route53_records]
+        if route53_records:
+            delete_route53_records(route53_client, event['ZoneID'], route53_records)
+
+        cloudflare_record_ids = [resources['validation_cloudflare_record_id']] if 'validation_cloudflare_record_id' in resources else []
+        cloudflare_record_ids += resources.get('origin_cloudflare_record_ids', [])
+        if cloudflare_record_ids:
+            cloudflare_api_key = get_cloudflare_api_token(event['CloudflareSecretId'])
+            for record_id in cloudflare_record_ids:
+                delete_cloudflare_record(cloudflare_api_key, event['CloudflareZoneID'], record_id)
+
+        set_rollback_status(migration_id, dns_record, 'ROLLED_BACK')
+
+        return {
+            'status': 'success',
+            'message': f'Resources created for {dns_record} were deleted'
+        }
+
+    except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            print(f"Retryable error, the task will be retried: {str(e)}")
+            raise error from e
+
+        print(f"An unexpected error occurred: {str(e)}")
+        error_message = str(e)
+
+        try:
+            set_rollback_status(migration_id, dns_record, 'ROLLBACK_FAILED', f'Delete resources: {error_message}')
+        except Exception as ddb_error:
+            error_message += f" Additionally, failed to update DynamoDB: {str(ddb_error)}"
+
+        raise TerminalError(f'Error occurred: {error_message}')
@@ -0,0 +1,64 @@
+import boto3
+import os
+from botocore.exceptions import ClientError
+from api_trace import traced
+from admission_control import acquire_token
+from migration_table import set_rollback_status
+from migration_errors import classify_error, RetryableError, TerminalError
+
+@traced
+def lambda_handler(event, context):
+    cloudfront_client = boto3.client('cloudfront')
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.Table(os.environ['TABLE_NAME'])
+
+    migration_id = event['migration_id']
+    dns_record = event['dns_record']
+
+    try:
+        # Read the ledger now rather than when the rollback started, a stopped task may have added to it
+        item = table.get_item(
+            Key={'migration_id': migration_id, 'dns_record': dns_record},
+            ConsistentRead=True
+        )['Item']
+        distribution_id = item.get('resources', {}).get('distribution_id', '')
+        if not distribution_id:
+            return {'DistributionId': ''}
+
+        # GetDistributionConfig and UpdateDistribution
+        acquire_token('cloudfront:UpdateDistribution', cost=2)
+
+        # A distribution can only be deleted once it is disabled and deployed
+        try:
+            config_response = cloudfront_client.get_distribution_config(Id=distribution_id)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchDistribution':
+                return {'DistributionId': ''}
+            raise
+
+        distribution_config = config_response['DistributionConfig']
+        if distribution_config['Enabled']:
+            distribution_config['Enabled'] = False
+            cloudfront_client.update_distribution(
+                Id=distribution_id,
+                IfMatch=config_response['ETag'],
+                DistributionConfig=distribution_config
+            )
+
+        return {'DistributionId': distribution_id}
+
+    except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            print(f"Retryable error, the task will be retried: {str(e)}")
+            raise error from e
+
+        print(f"An unexpected error occurred: {str(e)}")
+        error_message = str(e)
+
+        try:
+            set_rollback_status(migration_id, dns_record, 'ROLLBACK_FAILED', f'Disable distribution: {error_message}')
+        except Exception as ddb_error:
+            error_message += f" Additionally, failed to update DynamoDB: {str(ddb_error)}"
+
+        raise TerminalError(f'Error occurred: {error_message}')
@@ -0,0 +1,91 @@
+import boto3
+import os
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from api_trace import traced
+from migration_table import SUMMARY_RECORD, set_rollback_status
+from migration_errors import classify_error, TerminalError
+
+# Records in these states have nothing left to tear down
+SKIPPED_STATUSES = {'COMPLETED', 'ROLLED_BACK'}
+
+# Records in these states may still have a running execution that has to be stopped first
+IN_PROGRESS_STATUSES = {'STARTED', 'SUCCEEDED'}
+
+def stop_execution(step_functions_client, execution_arn):
+    try:
+        step_functions_client.stop_execution(
+            executionArn=execution_arn,
+            cause='Migration rolled back'
+        )
+    except ClientError as e:
+        # Already finished or never started
+        if e.response['Error']['Code'] != 'ExecutionDoesNotExist':
+            raise
+
+def restore_cloudflare_secret(secrets_client, secret_id):
+    # A previous rollback scheduled the secret for deletion; records it failed to roll back still need it
+    try:
+        secrets_client.restore_secret(SecretId=secret_id)
+    except ClientError as e:
+        # Not scheduled for deletion, or already gone: the Cloudflare cleanup of those records fails on its own
+        if e.response['Error']['Code'] not in ('InvalidRequestException', 'ResourceNotFoundException'):
+            raise
+
+@traced
+def lambda_handler(event, context):
+    dynamodb = boto3.resource('dynamodb')
+    step_functions_client = boto3.client('stepfunctions')
+    secrets_client = boto3.client('secretsmanager')
+    table = dynamodb.Table(os.environ['TABLE_NAME'])
+
+    migration_id = event['migration_id']
+
+    try:
+        items = []
+        query_kwargs = {
+            'KeyConditionExpression': Key('migration_id').eq(migration_id),
+            'ConsistentRead': True
+        }
+        while True:
+            response = table.query(**query_kwargs)
+            items.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        summary = next((item for item in items if item['dns_record'] == SUMMARY_RECORD), None)
+        if not summary:
+            raise TerminalError(f'Migration {migration_id} not found')
+        # Its records were moved to S3 and expire from the table, there is no ledger left to roll back
+        if 'archive' in summary:
+            raise TerminalError(f'Migration {migration_id} is archived and can no longer be rolled back')
+
+        restore_cloudflare_secret(secrets_client, summary['cloudflare_secret_id'])
+
+        records = []
+        for item in items:
+            if item['dns_record'] == SUMMARY_RECORD or item.get('status') in SKIPPED_STATUSES:
+                continue
+
+            if item.get('status') in IN_PROGRESS_STATUSES:
+                stop_execution(step_functions_client, item['execution_arn'])
+
+            set_rollback_status(migration_id, item['dns_record'], 'ROLLING_BACK')
+            records.append({
+                'migration_id': migration_id,
+                'dns_record': item['dns_record']
+            })
+
+        # Only keys go into the Map state; each iteration reads its own resource ledger,
+        # which keeps the payload small for zones with hundreds of records
+        return {
+            'records': records,
+            'ZoneID': summary['route53_zone_id'],
+            'CloudflareZoneID': summary['cloudflare_zone_id'],
+            'CloudflareSecretId': summary['cloudflare_secret_id']
+        }
+
+    except Exception as e:
+        print(f"An unexpected error occurred: {str(e)}")
+        raise classify_error(e) from e
@@ -0,0 +1,59 @@
+import boto3
+import os
+from api_trace import traced
+from admission_control import acquire_token
+from migration_table import update_record_status
+from migration_errors import classify_error, RetryableError, TerminalError
+
+# TTL of the CNAME once every Route 53 name server serves it
+FINAL_TTL = int(os.environ.get('FINAL_TTL', '3600'))
+
+@traced
+def lambda_handler(event, context):
+    route53_client = boto3.client('route53')
+
+    viewer_domain = event['viewer_domain']
+    cname_target = event['CNAME']
+    hosted_zone_id = event['ZoneID']
+    migration_id = event['migration_id']
+
+    try:
+        acquire_token('route53:ChangeResourceRecordSets')
+        route53_client.change_resource_record_sets(
+            HostedZoneId=hosted_zone_id,
+            ChangeBatch={'Changes': [{
+                'Action': 'UPSERT',
+                'ResourceRecordSet': {
+                    'Name': viewer_domain,
+                    'Type': 'CNAME',
+                    'TTL': FINAL_TTL,
+                    'ResourceRecords': [{'Value': cname_target}]
+                }
+            }]}
+        )
+
+        # Update DynamoDB record
+        update_record_status(migration_id, viewer_domain, 'Raise DNS TTL', 'COMPLETED')
+
+        return {
+            'status': 'success',
+            'message': f'DNS record TTL raised to {FINAL_TTL}s and migration status marked as completed'
+        }
+
+    except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            # Leave the record untouched; Step Functions retries the task with backoff
+            print(f"Retryable error, the task will be retried: {str(e)}")
+            raise error from e
+
+        print(f"An unexpected error occurred: {str(e)}")
+        error_message = str(e)
+
+        # Update DynamoDB record with error state
+        try:
+            update_record_status(migration_id, viewer_domain, 'Raise DNS TTL', 'FAILED', str(e))
+        except Exception as ddb_error:
+            error_message += f" Additionally, failed to update DynamoDB: {str(ddb_error)}"
+
+        raise TerminalError(f'Error occurred: {error_message}')
@@ -0,0 +1,122 @@
+import boto3
+import os
+import time
+import uuid
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from admission_control import acquire_token, AdmissionDeniedError
+from distribution_pool import pool_table
+from CreateCloudFrontDistribution import build_distribution_config, default_path_policies, MANAGED_DEFAULT_CACHE_POLICY_ID
+
+# Distributions kept AVAILABLE or PROVISIONING, and how many may be created per run
+POOL_SIZE = int(os.environ.get('POOL_SIZE', '0'))
+REPLENISH_BATCH = int(os.environ.get('REPLENISH_BATCH', '2'))
+
+# Pooled distributions point here until a migration claims them and sets the real origin
+PLACEHOLDER_ORIGIN = os.environ.get('POOL_PLACEHOLDER_ORIGIN', 'example.com')
+
+# Claiming a distribution replaces its config, so only unclaimed pooled distributions carry this comment
+POOL_COMMENT = 'Pooled CloudFront distribution waiting for a migration'
+
+def scan_unclaimed(table):
+    kwargs = {'FilterExpression': Attr('status').is_in(['PROVISIONING', 'AVAILABLE'])}
+    while True:
+        response = table.scan(**kwargs)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def mark_available(table, distribution_id):
+    try:
+        table.update_item(
+            Key={'distribution_id': distribution_id},
+            UpdateExpression='SET #status = :available, available_at = :now',
+            ConditionExpression='#status = :provisioning',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':available': 'AVAILABLE',
+                ':provisioning': 'PROVISIONING',
+                ':now': int(time.time())
+            }
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def create_pooled_distribution(cloudfront_client, table):
+    distribution_config = build_distribution_config(
+        f'pool-{uuid.uuid4()}',
+        PLACEHOLDER_ORIGIN,
+        MANAGED_DEFAULT_CACHE_POLICY_ID,
+        default_path_policies()
+    )
+    distribution_config['Comment'] = POOL_COMMENT
+    distribution = cloudfront_client.create_distribution(DistributionConfig=distribution_config)['Distribution']
+    # Should this fail, the next run adopts the distribution (adopt_orphaned_distributions)
+    put_provisioning_row(table, distribution)
+    return distribution['Id']
+
+def put_provisioning_row(table, distribution):
+    try:
+        table.put_item(
+            Item={
+                'distribution_id': distribution['Id'],
+                'domain_name': distribution['DomainName'],
+                'status': 'PROVISIONING',
+                'created_at': int(time.time())
+            },
+            ConditionExpression='attribute_not_exists(distribution_id)'
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+def adopt_orphaned_distributions(cloudfront_client, table):
+    # Pooled distributions whose row was never written, e.g. the put failed after CreateDistribution
+    known = {item['distribution_id'] for item in scan_unclaimed(table)}
+    paginator = cloudfront_client.get_paginator('list_distributions')
+    for page in paginator.paginate():
+        for summary in page['DistributionList'].get('Items', []):
+            if summary['Comment'] != POOL_COMMENT or summary['Id'] in known:
+                continue
+            # The conditional put skips claimed distributions not yet reconfigured
+            if put_provisioning_row(table, summary):
+                print(f"Adopted pooled distribution {summary['Id']}")
+
+def lambda_handler(event, context):
+    cloudfront_client = boto3.client('cloudfront')
+    table = pool_table()
+
+    adopt_orphaned_distributions(cloudfront_client, table)
+    unclaimed = list(scan_unclaimed(table))
+
+    # Distributions become claimable once CloudFront reports them Deployed
+    for item in unclaimed:
+        if item['status'] != 'PROVISIONING':
+            continue
+        status = cloudfront_client.get_distribution(Id=item['distribution_id'])['Distribution']['Status']
+        if status == 'Deployed':
+            mark_available(table, item['distribution_id'])
+            print(f"Pooled distribution {item['distribution_id']} is available")
+
+    missing = max(POOL_SIZE - len(unclaimed), 0)
+    created = 0
+    for _ in range(min(missing, REPLENISH_BATCH)):
+        try:
+            # Shares the CreateDistribution budget with running migrations
+            acquire_token('cloudfront:CreateDistribution')
+        except AdmissionDeniedError as e:
+            print(f"Stopping replenishment for this run: {str(e)}")
+            break
+        distribution_id = create_pooled_distribution(cloudfront_client, table)
+        created += 1
+        print(f"Created pooled distribution {distribution_id}")
+
+    return {
+        'pool_size': POOL_SIZE,
+        'unclaimed': len(unclaimed),
+        'created': created
+    }
@@ -0,0 +1,87 @@
+import boto3
+import os
+from api_trace import traced
+from admission_control import acquire_token
+from migration_table import record_resources, set_rollback_status
+from UpdateDNSRecord import is_cutover_cname
+from migration_errors import classify_error, RetryableError, TerminalError
+
+@traced
+def lambda_handler(event, context):
+    route53_client = boto3.client('route53')
+    dynamodb = boto3.resource('dynamodb')
+    table = dynamodb.Table(os.environ['TABLE_NAME'])
+
+    migration_id = event['migration_id']
+    dns_record = event['dns_record']
+    hosted_zone_id = event['ZoneID']
+
+    try:
+        item = table.get_item(
+            Key={'migration_id': migration_id, 'dns_record': dns_record},
+            ConsistentRead=True
+        )['Item']
+        resources = item.get('resources', {})
+        # Only written by Update DNS Record right before the flip to CloudFront
+        replaced_records = resources.get('replaced_route53_records', [])
+        if not replaced_records:
+            return {'WaitSeconds': 0}
+
+        # ListResourceRecordSets and ChangeResourceRecordSets
+        acquire_token('route53:ChangeResourceRecordSets', cost=2)
+
+        existing_records = route53_client.list_resource_record_sets(
+            HostedZoneId=hosted_zone_id,
+            StartRecordName=dns_record,
+            MaxItems='10'
+        )
+        cutover_records = [
+            record for record in existing_records['ResourceRecordSets']
+            if record['Name'] == f"{dns_record}." and is_cutover_cname(record, resources.get('cutover_cname', ''))
+        ]
+
+        # Resolvers may still hand out the CNAME for its TTL, the distribution has to keep serving until then.
+        # Kept in the ledger ahead of the change, so a retry after the records are back still waits.
+        if cutover_records:
+            wait_seconds = max(int(record['TTL']) for record in cutover_records)
+            record_resources(migration_id, dns_record, {'restore_wait_seconds': wait_seconds})
+        else:
+            wait_seconds = int(resources.get('restore_wait_seconds', 0))
+
+        # Back to the original records in one change batch. An original CNAME overwrites the one
+        # to the distribution; A/AAAA records need it deleted first, as it currently is (Raise DNS
+        # TTL may have changed its TTL). Repeating it only upserts again.
+        changes = []
+        if not any(record['Type'] == 'CNAME' for record in replaced_records):
+            changes += [{'Action': 'DELETE', 'ResourceRecordSet': record} for record in cutover_records]
+        changes += [
+            {
+                'Action': 'UPSERT',
+                # DynamoDB hands numbers back as Decimal, Route53 wants an int TTL
+                'ResourceRecordSet': {**record, 'TTL': int(record['TTL'])}
+            }
+            for record in replaced_records
+        ]
+        route53_client.change_resource_record_sets(
+            HostedZoneId=hosted_zone_id,
+            ChangeBatch={'Changes': changes}
+        )
+
+        print(f"Restored the records of {dns_record}, disabling the distribution in {wait_seconds}s")
+        return {'WaitSeconds': wait_seconds}
+
+    except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            print(f"Retryable error, the task will be retried: {str(e)}")
+            raise error from e
+
+        print(f"An unexpected error occurred: {str(e)}")
+        error_message = str(e)
+
+        try:
+            set_rollback_status(migration_id, dns_record, 'ROLLBACK_FAILED', f'Restore DNS records: {error_message}')
+        except Exception as ddb_error:
+            error_message += f" Additionally, failed to update DynamoDB: {str(ddb_error)}"
+
+        raise TerminalError(f'Error occurred: {error_message}')
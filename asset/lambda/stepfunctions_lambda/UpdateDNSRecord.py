@@ -1,109 +1,134 @@
 import boto3
 import os
-import time
+from api_trace import traced
+from admission_control import acquire_token
+from migration_table import record_resources, update_record_status
+from migration_errors import classify_error, RetryableError, TerminalError
 
+# TTL of the hostname's records around the cutover, short enough for resolvers to pick up the flip quickly
+CUTOVER_TTL = int(os.environ.get('CUTOVER_TTL', '60'))
+
+def change_id(response):
+    # '/change/C123' -> 'C123': the state machine polls it with a direct route53:getChange call,
+    # which, unlike boto3, does not strip the prefix
+    return response['ChangeInfo']['Id'].split('/')[-1]
+
+def is_cutover_cname(record, cname_target):
+    return record['Type'] == 'CNAME' and all(
+        value['Value'].rstrip('.').lower() == cname_target.rstrip('.').lower() for value in record.get('ResourceRecords', [])
+    )
+
+def original_records(record_sets, viewer_domain, cname_target):
+    # The imported A/AAAA records of the hostname, or its CNAME when the origin is another name.
+    # A CNAME already pointing at the distribution is ours, from an earlier attempt.
+    return [
+        record for record in record_sets
+        if record['Name'] == f"{viewer_domain}." and record['Type'] in ('A', 'AAAA', 'CNAME')
+        and not is_cutover_cname(record, cname_target)
+    ]
+
+@traced
 def lambda_handler(event, context):
     # Initialize AWS resource client
     route53_client = boto3.client('route53')
-    dynamodb = boto3.resource('dynamodb')
 
     # Retrieve parameters passed from Step Functions
     viewer_domain = event['viewer_domain']
     cname_target = event['CNAME']
     hosted_zone_id = event['ZoneID']  # Route 53 hosted zone ID
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
     migration_id = event['migration_id']
 
     try:
-        # Delete the existing A record
+        # ListResourceRecordSets and ChangeResourceRecordSets
+        acquire_token('route53:ChangeResourceRecordSets', cost=2)
+
         existing_records = route53_client.list_resource_record_sets(
             HostedZoneId=hosted_zone_id,
             StartRecordName=viewer_domain,
-            StartRecordType='A',
-            MaxItems='1'
+            MaxItems='10'
         )
-        
-        if existing_records['ResourceRecordSets']:
-            record = existing_records['ResourceRecordSets'][0]
-            if record['Name'] == f"{viewer_domain}." and record['Type'] == 'A':
-                response = route53_client.change_resource_record_sets(
-                    HostedZoneId=hosted_zone_id,
-                    ChangeBatch={
-                        'Changes': [
-                            {
-                                'Action': 'DELETE',
-                                'ResourceRecordSet': record
-                            }
-                        ]
-                    }
-                )
+        replaced_records = original_records(existing_records['ResourceRecordSets'], viewer_domain, cname_target)
 
-        # Create a new CNAME record
-        response = route53_client.change_resource_record_sets(
-            HostedZoneId=hosted_zone_id,
-            ChangeBatch={
-                'Changes': [
+        # Records imported with a long TTL are lowered first; resolvers may hold the old answer
+        # for the old TTL, so the state machine waits for the change to be INSYNC, then that long,
+        # and invokes this task again. Proxied records are imported with CUTOVER_TTL already,
+        # this only covers records whose TTL was raised since.
+        long_lived_records = [record for record in replaced_records if record.get('TTL', 0) > CUTOVER_TTL]
+        if long_lived_records:
+            response = route53_client.change_resource_record_sets(
+                HostedZoneId=hosted_zone_id,
+                ChangeBatch={'Changes': [
                     {
-                        'Action': 'CREATE',
-                        'ResourceRecordSet': {
-                            'Name': viewer_domain,
-                            'Type': 'CNAME',
-                            'TTL': 300,
-                            'ResourceRecords': [{'Value': cname_target}]
-                        }
+                        'Action': 'UPSERT',
+                        'ResourceRecordSet': {**record, 'TTL': CUTOVER_TTL}
                     }
-                ]
+                    for record in long_lived_records
+                ]}
+            )
+            wait_seconds = max(record['TTL'] for record in long_lived_records)
+            print(f"Lowered the TTL of {viewer_domain} to {CUTOVER_TTL}s, flipping in {wait_seconds}s")
+            return {
+                'status': 'ttl_lowered',
+                'WaitSeconds': wait_seconds,
+                'ChangeId': change_id(response)
             }
-        )
 
-        # Update DynamoDB record
-        table.update_item(
-            Key={
-                'migration_id': migration_id,
-                'dns_record': viewer_domain
-            },
-            UpdateExpression="SET step_name = :n, #status = :s, #time = :t",
-            ExpressionAttributeNames={
-                '#status': 'status',
-                '#time': 'time'
-            },
-            ExpressionAttributeValues={
-                ':n': 'Update DNS Record',
-                ':s': 'COMPLETED',
-                ':t': int(time.time())
+        # The replaced records go into the ledger before they are replaced, a rollback puts them back
+        # (Restore DNS Record). A retried task finds them gone and leaves the ledger as it is.
+        if replaced_records:
+            record_resources(migration_id, viewer_domain, {
+                'replaced_route53_records': replaced_records,
+                'cutover_cname': cname_target
+            })
+
+        # Swap to the CNAME in one change batch, so the hostname never stops resolving. A/AAAA
+        # records cannot coexist with it and are deleted, an original CNAME is overwritten.
+        changes = [
+            {
+                'Action': 'DELETE',
+                'ResourceRecordSet': record
             }
+            for record in replaced_records if record['Type'] != 'CNAME'
+        ]
+        changes.append({
+            'Action': 'UPSERT',  # safe to repeat when the task is retried
+            'ResourceRecordSet': {
+                'Name': viewer_domain,
+                'Type': 'CNAME',
+                # Kept short until the change is INSYNC, then raised by the Raise DNS TTL step
+                'TTL': CUTOVER_TTL,
+                'ResourceRecords': [{'Value': cname_target}]
+            }
+        })
+        response = route53_client.change_resource_record_sets(
+            HostedZoneId=hosted_zone_id,
+            ChangeBatch={'Changes': changes}
         )
 
+        # Update DynamoDB record
+        update_record_status(migration_id, viewer_domain, 'Update DNS Record', 'SUCCEEDED')
+
         # Return a successful response
         return {
             'status': 'success',
-            'message': 'DNS record successfully updated to CloudFront domain and migration status marked as completed'
+            'message': 'DNS record successfully updated to CloudFront domain',
+            'ChangeId': change_id(response)
         }
 
     except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            # Leave the record untouched; Step Functions retries the task with backoff
+            print(f"Retryable error, the task will be retried: {str(e)}")
+            raise error from e
+
         print(f"An unexpected error occurred: {str(e)}")
         error_message = str(e)
         
         # Update DynamoDB record with error state
         try:
-            table.update_item(
-                Key={
-                    'migration_id': migration_id,
-                    'dns_record': viewer_domain
-                },
-                UpdateExpression="SET step_name = :n, #status = :s, error_message = :e, #time = :t",
-                ExpressionAttributeNames={
-                    '#status': 'status',
-                    '#time': 'time'
-                },
-                ExpressionAttributeValues={
-                    ':n': 'Update DNS Record',
-                    ':s': 'FAILED',
-                    ':e': str(e),
-                    ':t': int(time.time())
-                }
-            )
+            update_record_status(migration_id, viewer_domain, 'Update DNS Record', 'FAILED', str(e))
         except Exception as ddb_error:
             error_message += f" Additionally, failed to update DynamoDB: {str(ddb_error)}"
         
-        raise Exception(f'Error occurred: {error_message}')
+        raise TerminalError(f'Error occurred: {error_message}')
@@ -0,0 +1,42 @@
+import asyncio
+import os
+import time
+from api_trace import traced
+from http_probe import probe
+from migration_table import set_verification
+
+# Probes the migrated hostname through the Cloudflare edge and the new CloudFront distribution
+# and stores the comparison on the record row. Verification never fails the record: the
+# record stays COMPLETED and the result only reports how the two edges compare.
+
+VERIFY_PATHS = [path for path in os.environ.get('VERIFY_PATHS', '/').split(',') if path]
+REQUESTS_PER_PATH = int(os.environ.get('VERIFY_REQUESTS_PER_PATH', '10'))
+CONCURRENCY = int(os.environ.get('VERIFY_CONCURRENCY', '20'))
+
+@traced
+def lambda_handler(event, context):
+    viewer_domain = event['viewer_domain']
+    migration_id = event['migration_id']
+
+    # Proxied hostnames keep resolving to the Cloudflare edge through <hostname>.cdn.cloudflare.net
+    # after the zone's DNS moved to Route53
+    targets = {
+        'cloudflare': {'connect_host': f"{viewer_domain}.cdn.cloudflare.net"},
+        'cloudfront': {'connect_host': event['DistributionCname']}
+    }
+
+    try:
+        started = time.time()
+        result = asyncio.run(probe(viewer_domain, targets, VERIFY_PATHS, REQUESTS_PER_PATH, CONCURRENCY))
+        result['time'] = int(started)
+        print(f"Verification of {viewer_domain}: {result}")
+    except Exception as e:
+        print(f"Verification of {viewer_domain} could not run: {str(e)}")
+        result = {'time': int(time.time()), 'match': False, 'error': str(e)}
+
+    set_verification(migration_id, viewer_domain, result)
+
+    return {
+        'status': 'success',
+        'match': result['match']
+    }
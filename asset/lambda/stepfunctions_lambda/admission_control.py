@@ -0,0 +1,130 @@
+import hashlib
+import os
+import time
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+
+from migration_errors import RetryableError
+
+# Token bucket settings (requests per second, burst size) for every rate-limited call the
+# migration workflow makes. Buckets are shared by all executions through the admission table,
+# so hundreds of concurrent records are admitted at the rate the API actually accepts.
+API_RATE_LIMITS = {
+    'acm:RequestCertificate': (5, 5),
+    'wafv2:CreateWebACL': (1, 2),
+    'cloudfront:CreateDistribution': (1, 2),
+    'route53:ChangeResourceRecordSets': (5, 5),
+    'acm:DeleteCertificate': (5, 5),
+    'wafv2:DeleteWebACL': (1, 2),
+    'cloudfront:UpdateDistribution': (1, 2),
+    'cloudfront:DeleteDistribution': (1, 2),
+    'cloudflare': (4, 10),  # 1,200 requests per 5 minutes per Cloudflare user
+}
+
+# A token admits one API call. Handlers that make several calls against the same limit
+# (a read before a write, several change batches) take that many tokens at once; Route53 and
+# CloudFront apply their limits to all of their API actions, reads included.
+
+# Optimistic-lock attempts before giving up on a contended bucket for this invocation
+MAX_LOCK_ATTEMPTS = 5
+
+dynamodb = boto3.resource('dynamodb')
+
+
+class AdmissionDeniedError(RetryableError):
+    # Raised when a bucket is empty. The state machine retries the task with backoff,
+    # so the execution waits in line instead of failing with a throttling error.
+    pass
+
+
+def cloudflare_bucket(api_token):
+    # Cloudflare limits requests per user, so bucket on a hash of the API token
+    return 'cloudflare#' + hashlib.sha256(api_token.encode('utf-8')).hexdigest()[:16]
+
+
+def acquire_token(api_name, bucket_id=None, cost=1):
+    rate, burst = API_RATE_LIMITS[api_name]
+    if cost > burst:
+        raise ValueError(f'{api_name} admits at most {burst} calls at once, {cost} requested')
+    bucket_id = bucket_id or api_name
+    table = dynamodb.Table(os.environ['ADMISSION_TABLE_NAME'])
+
+    for _ in range(MAX_LOCK_ATTEMPTS):
+        now_ms = int(time.time() * 1000)
+        item = table.get_item(Key={'bucket_id': bucket_id}, ConsistentRead=True).get('Item')
+
+        if item:
+            last_refill = int(item['last_refill'])
+            elapsed = max(now_ms - last_refill, 0) / 1000
+            tokens = min(float(burst), float(item['tokens']) + elapsed * rate)
+        else:
+            last_refill = None
+            tokens = float(burst)
+
+        if tokens < cost:
+            wait_seconds = (cost - tokens) / rate
+            raise AdmissionDeniedError(f'No {bucket_id} token available, next one in {wait_seconds:.1f}s')
+
+        remaining = Decimal(str(round(tokens - cost, 3)))
+        try:
+            if last_refill is None:
+                table.put_item(
+                    Item={'bucket_id': bucket_id, 'tokens': remaining, 'last_refill': now_ms},
+                    ConditionExpression='attribute_not_exists(bucket_id)'
+                )
+            else:
+                table.update_item(
+                    Key={'bucket_id': bucket_id},
+                    UpdateExpression='SET tokens = :t, last_refill = :now',
+                    ConditionExpression='last_refill = :last',
+                    ExpressionAttributeValues={
+                        ':t': remaining,
+                        ':now': now_ms,
+                        ':last': last_refill
+                    }
+                )
+            return
+        except ClientError as e:
+            # Another execution took a token between our read and write; re-read and try again
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+    raise AdmissionDeniedError(f'Bucket {bucket_id} is contended, retrying later')
+
+
+def refund_token(api_name, bucket_id=None, cost=1):
+    # Gives tokens back unused. The bucket may briefly hold more than its burst, the next
+    # acquire_token caps it again.
+    table = dynamodb.Table(os.environ['ADMISSION_TABLE_NAME'])
+    table.update_item(
+        Key={'bucket_id': bucket_id or api_name},
+        UpdateExpression='ADD tokens :c',
+        ConditionExpression='attribute_exists(bucket_id)',
+        ExpressionAttributeValues={':c': Decimal(cost)}
+    )
+
+
+def acquire_tokens(requests):
+    # All or nothing over several buckets: requests is a list of (api_name, bucket_id, cost).
+    # When one is denied the tokens already taken are refunded, so a task retried through a
+    # throttle spike does not drain the buckets it was admitted to without making its calls.
+    costs = {}
+    for api_name, bucket_id, cost in requests:
+        costs[(api_name, bucket_id)] = costs.get((api_name, bucket_id), 0) + cost
+
+    acquired = []
+    try:
+        for (api_name, bucket_id), cost in costs.items():
+            # More than a burst is admitted once the bucket is full, the rest runs on its refill
+            cost = min(cost, API_RATE_LIMITS[api_name][1])
+            acquire_token(api_name, bucket_id, cost)
+            acquired.append((api_name, bucket_id, cost))
+    except AdmissionDeniedError:
+        for api_name, bucket_id, cost in acquired:
+            try:
+                refund_token(api_name, bucket_id, cost)
+            except ClientError as e:
+                print(f"Could not refund {cost} {bucket_id or api_name} tokens: {e}")
+        raise
@@ -0,0 +1,296 @@
+import base64
+import datetime
+import functools
+import gzip
+import io
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from decimal import Decimal
+
+import boto3
+from botocore.awsrequest import AWSResponse
+
+# API trace capture and replay for the workflow handlers.
+#
+# API_TRACE_MODE=record: every botocore call and every Cloudflare API call made through
+# urllib is captured with its request, response and latency. When the handler returns, the
+# trace is written as gzip JSONL to API_TRACE_BUCKET.
+# API_TRACE_MODE=replay: calls are answered from API_TRACE_FILE instead of the network, after
+# sleeping for the recorded latency times API_TRACE_SCALE (see tools/replay_trace.py).
+#
+# This module has to be imported before anything that creates boto3 clients, since clients
+# copy the session's event hooks when they are created.
+
+MODE = os.environ.get('API_TRACE_MODE', 'off')
+
+# Values of these keys never leave the handler (compared lowercased)
+REDACTED_KEYS = {'authorization', 'apikey', 'api_key', 'api_token', 'token', 'password', 'secretstring', 'secretbinary'}
+REDACTED = '[redacted]'
+
+CLOUDFLARE_API_PREFIX = 'https://api.cloudflare.com/'
+
+# Handler configuration kept in the trace header so a replay runs with the same settings
+TRACE_ENVIRONMENT = ['TABLE_NAME', 'ADMISSION_TABLE_NAME', 'CACHE_POLICY_ID', 'VERIFY_PATHS', 'VERIFY_REQUESTS_PER_PATH', 'VERIFY_CONCURRENCY']
+
+_original_urlopen = urllib.request.urlopen
+_entries = []
+_started = 0.0
+_suspended = False
+_replay_queues = None
+
+
+def redact(value):
+    if isinstance(value, dict):
+        return {k: REDACTED if k.lower() in REDACTED_KEYS else redact(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [redact(v) for v in value]
+    return value
+
+
+def _json_default(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return {'__bytes__': base64.b64encode(value).decode()}
+    if hasattr(value, 'read'):  # streaming bodies are not captured
+        return None
+    return str(value)
+
+
+def _snapshot(value):
+    # Serialized right away: later handlers (e.g. the boto3 resource layer) modify responses in place
+    return json.loads(json.dumps(redact(value), default=_json_default))
+
+
+def _record(entry):
+    entry['t_ms'] = round((time.perf_counter() - _started) * 1000, 1)
+    _entries.append(entry)
+
+
+def _call_key(kind, service, operation):
+    return f"{kind}:{service}:{operation}"
+
+
+# --- botocore hooks
+
+def _before_call(model, params, context, **kwargs):
+    if _suspended:
+        return None
+    if MODE == 'replay':
+        return _replay_aws(model)
+    context['api_trace_started'] = time.perf_counter()
+    return None
+
+
+def _provide_params(model, params, context, **kwargs):
+    # The user-facing parameters, before serialization
+    if not _suspended and MODE == 'record':
+        context['api_trace_request'] = _snapshot(params)
+
+
+def _after_call(http_response, parsed, model, context, **kwargs):
+    if _suspended or MODE != 'record' or 'api_trace_started' not in context:
+        return
+    response = {k: v for k, v in parsed.items() if k != 'ResponseMetadata'}
+    _record({
+        'kind': 'aws',
+        'service': model.service_model.service_name,
+        'operation': model.name,
+        'request': context.get('api_trace_request', {}),
+        'status': http_response.status_code,
+        'response': _snapshot(response),
+        'latency_ms': round((time.perf_counter() - context['api_trace_started']) * 1000, 1)
+    })
+
+
+def _after_call_error(exception, model, context, **kwargs):
+    # Connection errors and timeouts; HTTP errors come back through after-call
+    if _suspended or MODE != 'record' or 'api_trace_started' not in context:
+        return
+    _record({
+        'kind': 'aws',
+        'service': model.service_model.service_name,
+        'operation': model.name,
+        'request': context.get('api_trace_request', {}),
+        'exception': f'{type(exception).__name__}: {exception}',
+        'latency_ms': round((time.perf_counter() - context['api_trace_started']) * 1000, 1)
+    })
+
+
+# --- Cloudflare (urllib) wrapper
+
+class _ReplayedResponse(io.BytesIO):
+    def __init__(self, status, body):
+        super().__init__(body)
+        self.status = status
+
+    def getcode(self):
+        return self.status
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _request_details(request):
+    if isinstance(request, str):
+        return 'GET', request, None
+    body = request.data.decode('utf-8') if request.data else None
+    return request.get_method(), request.full_url, body
+
+
+def _parse_body(body):
+    try:
+        return json.loads(body)
+    except (TypeError, ValueError):
+        return body
+
+
+def traced_urlopen(request, *args, **kwargs):
+    method, url, body = _request_details(request)
+    if _suspended or not url.startswith(CLOUDFLARE_API_PREFIX):
+        return _original_urlopen(request, *args, **kwargs)
+    if MODE == 'replay':
+        return _replay_cloudflare(method, url)
+
+    started = time.perf_counter()
+    entry = {
+        'kind': 'cloudflare',
+        'service': 'cloudflare',
+        'operation': method,
+        'request': {'url': url, 'body': _snapshot(_parse_body(body))}  # the Authorization header is never captured
+    }
+    try:
+        response = _original_urlopen(request, *args, **kwargs)
+        response_body = response.read()
+    except urllib.error.HTTPError as e:
+        error_body = e.read()
+        entry.update(status=e.code, response=_snapshot(_parse_body(error_body.decode('utf-8', 'replace'))))
+        entry['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        _record(entry)
+        raise urllib.error.HTTPError(e.url, e.code, e.msg, e.hdrs, io.BytesIO(error_body)) from None
+    except Exception as e:
+        entry.update(exception=f'{type(e).__name__}: {e}', latency_ms=round((time.perf_counter() - started) * 1000, 1))
+        _record(entry)
+        raise
+
+    entry.update(status=response.status, response=_snapshot(_parse_body(response_body.decode('utf-8', 'replace'))))
+    entry['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    _record(entry)
+    # The body was consumed for the trace, hand the caller an equivalent response
+    return _ReplayedResponse(response.status, response_body)
+
+
+# --- replay
+
+def load_trace(path):
+    with gzip.open(path, 'rt') as f:
+        lines = [json.loads(line) for line in f]
+    return lines[0], lines[1:]
+
+
+def start_replay(entries):
+    global _replay_queues
+    _replay_queues = {}
+    for entry in entries:
+        _replay_queues.setdefault(_call_key(entry['kind'], entry['service'], entry['operation']), deque()).append(entry)
+
+
+def _next_replayed(key):
+    queue = (_replay_queues or {}).get(key)
+    if not queue:
+        raise RuntimeError(f'No recorded response left for {key}')
+    entry = queue.popleft()
+    time.sleep(entry.get('latency_ms', 0) / 1000 * float(os.environ.get('API_TRACE_SCALE', '1')))
+    if 'exception' in entry:
+        raise ConnectionError(f"Replayed failure: {entry['exception']}")
+    return entry
+
+
+def _replay_aws(model):
+    entry = _next_replayed(_call_key('aws', model.service_model.service_name, model.name))
+    # A response with an Error block and an error status makes the client raise ClientError as it did live
+    return AWSResponse(None, entry['status'], {}, None), entry['response']
+
+
+def _replay_cloudflare(method, url):
+    entry = _next_replayed(_call_key('cloudflare', 'cloudflare', method))
+    body = json.dumps(entry['response']).encode('utf-8')
+    if entry['status'] >= 400:
+        raise urllib.error.HTTPError(url, entry['status'], 'Replayed error', {}, io.BytesIO(body))
+    return _ReplayedResponse(entry['status'], body)
+
+
+# --- handler decorator
+
+def _write_trace(header):
+    global _suspended
+    bucket = os.environ.get('API_TRACE_BUCKET')
+    if not bucket:
+        return
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
+        for line in [header] + _entries:
+            f.write((json.dumps(line, default=_json_default) + '\n').encode('utf-8'))
+    key = f"traces/{header.get('migration_id') or 'none'}/{header['handler']}/{header['started']}-{header['request_id']}.jsonl.gz"
+    _suspended = True  # the upload itself is not part of the trace
+    try:
+        boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=buffer.getvalue())
+    except Exception as e:
+        print(f"Failed to write API trace: {e}")
+    finally:
+        _suspended = False
+
+
+def traced(handler):
+    if MODE == 'off':
+        return handler
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _started
+        if MODE == 'replay':
+            header, entries = load_trace(os.environ['API_TRACE_FILE'])
+            start_replay(entries)
+            return handler(event, context)
+
+        _entries.clear()
+        _started = time.perf_counter()
+        header = {
+            'handler': f"{handler.__module__}.{handler.__name__}",
+            'migration_id': event.get('migration_id') if isinstance(event, dict) else None,
+            'request_id': getattr(context, 'aws_request_id', 'local'),
+            'started': int(time.time() * 1000),
+            'environment': {name: os.environ[name] for name in TRACE_ENVIRONMENT if name in os.environ},
+            'event': _snapshot(event)
+        }
+        try:
+            result = handler(event, context)
+            header['outcome'] = 'success'
+            return result
+        except Exception as e:
+            header['outcome'] = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            header['duration_ms'] = round((time.perf_counter() - _started) * 1000, 1)
+            _write_trace(header)
+
+    return wrapper
+
+
+if MODE in ('record', 'replay'):
+    boto3.setup_default_session()
+    _events = boto3.DEFAULT_SESSION.events
+    _events.register('provide-client-params', _provide_params, unique_id='api-trace-params')
+    _events.register('before-call', _before_call, unique_id='api-trace-before')
+    _events.register('after-call', _after_call, unique_id='api-trace-after')
+    _events.register('after-call-error', _after_call_error, unique_id='api-trace-error')
+    urllib.request.urlopen = traced_urlopen
@@ -0,0 +1,35 @@
+import time
+from collections import OrderedDict
+
+import boto3
+
+# quick-migration stores the Cloudflare API token once per migration in Secrets Manager and only
+# the secret id travels through the state machine. Warm containers resolve it once per migration.
+CACHE_TTL_SECONDS = 15 * 60
+CACHE_MAX_ENTRIES = 32
+
+secrets_client = boto3.client('secretsmanager')
+
+# secret_id -> (expires_at, api_token), least recently used first
+_token_cache = OrderedDict()
+
+
+def _evict(now):
+    for secret_id in [key for key, (expires_at, _) in _token_cache.items() if expires_at <= now]:
+        del _token_cache[secret_id]
+    while len(_token_cache) > CACHE_MAX_ENTRIES:
+        _token_cache.popitem(last=False)
+
+
+def get_cloudflare_api_token(secret_id):
+    now = time.time()
+    entry = _token_cache.get(secret_id)
+    if entry and entry[0] > now:
+        _token_cache.move_to_end(secret_id)
+        return entry[1]
+
+    api_token = secrets_client.get_secret_value(SecretId=secret_id)['SecretString']
+    _token_cache[secret_id] = (now + CACHE_TTL_SECONDS, api_token)
+    _token_cache.move_to_end(secret_id)
+    _evict(now)
+    return api_token
@@ -0,0 +1,41 @@
+import json
+import urllib.parse
+import urllib.request
+
+CLOUDFLARE_API_URL = 'https://api.cloudflare.com/client/v4'
+
+# Each record written costs two Cloudflare calls: the lookup and, when it is missing, the create
+CALLS_PER_RECORD = 2
+
+
+def _request(api_token, url, data=None):
+    headers = {
+        "Authorization": f"Bearer {api_token}",
+        "Content-Type": "application/json"
+    }
+    body = json.dumps(data).encode('utf-8') if data is not None else None
+    req = urllib.request.Request(url, data=body, headers=headers)
+    with urllib.request.urlopen(req) as response:
+        status_code = response.getcode()
+        response_json = json.loads(response.read().decode('utf-8'))
+    if status_code != 200 or not response_json.get('success', True):
+        raise Exception(f'Cloudflare API request failed, status code: {status_code}, errors: {response_json.get("errors")}')
+    return response_json['result']
+
+
+def find_or_create_record(api_token, zone_id, record_type, name, content, ttl=300):
+    # Returns the id of the record, creating it only when no identical record exists yet.
+    # A retried task finds the record its first attempt created instead of failing on a duplicate.
+    name = name.rstrip('.')
+    query = urllib.parse.urlencode({'type': record_type, 'name': name})
+    for record in _request(api_token, f"{CLOUDFLARE_API_URL}/zones/{zone_id}/dns_records?{query}"):
+        if record['content'].rstrip('.').lower() == content.rstrip('.').lower():
+            return record['id']
+
+    created = _request(api_token, f"{CLOUDFLARE_API_URL}/zones/{zone_id}/dns_records", {
+        "type": record_type,
+        "name": name,
+        "content": content,
+        "ttl": ttl
+    })
+    return created['id']
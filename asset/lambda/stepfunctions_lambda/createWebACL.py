@@ -1,104 +1,123 @@
 import boto3
-import uuid
-import os
-import time
+import hashlib
+from botocore.exceptions import ClientError
+from api_trace import traced
+from admission_control import acquire_token
+from migration_table import update_record_status
+from migration_errors import classify_error, RetryableError, TerminalError
 
+def web_acl_suffix(migration_id, dns_record):
+    # The same for every attempt of the task, so a retry finds the WebACL the first attempt created
+    return hashlib.sha256(f'{migration_id}#{dns_record}'.encode('utf-8')).hexdigest()[:32]
+
+def find_web_acl(wafv2_client, name):
+    kwargs = {'Scope': 'CLOUDFRONT', 'Limit': 100}
+    while True:
+        response = wafv2_client.list_web_acls(**kwargs)
+        for summary in response.get('WebACLs', []):
+            if summary['Name'] == name:
+                return summary
+        if not response.get('NextMarker') or not response.get('WebACLs'):
+            return None
+        kwargs['NextMarker'] = response['NextMarker']
+
+@traced
 def lambda_handler(event, context):
     wafv2_client = boto3.client('wafv2')
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(os.environ['TABLE_NAME'])
     
     # Retrieve parameters passed from Step Functions
     migration_id = event['migration_id']
     dns_record = event['viewer_domain']
     
     try:
-        # Generate a unique identifier
-        unique_id = str(uuid.uuid4())
+        suffix = web_acl_suffix(migration_id, dns_record)
+        name = f'cflare-Migration-WAF-{suffix}'
+
+        acquire_token('wafv2:CreateWebACL')
 
-        # Define the WebACL with the specified rules and append the UUID to the Name
-        response = wafv2_client.create_web_acl(
-            Name=f'cflare-Migration-WAF-{unique_id}',
-            Scope='CLOUDFRONT',  # Change to 'REGIONAL' if not using CloudFront
-            DefaultAction={'Allow': {}},  # Set the default action to Allow or Block
-            Description='WebACL with AWS managed rules',
-            Rules=[
-                {
-                    'Name': f'AWS-AWSManagedRulesAmazonIpReputationList',
-                    'Priority': 0,
-                    'Statement': {
-                        'ManagedRuleGroupStatement': {
-                            'VendorName': 'AWS',
-                            'Name': 'AWSManagedRulesAmazonIpReputationList'
+        # Define the WebACL with the specified rules
+        try:
+            response = wafv2_client.create_web_acl(
+                Name=name,
+                Scope='CLOUDFRONT',  # Change to 'REGIONAL' if not using CloudFront
+                DefaultAction={'Allow': {}},  # Set the default action to Allow or Block
+                Description='WebACL with AWS managed rules',
+                Rules=[
+                    {
+                        'Name': f'AWS-AWSManagedRulesAmazonIpReputationList',
+                        'Priority': 0,
+                        'Statement': {
+                            'ManagedRuleGroupStatement': {
+                                'VendorName': 'AWS',
+                                'Name': 'AWSManagedRulesAmazonIpReputationList'
+                            }
+                        },
+                        'OverrideAction': {"None": {}},
+                        'VisibilityConfig': {
+                            'SampledRequestsEnabled': True,
+                            'CloudWatchMetricsEnabled': True,
+                            'MetricName': f'AWS-AWSManagedRulesAmazonIpReputationList'
                         }
                     },
-                    'OverrideAction': {"None": {}},
-                    'VisibilityConfig': {
-                        'SampledRequestsEnabled': True,
-                        'CloudWatchMetricsEnabled': True,
-                        'MetricName': f'AWS-AWSManagedRulesAmazonIpReputationList'
-                    }
-                },
-                {
-                    'Name': f'AWS-AWSManagedRulesCommonRuleSet',
-                    'Priority': 1,
-                    'Statement': {
-                        'ManagedRuleGroupStatement': {
-                            'VendorName': 'AWS',
-                            'Name': 'AWSManagedRulesCommonRuleSet'
+                    {
+                        'Name': f'AWS-AWSManagedRulesCommonRuleSet',
+                        'Priority': 1,
+                        'Statement': {
+                            'ManagedRuleGroupStatement': {
+                                'VendorName': 'AWS',
+                                'Name': 'AWSManagedRulesCommonRuleSet'
+                            }
+                        },
+                        'OverrideAction': {"None": {}},
+                        'VisibilityConfig': {
+                            'SampledRequestsEnabled': True,
+                            'CloudWatchMetricsEnabled': True,
+                            'MetricName': f'AWS-AWSManagedRulesCommonRuleSet'
                         }
                     },
-                    'OverrideAction': {"None": {}},
-                    'VisibilityConfig': {
-                        'SampledRequestsEnabled': True,
-                        'CloudWatchMetricsEnabled': True,
-                        'MetricName': f'AWS-AWSManagedRulesCommonRuleSet'
-                    }
-                },
-                {
-                    'Name': f'AWS-AWSManagedRulesKnownBadInputsRuleSet',
-                    'Priority': 2,
-                    'Statement': {
-                        'ManagedRuleGroupStatement': {
-                            'VendorName': 'AWS',
-                            'Name': 'AWSManagedRulesKnownBadInputsRuleSet'
+                    {
+                        'Name': f'AWS-AWSManagedRulesKnownBadInputsRuleSet',
+                        'Priority': 2,
+                        'Statement': {
+                            'ManagedRuleGroupStatement': {
+                                'VendorName': 'AWS',
+                                'Name': 'AWSManagedRulesKnownBadInputsRuleSet'
+                            }
+                        },
+                        'OverrideAction': {"None": {}},
+                        'VisibilityConfig': {
+                            'SampledRequestsEnabled': True,
+                            'CloudWatchMetricsEnabled': True,
+                            'MetricName': f'AWS-AWSManagedRulesKnownBadInputsRuleSet'
                         }
-                    },
-                    'OverrideAction': {"None": {}},
-                    'VisibilityConfig': {
-                        'SampledRequestsEnabled': True,
-                        'CloudWatchMetricsEnabled': True,
-                        'MetricName': f'AWS-AWSManagedRulesKnownBadInputsRuleSet'
                     }
+                ],
+                VisibilityConfig={
+                    'SampledRequestsEnabled': True,
+                    'CloudWatchMetricsEnabled': True,
+                    'MetricName': f'MyWebACL-{suffix}'
                 }
-            ],
-            VisibilityConfig={
-                'SampledRequestsEnabled': True,
-                'CloudWatchMetricsEnabled': True,
-                'MetricName': f'MyWebACL-{unique_id}'
-            }
-        )
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'WAFDuplicateItemException':
+                raise
+            # Created by an earlier attempt of this task
+            summary = find_web_acl(wafv2_client, name)
+            if not summary:
+                raise
+            response = {'Summary': summary}
         
         print("Response from WAF:", response)
         web_acl_arn = response['Summary']['ARN']
         
         # Update DynamoDB record
-        table.update_item(
-            Key={
-                'migration_id': migration_id,
-                'dns_record': dns_record
-            },
-            UpdateExpression="SET step_name = :n, #status = :s, #time = :t",
-            ExpressionAttributeNames={
-                '#status': 'status',
-                '#time': 'time'
-            },
-            ExpressionAttributeValues={
-                ':n': 'Create Web ACL',
-                ':s': 'SUCCEEDED',
-                ':t': int(time.time())
+        update_record_status(migration_id, dns_record, 'Create Web ACL', 'SUCCEEDED', resources={
+            'web_acl': {
+                'Name': response['Summary']['Name'],
+                'Id': response['Summary']['Id'],
+                'ARN': web_acl_arn
             }
-        )
+        })
         
         return {
             'status': 'success',
@@ -107,29 +126,19 @@ def lambda_handler(event, context):
         }
     
     except Exception as e:
+        error = classify_error(e)
+        if isinstance(error, RetryableError):
+            # Leave the record untouched; Step Functions retries the task with backoff
+            print(f"Retryable error, the task will be retried: {str(e)}")
+            raise error from e
+
         print(f"An unexpected error occurred: {str(e)}")
         error_message = str(e)
         
         # Update DynamoDB record with error state
         try:
-            table.update_item(
-                Key={
-                    'migration_id': migration_id,
-                    'dns_record': dns_record
-                },
-                UpdateExpression="SET step_name = :n, #status = :s, error_message = :e, #time = :t",
-                ExpressionAttributeNames={
-                    '#status': 'status',
-                    '#time': 'time'
-                },
-                ExpressionAttributeValues={
-                    ':n': 'Create Web ACL',
-                    ':s': 'FAILED',
-                    ':e': str(e),
-                    ':t': int(time.time())
-                }
-            )
+            update_record_status(migration_id, dns_record, 'Create Web ACL', 'FAILED', str(e))
         except Exception as ddb_error:
             error_message += f" Additionally, failed to update DynamoDB: {str(ddb_error)}"
         
-        raise Exception(f'Error occurred: {error_message}')
\ No newline at end of file
+        raise TerminalError(f'Error occurred: {error_message}')
\ No newline at end of file
@@ -0,0 +1,123 @@
+import os
+import time
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+# Pre-created distributions waiting for a migration. A pool row goes PROVISIONING -> AVAILABLE
+# once the distribution is Deployed, and AVAILABLE -> CLAIMED when a record takes it over.
+# Each claim also writes a claim item, keyed 'claim#<claim reference>', in the same transaction.
+POOL_TABLE_NAME = os.environ.get('POOL_TABLE_NAME')
+
+STATUS_INDEX = 'status-index'
+CLAIM_INDEX = 'claimed-by-index'
+
+# Claimed rows are kept for a while to look up claims, DynamoDB deletes them after expire_at
+CLAIMED_ROW_EXPIRY_SECONDS = 7 * 24 * 60 * 60
+
+# Available rows tried per claim before giving up and creating a distribution instead
+MAX_CLAIM_CANDIDATES = 5
+
+dynamodb = boto3.resource('dynamodb')
+
+
+def pool_enabled():
+    return bool(POOL_TABLE_NAME)
+
+
+def pool_table():
+    return dynamodb.Table(POOL_TABLE_NAME)
+
+
+def claim_reference(migration_id, domain_name):
+    return f'{migration_id}#{domain_name}'
+
+
+def claim_key(reference):
+    return f'claim#{reference}'
+
+
+def find_claim(table, reference):
+    # A retried task gets the distribution claimed by the first attempt back. The claim item is
+    # read consistently; the index, only eventually consistent, covers claims made before it existed.
+    item = table.get_item(Key={'distribution_id': claim_key(reference)}, ConsistentRead=True).get('Item')
+    if item:
+        return item['claimed_distribution_id']
+    claimed = table.query(
+        IndexName=CLAIM_INDEX,
+        KeyConditionExpression=Key('claimed_by').eq(reference),
+        Limit=1
+    )['Items']
+    return claimed[0]['distribution_id'] if claimed else None
+
+
+def claim_distribution(migration_id, domain_name):
+    # Returns the id of a Deployed distribution now owned by the record, or None when the pool is empty
+    table = pool_table()
+    reference = claim_reference(migration_id, domain_name)
+
+    claimed_distribution_id = find_claim(table, reference)
+    if claimed_distribution_id:
+        return claimed_distribution_id
+
+    candidates = table.query(
+        IndexName=STATUS_INDEX,
+        KeyConditionExpression=Key('status').eq('AVAILABLE'),
+        Limit=MAX_CLAIM_CANDIDATES
+    )['Items']
+    for candidate in candidates:
+        expire_at = int(time.time()) + CLAIMED_ROW_EXPIRY_SECONDS
+        try:
+            table.meta.client.transact_write_items(TransactItems=[
+                {
+                    # Only one concurrent record can move the row out of AVAILABLE
+                    'Update': {
+                        'TableName': POOL_TABLE_NAME,
+                        'Key': {'distribution_id': candidate['distribution_id']},
+                        'UpdateExpression': 'SET #status = :claimed, claimed_by = :by, claimed_at = :now, expire_at = :expire',
+                        'ConditionExpression': '#status = :available',
+                        'ExpressionAttributeNames': {'#status': 'status'},
+                        'ExpressionAttributeValues': {
+                            ':claimed': 'CLAIMED',
+                            ':available': 'AVAILABLE',
+                            ':by': reference,
+                            ':now': int(time.time()),
+                            ':expire': expire_at
+                        }
+                    }
+                },
+                {
+                    # And a record claims at most one distribution
+                    'Put': {
+                        'TableName': POOL_TABLE_NAME,
+                        'Item': {
+                            'distribution_id': claim_key(reference),
+                            'claimed_distribution_id': candidate['distribution_id'],
+                            'expire_at': expire_at
+                        },
+                        'ConditionExpression': 'attribute_not_exists(distribution_id)'
+                    }
+                }
+            ])
+            return candidate['distribution_id']
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = [reason.get('Code') for reason in e.response.get('CancellationReasons', [])]
+            if len(reasons) > 1 and reasons[1] == 'ConditionalCheckFailed':
+                # A concurrent attempt of the same record claimed one in the meantime
+                return find_claim(table, reference)
+            # The candidate was claimed by another record, or is being claimed right now
+    return None
+
+
+def apply_distribution_config(cloudfront_client, distribution_id, distribution_config):
+    # CloudFront requires the CallerReference the distribution was created with
+    current = cloudfront_client.get_distribution_config(Id=distribution_id)
+    distribution_config = dict(distribution_config, CallerReference=current['DistributionConfig']['CallerReference'])
+    return cloudfront_client.update_distribution(
+        Id=distribution_id,
+        IfMatch=current['ETag'],
+        DistributionConfig=distribution_config
+    )['Distribution']
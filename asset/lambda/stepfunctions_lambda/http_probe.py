@@ -0,0 +1,170 @@
+import asyncio
+import hashlib
+import math
+import ssl
+import time
+
+# Concurrent HTTP/1.1 probe used to compare a hostname served through two edges. It connects
+# to each target directly (no DNS lookup of the hostname itself) and sends the hostname as
+# SNI and Host header, so it works whatever the hostname currently resolves to. Targets
+# with tls=False are plain-http stand-ins, e.g. local test servers.
+
+# Headers that have to match between the two edges
+COMPARED_HEADERS = ['content-type', 'location', 'content-language']
+
+MAX_BODY_BYTES = 5 * 1024 * 1024
+
+
+def is_cache_hit(headers):
+    # Cloudflare: cf-cache-status: HIT, CloudFront: x-cache: Hit from cloudfront
+    if headers.get('cf-cache-status', '').upper() == 'HIT':
+        return True
+    return headers.get('x-cache', '').lower().startswith('hit')
+
+
+async def _read_body(reader, headers):
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        body = b''
+        while True:
+            size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+            if size == 0:
+                await reader.readline()
+                return body
+            body += await reader.readexactly(size)
+            await reader.readline()
+            if len(body) > MAX_BODY_BYTES:
+                return body
+    if 'content-length' in headers:
+        return await reader.readexactly(min(int(headers['content-length']), MAX_BODY_BYTES))
+    # Delimited by the server closing the connection, a single read only returns what has arrived so far
+    body = b''
+    while len(body) < MAX_BODY_BYTES:
+        chunk = await reader.read(MAX_BODY_BYTES - len(body))
+        if not chunk:
+            break
+        body += chunk
+    return body
+
+
+async def fetch(target, hostname, path, timeout):
+    # One request on a fresh connection, so every sample includes the connection setup a new visitor sees
+    ssl_context = None
+    if target.get('tls', True):
+        ssl_context = ssl.create_default_context()
+    started = time.perf_counter()
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(
+            target['connect_host'],
+            target.get('port', 443 if ssl_context else 80),
+            ssl=ssl_context,
+            server_hostname=hostname if ssl_context else None
+        ),
+        timeout
+    )
+    try:
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {hostname}\r\n"
+            "User-Agent: cflare-auto-migration-verifier\r\n"
+            "Accept-Encoding: identity\r\n"
+            "Connection: close\r\n\r\n"
+        )
+        writer.write(request.encode())
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        ttfb = time.perf_counter() - started
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        body = await asyncio.wait_for(_read_body(reader, headers), timeout)
+        return {
+            'status': status,
+            'headers': headers,
+            'body_sha256': hashlib.sha256(body).hexdigest(),
+            'ttfb_ms': ttfb * 1000
+        }
+    finally:
+        writer.close()
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def _most_common(values):
+    return max(set(values), key=values.count) if values else None
+
+
+async def probe(hostname, targets, paths, requests_per_path=10, concurrency=20, timeout=10):
+    # targets: {'cloudflare': {'connect_host': ..., 'port': ..., 'tls': ...}, 'cloudfront': {...}}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def sample(target_name, path):
+        async with semaphore:
+            try:
+                return target_name, path, await fetch(targets[target_name], hostname, path, timeout)
+            except Exception as e:
+                return target_name, path, {'error': f'{type(e).__name__}: {e}'}
+
+    samples = await asyncio.gather(*[
+        sample(target_name, path)
+        for target_name in targets
+        for path in paths
+        for _ in range(requests_per_path)
+    ])
+
+    results = {}
+    per_path = {}
+    for target_name in targets:
+        ok = [s for name, _, s in samples if name == target_name and 'error' not in s]
+        errors = [s['error'] for name, _, s in samples if name == target_name and 'error' in s]
+        ttfbs = [s['ttfb_ms'] for s in ok]
+        results[target_name] = {
+            'requests': len(ok) + len(errors),
+            'errors': len(errors),
+            'first_error': errors[0] if errors else '',
+            'ttfb_p50_ms': round(percentile(ttfbs, 50)) if ttfbs else -1,
+            'ttfb_p95_ms': round(percentile(ttfbs, 95)) if ttfbs else -1,
+            'cache_hit_percent': round(100 * sum(is_cache_hit(s['headers']) for s in ok) / len(ok)) if ok else 0
+        }
+        for path in paths:
+            path_samples = [s for name, p, s in samples if name == target_name and p == path and 'error' not in s]
+            per_path.setdefault(path, {})[target_name] = {
+                'status': _most_common([s['status'] for s in path_samples]),
+                'body_sha256': _most_common([s['body_sha256'] for s in path_samples]),
+                'headers': {h: _most_common([s['headers'].get(h, '') for s in path_samples]) for h in COMPARED_HEADERS}
+            }
+
+    mismatches = []
+    names = list(targets)
+    for path, by_target in per_path.items():
+        reference, other = by_target[names[0]], by_target[names[1]]
+        if reference['status'] is None or other['status'] is None:
+            continue  # only errors on one side, already counted above
+        if reference['status'] != other['status']:
+            mismatches.append(f"{path}: status {reference['status']} vs {other['status']}")
+            continue
+        for header in COMPARED_HEADERS:
+            if reference['headers'][header] != other['headers'][header]:
+                mismatches.append(f"{path}: {header} '{reference['headers'][header]}' vs '{other['headers'][header]}'")
+        # Bodies of error pages and redirects are edge-generated, only compare successful responses
+        if reference['status'] == 200 and reference['body_sha256'] != other['body_sha256']:
+            mismatches.append(f"{path}: body differs")
+
+    return {
+        'targets': results,
+        'mismatches': mismatches,
+        'match': not mismatches and all(r['errors'] == 0 for r in results.values())
+    }
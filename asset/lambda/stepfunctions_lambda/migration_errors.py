@@ -0,0 +1,88 @@
+import socket
+import urllib.error
+
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, ReadTimeoutError
+
+# The exception class name becomes the Step Functions error name, so the state machine
+# matches Retry blocks on these names. Keep them in sync with the stack definition.
+
+class RetryableError(Exception):
+    pass
+
+
+class ThrottledError(RetryableError):
+    # The API rejected the call because of rate limiting (AWS throttling, Cloudflare 429)
+    pass
+
+
+class TransientError(RetryableError):
+    # Server-side or network failure that is expected to go away on its own
+    pass
+
+
+class TerminalError(Exception):
+    # Anything retrying will not fix; the record is marked FAILED
+    pass
+
+
+THROTTLING_ERROR_CODES = {
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'RequestThrottled',
+    'RequestThrottledException',
+    'SlowDown',
+    'PriorRequestNotComplete',  # Route53 rejects concurrent changes to the same zone with this
+    'ProvisionedThroughputExceededException',
+    'TransactionConflictException',
+}
+
+TRANSIENT_ERROR_CODES = {
+    'InternalError',
+    'InternalFailure',
+    'InternalServerError',
+    'ServiceUnavailable',
+    'ServiceUnavailableException',
+    'WAFInternalErrorException',
+    'WAFUnavailableEntityException',
+    'RequestTimeout',
+    'RequestTimeoutException',
+    # Rollback deletes that wait on a previous delete to propagate
+    'DistributionNotDisabled',
+    'PreconditionFailed',
+    'ResourceInUseException',
+    'WAFAssociatedItemException',
+    'WAFOptimisticLockException',
+}
+
+
+def classify_error(e):
+    if isinstance(e, (RetryableError, TerminalError)):
+        return e
+
+    if isinstance(e, ClientError):
+        code = e.response.get('Error', {}).get('Code', '')
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        if code in THROTTLING_ERROR_CODES or status == 429:
+            return ThrottledError(str(e))
+        if code in TRANSIENT_ERROR_CODES or status >= 500:
+            return TransientError(str(e))
+        return TerminalError(str(e))
+
+    if isinstance(e, (BotocoreConnectionError, ReadTimeoutError)):
+        return TransientError(str(e))
+
+    # Cloudflare API calls go through urllib
+    if isinstance(e, urllib.error.HTTPError):
+        if e.code == 429:
+            return ThrottledError(f'Cloudflare API rate limited the request: {str(e)}')
+        if e.code >= 500:
+            return TransientError(f'Cloudflare API error: {str(e)}')
+        return TerminalError(f'Cloudflare API error: {str(e)}')
+
+    if isinstance(e, (urllib.error.URLError, socket.timeout, ConnectionError)):
+        return TransientError(str(e))
+
+    return TerminalError(str(e))
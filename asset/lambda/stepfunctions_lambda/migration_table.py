@@ -0,0 +1,157 @@
+import os
+import random
+import re
+import time
+
+import boto3
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+# Sort key of the per-migration summary item. It sits next to the per-record rows
+# (keyed on migration_id + dns_record) and holds the progress counters.
+SUMMARY_RECORD = '#SUMMARY'
+
+# Attempts at the summary counters, with full jitter, before the increment is dropped
+SUMMARY_UPDATE_ATTEMPTS = 4
+SUMMARY_RETRY_BASE_SECONDS = 0.1
+
+dynamodb_client = boto3.client('dynamodb')
+serializer = TypeSerializer()
+
+
+def step_counter_name(step_name):
+    # 'Create ACM Certificate' -> 'step_create_acm_certificate'
+    return 'step_' + re.sub(r'[^a-z0-9]+', '_', step_name.lower()).strip('_')
+
+
+def _record_update(table_name, migration_id, dns_record, step_name, status, error_message, resources):
+    update_expression = "SET step_name = :n, #status = :s, #time = :t"
+    names = {
+        '#status': 'status',
+        '#time': 'time'
+    }
+    values = {
+        ':n': step_name,
+        ':s': status,
+        ':t': int(time.time())
+    }
+    if error_message is not None:
+        update_expression += ", error_message = :e"
+        values[':e'] = error_message
+
+    # Resource ledger: everything the step created, so a rollback can tear it down
+    for i, (name, value) in enumerate((resources or {}).items()):
+        update_expression += f", resources.#r{i} = :r{i}"
+        names[f'#r{i}'] = name
+        values[f':r{i}'] = value
+
+    return {
+        'TableName': table_name,
+        'Key': {
+            'migration_id': serializer.serialize(migration_id),
+            'dns_record': serializer.serialize(dns_record)
+        },
+        'UpdateExpression': update_expression,
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': {k: serializer.serialize(v) for k, v in values.items()}
+    }
+
+
+def update_record_status(migration_id, dns_record, step_name, status, error_message=None, resources=None):
+    # Writes the record row (status and resource ledger), then bumps the summary counters, so
+    # progress can be read with a single GetItem on the summary item whatever the zone size.
+    # The summary item is shared by every record of the migration; only the row write can fail the step.
+    table_name = os.environ['TABLE_NAME']
+    record_update = _record_update(table_name, migration_id, dns_record, step_name, status, error_message, resources)
+
+    # Only count a transition once: a retried task or the error handler after a handler already
+    # marked the record FAILED must not bump the counters again.
+    if status == 'FAILED':
+        record_update['ConditionExpression'] = "#status <> :s"
+        counters = ['failed']
+    else:
+        record_update['ConditionExpression'] = "NOT (step_name = :n AND #status = :s)"
+        counters = [step_counter_name(step_name)]
+        if status == 'COMPLETED':
+            counters.append('completed')
+
+    try:
+        dynamodb_client.update_item(**record_update)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        # Already counted; still refresh the row (e.g. the error handler's detailed error message)
+        del record_update['ConditionExpression']
+        dynamodb_client.update_item(**record_update)
+        counters = []
+
+    # Every write bumps the version the history API derives its ETags from
+    apply_summary_delta(table_name, migration_id, counters + ['version'])
+
+
+def apply_summary_delta(table_name, migration_id, counters):
+    # Best effort and retried on its own: concurrent records contend on the summary item, and a
+    # lost increment only skews the progress display, while failing here would repeat a step
+    # whose side effects already happened. Called after the row write, so a reader never sees
+    # the new version with the old row.
+    for attempt in range(SUMMARY_UPDATE_ATTEMPTS):
+        try:
+            dynamodb_client.update_item(
+                TableName=table_name,
+                Key={
+                    'migration_id': serializer.serialize(migration_id),
+                    'dns_record': serializer.serialize(SUMMARY_RECORD)
+                },
+                UpdateExpression='ADD ' + ', '.join(f'#c{i} :one' for i in range(len(counters))),
+                ExpressionAttributeNames={f'#c{i}': counter for i, counter in enumerate(counters)},
+                ExpressionAttributeValues={':one': {'N': '1'}}
+            )
+            return
+        except Exception as e:
+            print(f"Summary update {counters} of {migration_id} failed (attempt {attempt + 1}): {str(e)}")
+            time.sleep(random.uniform(0, SUMMARY_RETRY_BASE_SECONDS * 2 ** attempt))
+    print(f"Gave up on summary update {counters} of {migration_id}")
+
+
+def bump_version(table_name, migration_id):
+    apply_summary_delta(table_name, migration_id, ['version'])
+
+
+def record_resources(migration_id, dns_record, resources):
+    # Adds to the resource ledger ahead of a change the step makes, status and counters are left alone
+    names = {}
+    values = {}
+    for i, (name, value) in enumerate(resources.items()):
+        names[f'#r{i}'] = name
+        values[f':r{i}'] = serializer.serialize(value)
+    dynamodb_client.update_item(
+        TableName=os.environ['TABLE_NAME'],
+        Key={
+            'migration_id': serializer.serialize(migration_id),
+            'dns_record': serializer.serialize(dns_record)
+        },
+        UpdateExpression='SET ' + ', '.join(f'resources.#r{i} = :r{i}' for i in range(len(resources))),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
+
+
+def set_rollback_status(migration_id, dns_record, status, error_message=''):
+    # Rollback states (ROLLING_BACK, ROLLED_BACK, ROLLBACK_FAILED) are not part of the migration counters
+    record_update = _record_update(os.environ['TABLE_NAME'], migration_id, dns_record, 'Rollback', status, error_message, None)
+    dynamodb_client.update_item(**record_update)
+    bump_version(os.environ['TABLE_NAME'], migration_id)
+
+
+def set_verification(migration_id, dns_record, verification):
+    # Post-cutover probe results; status and counters are left alone
+    dynamodb_client.update_item(
+        TableName=os.environ['TABLE_NAME'],
+        Key={
+            'migration_id': serializer.serialize(migration_id),
+            'dns_record': serializer.serialize(dns_record)
+        },
+        UpdateExpression="SET verification = :v",
+        ExpressionAttributeValues={':v': serializer.serialize(verification)}
+    )
+    bump_version(os.environ['TABLE_NAME'], migration_id)
@@ -0,0 +1,145 @@
+import bisect
+import csv
+import gzip
+import ipaddress
+import os
+import socket
+from collections import Counter
+
+# Offline GeoIP/ASN index built with tools/build_geo_index.py and bundled with the Lambda code.
+# Without it every distribution keeps the defaults (no Origin Shield, PriceClass_100).
+GEO_INDEX_PATH = os.environ.get('GEO_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'geo_index.csv.gz'))
+
+DEFAULT_PRICE_CLASS = 'PriceClass_100'
+
+# Nearest Origin Shield region per country, falling back to the continent
+COUNTRY_SHIELD_REGIONS = {
+    'US': 'us-east-1', 'CA': 'us-east-1', 'MX': 'us-east-2',
+    'GB': 'eu-west-2', 'FR': 'eu-west-2', 'SE': 'eu-west-2', 'NO': 'eu-west-2', 'FI': 'eu-west-2',
+    'IE': 'eu-west-1', 'ES': 'eu-west-1', 'PT': 'eu-west-1',
+    'IL': 'eu-central-1', 'TR': 'eu-central-1',
+    'JP': 'ap-northeast-1', 'CN': 'ap-northeast-1', 'TW': 'ap-northeast-1',
+    'KR': 'ap-northeast-2',
+    'IN': 'ap-south-1', 'PK': 'ap-south-1', 'BD': 'ap-south-1', 'LK': 'ap-south-1',
+    'AE': 'ap-south-1', 'SA': 'ap-south-1', 'BH': 'ap-south-1', 'QA': 'ap-south-1', 'OM': 'ap-south-1', 'KW': 'ap-south-1',
+    'ZA': 'eu-west-1',
+}
+CONTINENT_SHIELD_REGIONS = {
+    'NA': 'us-east-1',
+    'SA': 'sa-east-1',
+    'EU': 'eu-central-1',
+    'AF': 'eu-west-1',
+    'AS': 'ap-southeast-1',
+    'OC': 'ap-southeast-2',
+}
+
+# Countries spanning the continent: origins west of WEST_LONGITUDE are closer to Oregon than to Virginia.
+# The index carries the longitude of these countries' ranges when it is built from City data.
+WEST_SHIELD_REGIONS = {'US': 'us-west-2', 'CA': 'us-west-2'}
+WEST_LONGITUDE = -100
+
+# Edge locations viewers of an origin in that continent are likely to use
+CONTINENT_PRICE_CLASSES = {
+    'NA': 'PriceClass_100',
+    'EU': 'PriceClass_100',
+    'AS': 'PriceClass_200',
+    'AF': 'PriceClass_200',
+    'SA': 'PriceClass_All',
+    'OC': 'PriceClass_All',
+}
+PRICE_CLASS_ORDER = ['PriceClass_100', 'PriceClass_200', 'PriceClass_All']
+
+# Origins on anycast CDN networks are not where their addresses geolocate, a shield region would be a guess
+ANYCAST_ASNS = {13335, 54113, 20940, 16625, 15169}
+
+# IPv4 addresses share the IPv6 integer space through their IPv4-mapped form
+IPV4_MAPPED_OFFSET = 0xFFFF00000000
+
+_index = None
+
+
+def address_to_int(address):
+    ip = ipaddress.ip_address(address)
+    return int(ip) + IPV4_MAPPED_OFFSET if ip.version == 4 else int(ip)
+
+
+def load_index(path=None):
+    # Loaded once per container; lookups are a bisect over the sorted range starts
+    global _index
+    if _index is not None and path is None:
+        return _index
+
+    index = {'geo': ([], [], []), 'asn': ([], [], [])}
+    source = path or GEO_INDEX_PATH
+    if os.path.exists(source):
+        with gzip.open(source, 'rt', newline='') as f:
+            for kind, start, end, value in csv.reader(f):
+                starts, ends, values = index[kind]
+                starts.append(int(start))
+                ends.append(int(end))
+                values.append(value)
+    else:
+        print(f"No origin geolocation index at {source}, using the default origin settings")
+
+    if path is None:
+        _index = index
+    return index
+
+
+def _find(ranges, value):
+    starts, ends, values = ranges
+    i = bisect.bisect_right(starts, value) - 1
+    if i >= 0 and value <= ends[i]:
+        return values[i]
+    return None
+
+
+def lookup(address, index=None):
+    # (country, continent, asn, longitude) of an address; parts missing from the index are None
+    index = index or load_index()
+    value = address_to_int(address)
+    geo = _find(index['geo'], value)
+    country, continent, longitude = (geo.split('/') + [None])[:3] if geo else (None, None, None)
+    asn = _find(index['asn'], value)
+    return country, continent, int(asn) if asn else None, int(longitude) if longitude else None
+
+
+def nearest_shield_region(country, continent, longitude):
+    if longitude is not None and longitude < WEST_LONGITUDE and country in WEST_SHIELD_REGIONS:
+        return WEST_SHIELD_REGIONS[country]
+    return COUNTRY_SHIELD_REGIONS.get(country) or CONTINENT_SHIELD_REGIONS.get(continent)
+
+
+def origin_addresses(origin_info):
+    # A/AAAA origins carry their addresses; hostnames are resolved the way CloudFront would
+    if origin_info.get('type') in ('A', 'AAAA'):
+        records = origin_info.get('records') or [{'value': origin_info['value']}]
+        return [record['value'] for record in records]
+    try:
+        return sorted({info[4][0] for info in socket.getaddrinfo(origin_info['value'], 443, proto=socket.IPPROTO_TCP)})
+    except socket.gaierror as e:
+        print(f"Could not resolve origin {origin_info['value']}: {e}")
+        return []
+
+
+def select_origin_placement(addresses, index=None):
+    # (Origin Shield region or None, price class) for the origin's addresses
+    shield_regions = Counter()
+    price_class = DEFAULT_PRICE_CLASS
+    for address in addresses:
+        try:
+            country, continent, asn, longitude = lookup(address, index)
+        except ValueError:
+            continue
+        if asn in ANYCAST_ASNS:
+            return None, DEFAULT_PRICE_CLASS
+        region = nearest_shield_region(country, continent, longitude)
+        if region:
+            shield_regions[region] += 1
+        # Round-robin origins spread over continents get the widest price class any of them needs
+        candidate = CONTINENT_PRICE_CLASSES.get(continent, DEFAULT_PRICE_CLASS)
+        if PRICE_CLASS_ORDER.index(candidate) > PRICE_CLASS_ORDER.index(price_class):
+            price_class = candidate
+
+    shield_region = shield_regions.most_common(1)[0][0] if shield_regions else None
+    return shield_region, price_class
@@ -15,25 +15,233 @@ function createLambdaRole(scope: Construct, id: string, policyStatements: cdk.aw
   return role;
 }
 
+// Sort key of the per-migration summary item (SUMMARY_RECORD in migration_table.py)
+const summaryRecord = '#SUMMARY';
+
+function createRecordFailureChain(
+  scope: Construct,
+  id: string,
+  migrationTable: cdk.aws_dynamodb.ITable,
+  next?: cdk.aws_stepfunctions.IChainable
+): cdk.aws_stepfunctions.IChainable {
+  // Marks the record FAILED with native DynamoDB calls instead of a Lambda invocation per failure.
+  // Expects $.failedStep and the catcher output in $.error.
+  const done = next ?? new cdk.aws_stepfunctions.Pass(scope, `Failure Handled - ${id}`);
+
+  // Lambda errors carry a JSON cause of which only errorMessage is kept, other causes are kept whole
+  const parseErrorCause = new cdk.aws_stepfunctions.Choice(scope, `Parse Error Cause - ${id}`);
+  const lambdaErrorCause = new cdk.aws_stepfunctions.Pass(scope, `Lambda Error Cause - ${id}`, {
+    parameters: {
+      'Cause': cdk.aws_stepfunctions.JsonPath.stringToJson(cdk.aws_stepfunctions.JsonPath.stringAt('$.error.Cause'))
+    },
+    resultPath: '$.parsedError',
+  });
+  const plainErrorCause = new cdk.aws_stepfunctions.Pass(scope, `Plain Error Cause - ${id}`, {
+    parameters: {
+      'Cause': { 'errorMessage': cdk.aws_stepfunctions.JsonPath.stringAt('$.error.Cause') }
+    },
+    resultPath: '$.parsedError',
+  });
+  const unknownErrorCause = new cdk.aws_stepfunctions.Pass(scope, `Unknown Error Cause - ${id}`, {
+    parameters: {
+      'Cause': { 'errorMessage': 'UnknownCause' }
+    },
+    resultPath: '$.parsedError',
+  });
+
+  const recordKey = {
+    'migration_id': cdk.aws_stepfunctions_tasks.DynamoAttributeValue.fromString(cdk.aws_stepfunctions.JsonPath.stringAt('$.migration_id')),
+    'dns_record': cdk.aws_stepfunctions_tasks.DynamoAttributeValue.fromString(cdk.aws_stepfunctions.JsonPath.stringAt('$.viewer_domain')),
+  };
+  const summaryKey = {
+    'migration_id': cdk.aws_stepfunctions_tasks.DynamoAttributeValue.fromString(cdk.aws_stepfunctions.JsonPath.stringAt('$.migration_id')),
+    'dns_record': cdk.aws_stepfunctions_tasks.DynamoAttributeValue.fromString(summaryRecord),
+  };
+  const failedRecordValues = {
+    ':n': cdk.aws_stepfunctions_tasks.DynamoAttributeValue.fromString(cdk.aws_stepfunctions.JsonPath.stringAt('$.failedStep')),
+    ':s': cdk.aws_stepfunctions_tasks.DynamoAttributeValue.fromString('FAILED'),
+    ':f': cdk.aws_stepfunctions_tasks.DynamoAttributeValue.fromString(cdk.aws_stepfunctions.JsonPath.stateEnteredTime),
+    ':e': cdk.aws_stepfunctions_tasks.DynamoAttributeValue.fromString(cdk.aws_stepfunctions.JsonPath.format('error_type: {}, error_message: {}',
+      cdk.aws_stepfunctions.JsonPath.stringAt('$.error.Error'),
+      cdk.aws_stepfunctions.JsonPath.stringAt('$.parsedError.Cause.errorMessage'))),
+  };
+  const failedRecordUpdate = 'SET step_name = :n, #status = :s, failed_at = :f, error_message = :e';
+
+  // Same writes as update_record_status: the row on its own, conditional so the failed counter
+  // only moves the first time the record fails, then the summary counters
+  const recordFailureTask = addServiceRetryPolicies(new cdk.aws_stepfunctions_tasks.DynamoUpdateItem(scope, `Record Failure - ${id}`, {
+    table: migrationTable,
+    key: recordKey,
+    updateExpression: failedRecordUpdate,
+    conditionExpression: '#status <> :s',
+    expressionAttributeNames: { '#status': 'status' },
+    expressionAttributeValues: failedRecordValues,
+    resultPath: cdk.aws_stepfunctions.JsonPath.DISCARD,
+  }));
+
+  // The handler already marked the record FAILED: still refresh the row with the detailed error message
+  const refreshFailedRecordTask = addServiceRetryPolicies(new cdk.aws_stepfunctions_tasks.DynamoUpdateItem(scope, `Refresh Failed Record - ${id}`, {
+    table: migrationTable,
+    key: recordKey,
+    updateExpression: failedRecordUpdate,
+    expressionAttributeNames: { '#status': 'status' },
+    expressionAttributeValues: failedRecordValues,
+    resultPath: cdk.aws_stepfunctions.JsonPath.DISCARD,
+  }));
+
+  // Bumped after the row write, so a reader never sees the new version with the old row
+  const countFailureTask = addServiceRetryPolicies(new cdk.aws_stepfunctions_tasks.DynamoUpdateItem(scope, `Count Failure - ${id}`, {
+    table: migrationTable,
+    key: summaryKey,
+    updateExpression: 'ADD failed :one, version :one',
+    expressionAttributeValues: {
+      ':one': cdk.aws_stepfunctions_tasks.DynamoAttributeValue.fromNumber(1),
+    },
+    resultPath: cdk.aws_stepfunctions.JsonPath.DISCARD,
+  }));
+  const bumpVersionTask = addServiceRetryPolicies(new cdk.aws_stepfunctions_tasks.DynamoUpdateItem(scope, `Bump Migration Version - ${id}`, {
+    table: migrationTable,
+    key: summaryKey,
+    updateExpression: 'ADD version :one',
+    expressionAttributeValues: {
+      ':one': cdk.aws_stepfunctions_tasks.DynamoAttributeValue.fromNumber(1),
+    },
+    resultPath: cdk.aws_stepfunctions.JsonPath.DISCARD,
+  }));
+
+  // Like the HandleError Lambda before, a failure that cannot be written does not fail the execution
+  const failureNotRecorded = new cdk.aws_stepfunctions.Pass(scope, `Failure Not Recorded - ${id}`);
+
+  parseErrorCause
+    .when(cdk.aws_stepfunctions.Condition.and(
+      cdk.aws_stepfunctions.Condition.isPresent('$.error.Cause'),
+      cdk.aws_stepfunctions.Condition.stringMatches('$.error.Cause', '{"errorMessage"*')
+    ), lambdaErrorCause)
+    .when(cdk.aws_stepfunctions.Condition.isPresent('$.error.Cause'), plainErrorCause)
+    .otherwise(unknownErrorCause);
+  lambdaErrorCause.next(recordFailureTask);
+  plainErrorCause.next(recordFailureTask);
+  unknownErrorCause.next(recordFailureTask);
+
+  recordFailureTask.addCatch(refreshFailedRecordTask, {
+    errors: ['DynamoDB.ConditionalCheckFailedException'],
+    resultPath: '$.recordFailureError'
+  }).addCatch(failureNotRecorded, {
+    errors: ['States.ALL'],
+    resultPath: '$.recordFailureError'
+  }).next(countFailureTask);
+
+  // The counters are best effort: a lost increment only skews the progress display
+  countFailureTask.addCatch(failureNotRecorded, {
+    errors: ['States.ALL'],
+    resultPath: '$.recordFailureError'
+  }).next(done);
+  refreshFailedRecordTask.addCatch(failureNotRecorded, {
+    errors: ['States.ALL'],
+    resultPath: '$.recordFailureError'
+  }).next(bumpVersionTask);
+  bumpVersionTask.addCatch(failureNotRecorded, {
+    errors: ['States.ALL'],
+    resultPath: '$.recordFailureError'
+  }).next(done);
+  failureNotRecorded.next(done);
+
+  return parseErrorCause;
+}
+
 function createHandleErrorTask(
   scope: Construct,
   stepName: string,
-  handleErrorLambda: cdk.aws_lambda.Function
+  recordFailure: cdk.aws_stepfunctions.IChainable
 ): cdk.aws_stepfunctions.IChainable {
-  // Step Function Task for handling errors dynamically
-  const handleErrorTask = new cdk.aws_stepfunctions_tasks.LambdaInvoke(scope, `Handle Error - ${stepName}`, {
-    lambdaFunction: handleErrorLambda,
-    resultPath: '$.errorInfo', // Use the dynamic resultPath input
-    payloadResponseOnly: true,
-    payload: cdk.aws_stepfunctions.TaskInput.fromObject({
-      "viewer_domain": cdk.aws_stepfunctions.JsonPath.stringAt("$.viewer_domain"),
-      "migration_id":  cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
-      "step_name": stepName,
-      "error": cdk.aws_stepfunctions.JsonPath.stringAt('$.error')
-    })
+  // Names the failed step and hands over to the record failure chain of the state machine
+  const handleErrorTask = new cdk.aws_stepfunctions.Pass(scope, `Handle Error - ${stepName}`, {
+    result: cdk.aws_stepfunctions.Result.fromString(stepName),
+    resultPath: '$.failedStep',
   });
 
-  return handleErrorTask;
+  return handleErrorTask.next(recordFailure);
+}
+
+// Retry policy for tasks whose API call was not admitted by the token buckets in the admission table.
+// Executions keep waiting in line (with full jitter so they don't retry in lockstep) instead of failing.
+const admissionRetryProps: cdk.aws_stepfunctions.RetryProps = {
+  errors: ['AdmissionDeniedError'],
+  interval: cdk.Duration.seconds(2),
+  backoffRate: 1.5,
+  maxDelay: cdk.Duration.seconds(60),
+  maxAttempts: 60,
+  jitterStrategy: cdk.aws_stepfunctions.JitterType.FULL,
+};
+
+// Retry policy for calls rejected by AWS throttling or Cloudflare 429s (ThrottledError raised by the handlers).
+const throttleRetryProps: cdk.aws_stepfunctions.RetryProps = {
+  errors: ['ThrottledError', 'Lambda.TooManyRequestsException'],
+  interval: cdk.Duration.seconds(5),
+  backoffRate: 2,
+  maxDelay: cdk.Duration.seconds(120),
+  maxAttempts: 8,
+  jitterStrategy: cdk.aws_stepfunctions.JitterType.FULL,
+};
+
+// Retry policy for 5xx and network failures (TransientError raised by the handlers).
+const transientRetryProps: cdk.aws_stepfunctions.RetryProps = {
+  errors: ['TransientError'],
+  interval: cdk.Duration.seconds(2),
+  backoffRate: 2,
+  maxDelay: cdk.Duration.seconds(30),
+  maxAttempts: 4,
+  jitterStrategy: cdk.aws_stepfunctions.JitterType.FULL,
+};
+
+function addRetryPolicies(task: cdk.aws_stepfunctions.TaskStateBase): cdk.aws_stepfunctions.TaskStateBase {
+  // TerminalError and anything unclassified are not retried and go straight to the catch handler
+  return task
+    .addRetry(admissionRetryProps)
+    .addRetry(throttleRetryProps)
+    .addRetry(transientRetryProps);
+}
+
+// Errors of direct service integrations are named '<Service>.<ErrorCode>'. Throttling and 5xx responses
+// the SDK has no type for come back as the service's generic exception.
+const serviceThrottleRetryProps: cdk.aws_stepfunctions.RetryProps = {
+  ...throttleRetryProps,
+  errors: [
+    'Acm.ThrottlingException',
+    'Acm.AcmException',
+    'CloudFront.CloudFrontException',
+    'Route53.ThrottlingException',
+    'Route53.PriorRequestNotCompleteException',
+    'Route53.Route53Exception',
+    'DynamoDb.ProvisionedThroughputExceededException',
+    'DynamoDb.RequestLimitExceededException',
+    'DynamoDB.ProvisionedThroughputExceededException',
+    'DynamoDB.RequestLimitExceeded',
+    'DynamoDB.ThrottlingException',
+  ],
+};
+
+const serviceTransientRetryProps: cdk.aws_stepfunctions.RetryProps = {
+  ...transientRetryProps,
+  errors: ['DynamoDb.InternalServerErrorException', 'DynamoDB.InternalServerErrorException', 'States.Timeout'],
+};
+
+function addServiceRetryPolicies(task: cdk.aws_stepfunctions.TaskStateBase): cdk.aws_stepfunctions.TaskStateBase {
+  return task
+    .addRetry(serviceThrottleRetryProps)
+    .addRetry(serviceTransientRetryProps);
+}
+
+// Express executions end after 5 minutes, so tasks of the provisioning workflow only retry
+// admission and throttling briefly and then hand the wait back to the Standard parent.
+const provisioningTimeout = cdk.Duration.minutes(5);
+const deferredErrors = ['AdmissionDeniedError', 'ThrottledError', 'Lambda.TooManyRequestsException'];
+
+function addProvisioningRetryPolicies(task: cdk.aws_stepfunctions.TaskStateBase): cdk.aws_stepfunctions.TaskStateBase {
+  return task
+    .addRetry({ ...admissionRetryProps, maxDelay: cdk.Duration.seconds(15), maxAttempts: 6 })
+    .addRetry({ ...throttleRetryProps, maxDelay: cdk.Duration.seconds(30), maxAttempts: 3 })
+    .addRetry(transientRetryProps);
 }
 
 export class CflareAutoMigrationStack extends cdk.Stack {
@@ -95,6 +303,16 @@ export class CflareAutoMigrationStack extends cdk.Stack {
               actions: ['states:*'],
               resources: ['*'],
             }),
+            new cdk.aws_iam.PolicyStatement({
+              effect: cdk.aws_iam.Effect.ALLOW,
+              actions: ['secretsmanager:CreateSecret', 'secretsmanager:DeleteSecret'],
+              resources: [`arn:aws:secretsmanager:${this.region}:${this.account}:secret:cflare-auto-migration/*`],
+            }),
+            new cdk.aws_iam.PolicyStatement({
+              effect: cdk.aws_iam.Effect.ALLOW,
+              actions: ['cloudfront:ListCachePolicies', 'cloudfront:CreateCachePolicy'],
+              resources: ['*'],
+            }),
           ],
         }),
       },
@@ -104,7 +322,7 @@ export class CflareAutoMigrationStack extends cdk.Stack {
       runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
       code: cdk.aws_lambda.Code.fromAsset(lambdaDir+'/quick-migration'),
       handler: 'index.lambda_handler',
-      timeout: cdk.Duration.seconds(15),
+      timeout: cdk.Duration.seconds(30),
       role: lambdaQuickMigrationRole,
     });
 
@@ -117,23 +335,76 @@ export class CflareAutoMigrationStack extends cdk.Stack {
     // add the integration to the resource
     apiQuickMigrationResource.addMethod('POST', lambdaQuickMigrationIntegration);
 
-    // lambda@edge function that triggers as origin request
-    const lambdaedgeIndexhtml = new cdk.aws_lambda.Function(this, 'LambdaEdgeIndexHtml', {
-      runtime: cdk.aws_lambda.Runtime.NODEJS_20_X,
-      code: cdk.aws_lambda.Code.fromInline(`'use strict';
-      exports.handler = (event, context, callback) => {
-        var request = event.Records[0].cf.request;
-        request.uri = request.uri.replace(/\\/$/,'\\/index.html');
-        return callback(null, request);
+    // cloudfront function that appends index.html to directory URIs as viewer request.
+    // It runs at the edge location before the cache lookup, so cache hits and misses share the rewritten key.
+    const indexHtmlRewriteFunction = new cdk.aws_cloudfront.Function(this, 'IndexHtmlRewriteFunction', {
+      runtime: cdk.aws_cloudfront.FunctionRuntime.JS_2_0,
+      comment: 'Append index.html to directory URIs',
+      code: cdk.aws_cloudfront.FunctionCode.fromInline(`function handler(event) {
+        var request = event.request;
+        request.uri = request.uri.replace(/\\/$/, '/index.html');
+        return request;
       }`),
-      handler: 'index.handler',
+    });
+
+    // HTML changes on every deploy: short edge TTL and browsers revalidate after a minute
+    const consoleHtmlCachePolicy = new cdk.aws_cloudfront.CachePolicy(this, 'ConsoleHtmlCachePolicy', {
+      comment: 'Short TTL for the console HTML pages',
+      defaultTtl: cdk.Duration.minutes(5),
+      minTtl: cdk.Duration.seconds(0),
+      maxTtl: cdk.Duration.hours(1),
+      enableAcceptEncodingGzip: true,
+      enableAcceptEncodingBrotli: true,
+    });
+    const consoleHtmlResponseHeadersPolicy = new cdk.aws_cloudfront.ResponseHeadersPolicy(this, 'ConsoleHtmlResponseHeadersPolicy', {
+      comment: 'Browser cache headers for the console HTML pages',
+      customHeadersBehavior: {
+        customHeaders: [
+          { header: 'Cache-Control', value: 'public, max-age=60, must-revalidate', override: true },
+        ],
+      },
+    });
+
+    // Stylesheets are fingerprinted (css/style.min.<hash>.css), a new build gets a new URL
+    const consoleAssetCachePolicy = new cdk.aws_cloudfront.CachePolicy(this, 'ConsoleAssetCachePolicy', {
+      comment: 'Long TTL for fingerprinted console assets',
+      defaultTtl: cdk.Duration.days(365),
+      minTtl: cdk.Duration.days(365),
+      maxTtl: cdk.Duration.days(365),
+      enableAcceptEncodingGzip: true,
+      enableAcceptEncodingBrotli: true,
+    });
+    const consoleAssetResponseHeadersPolicy = new cdk.aws_cloudfront.ResponseHeadersPolicy(this, 'ConsoleAssetResponseHeadersPolicy', {
+      comment: 'Immutable browser caching for fingerprinted console assets',
+      customHeadersBehavior: {
+        customHeaders: [
+          { header: 'Cache-Control', value: 'public, max-age=31536000, immutable', override: true },
+        ],
+      },
     });
 
     // Create DynamoDB table for Cloudflare to CloudFront migration tracking
     const migrationTable = new cdk.aws_dynamodb.Table(this, 'MigrationTable', {
       partitionKey: { name: 'migration_id', type: cdk.aws_dynamodb.AttributeType.STRING },
-      sortKey: { name: 'start_time', type: cdk.aws_dynamodb.AttributeType.NUMBER },
+      sortKey: { name: 'dns_record', type: cdk.aws_dynamodb.AttributeType.STRING },
+      billingMode: cdk.aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+      stream: cdk.aws_dynamodb.StreamViewType.NEW_IMAGE,
+      timeToLiveAttribute: 'expire_at',  // set on record rows once their migration is archived
+    });
+
+    // Finished migrations older than the retention window are compacted into one gzip JSONL object each
+    const migrationArchiveBucket = new cdk.aws_s3.Bucket(this, 'MigrationArchiveBucket', {
+      blockPublicAccess: cdk.aws_s3.BlockPublicAccess.BLOCK_ALL,
+      encryption: cdk.aws_s3.BucketEncryption.S3_MANAGED,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+      autoDeleteObjects: true,
+    });
+
+    // Create DynamoDB table holding the token buckets shared by all migration executions (admission control)
+    const admissionTable = new cdk.aws_dynamodb.Table(this, 'AdmissionTable', {
+      partitionKey: { name: 'bucket_id', type: cdk.aws_dynamodb.AttributeType.STRING },
       billingMode: cdk.aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
     });
 
     const MigrationHistoryLambdaRole = createLambdaRole(this, 'MigrationHistory', []);
@@ -148,6 +419,36 @@ export class CflareAutoMigrationStack extends cdk.Stack {
       }
     });
     migrationTable.grantReadData(lambdaMigrationHistory)
+    migrationArchiveBucket.grantRead(lambdaMigrationHistory)
+
+    const ArchiveMigrationsLambdaRole = createLambdaRole(this, 'ArchiveMigrations', [
+      new cdk.aws_iam.PolicyStatement({
+        effect: cdk.aws_iam.Effect.ALLOW,
+        actions: ['secretsmanager:DeleteSecret'],
+        resources: [`arn:aws:secretsmanager:${this.region}:${this.account}:secret:cflare-auto-migration/*`],
+      })
+    ]);
+    const lambdaArchiveMigrations = new cdk.aws_lambda.Function(this, 'lambdaArchiveMigrations', {
+      runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
+      code: cdk.aws_lambda.Code.fromAsset(lambdaDir+'/archive-migrations'),
+      handler: 'index.lambda_handler',
+      timeout: cdk.Duration.minutes(15),
+      memorySize: 512,
+      role: ArchiveMigrationsLambdaRole,
+      environment: {
+        TABLE_NAME: migrationTable.tableName,
+        ARCHIVE_BUCKET_NAME: migrationArchiveBucket.bucketName,
+        RETENTION_DAYS: '30',
+      }
+    });
+    migrationTable.grantReadWriteData(lambdaArchiveMigrations)
+    migrationArchiveBucket.grantPut(lambdaArchiveMigrations)
+
+    // run the archival once a day
+    new cdk.aws_events.Rule(this, 'ArchiveMigrationsSchedule', {
+      schedule: cdk.aws_events.Schedule.rate(cdk.Duration.days(1)),
+      targets: [new cdk.aws_events_targets.LambdaFunction(lambdaArchiveMigrations)],
+    });
 
     // create a lambda integration with the API gateway and the lambda function
     const lambdaMigrationHistoryIntegration = new cdk.aws_apigateway.LambdaIntegration(lambdaMigrationHistory);
@@ -158,31 +459,106 @@ export class CflareAutoMigrationStack extends cdk.Stack {
     // add the integration to the resource
     apiMigrationHistoryResource.addMethod('GET', lambdaMigrationHistoryIntegration);
 
+    // Create DynamoDB table for the migration change feed (compact deltas of MigrationTable writes)
+    const migrationChangesTable = new cdk.aws_dynamodb.Table(this, 'MigrationChangesTable', {
+      partitionKey: { name: 'migration_id', type: cdk.aws_dynamodb.AttributeType.STRING },
+      sortKey: { name: 'change_id', type: cdk.aws_dynamodb.AttributeType.STRING },
+      billingMode: cdk.aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+      timeToLiveAttribute: 'expire_at',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    // lambda function that turns the MigrationTable stream into change feed entries
+    const MigrationChangesStreamLambdaRole = createLambdaRole(this, 'MigrationChangesStream', []);
+    const lambdaMigrationChangesStream = new cdk.aws_lambda.Function(this, 'lambdaMigrationChangesStream', {
+      runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
+      code: cdk.aws_lambda.Code.fromAsset(lambdaDir+'/migration-changes-stream'),
+      handler: 'index.lambda_handler',
+      timeout: cdk.Duration.seconds(30),
+      role: MigrationChangesStreamLambdaRole,
+      environment: {
+        CHANGES_TABLE_NAME: migrationChangesTable.tableName,
+      }
+    });
+    lambdaMigrationChangesStream.addEventSource(new cdk.aws_lambda_event_sources.DynamoEventSource(migrationTable, {
+      startingPosition: cdk.aws_lambda.StartingPosition.LATEST,
+      batchSize: 100,
+      maxBatchingWindow: cdk.Duration.seconds(1),
+      retryAttempts: 3,
+    }));
+    migrationChangesTable.grantWriteData(lambdaMigrationChangesStream)
+
+    // long-poll lambda function returning the changes after a cursor
+    const MigrationChangesLambdaRole = createLambdaRole(this, 'MigrationChanges', []);
+    const lambdaMigrationChanges = new cdk.aws_lambda.Function(this, 'lambdaMigrationChanges', {
+      runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
+      code: cdk.aws_lambda.Code.fromAsset(lambdaDir+'/migration-changes'),
+      handler: 'index.lambda_handler',
+      timeout: cdk.Duration.seconds(28),
+      role: MigrationChangesLambdaRole,
+      environment: {
+        CHANGES_TABLE_NAME: migrationChangesTable.tableName,
+      }
+    });
+    migrationChangesTable.grantReadData(lambdaMigrationChanges)
+
+    // create a lambda integration with the API gateway and the lambda function
+    const lambdaMigrationChangesIntegration = new cdk.aws_apigateway.LambdaIntegration(lambdaMigrationChanges);
+
+    // create a resource and map it to the lambda integration
+    const apiMigrationChangesResource = apiGateway.root.addResource('migration-changes');
+
+    // add the integration to the resource
+    apiMigrationChangesResource.addMethod('GET', lambdaMigrationChangesIntegration);
+
+
+    // API responses are only cached when the Lambda says so (finished and archived migrations in
+    // migration-history), everything else has no Cache-Control and a zero default TTL. The edge
+    // compresses with gzip or brotli, which API Gateway cannot do.
+    const consoleApiCachePolicy = new cdk.aws_cloudfront.CachePolicy(this, 'ConsoleApiCachePolicy', {
+      comment: 'Origin-controlled caching for the console API',
+      defaultTtl: cdk.Duration.seconds(0),
+      minTtl: cdk.Duration.seconds(0),
+      maxTtl: cdk.Duration.days(1),
+      queryStringBehavior: cdk.aws_cloudfront.CacheQueryStringBehavior.all(),
+      enableAcceptEncodingGzip: true,
+      enableAcceptEncodingBrotli: true,
+    });
 
     // create a cloudfront distribution with the S3 bucket, OAC, and the api gateway.
+    const htmlOrigin = new cdk.aws_cloudfront_origins.S3Origin(htmlBucket, {
+      originAccessIdentity: cloudfrontOAC,
+    });
     const cloudfrontDistributionS3WithError = new cdk.aws_cloudfront.Distribution(this, 'CflareAutoMigrationDistributionS3WithError', {
       defaultRootObject: 'index.html',
       defaultBehavior: {
-        origin: new cdk.aws_cloudfront_origins.S3Origin(htmlBucket, {
-          originAccessIdentity: cloudfrontOAC,
-        }),
-        edgeLambdas: [
+        origin: htmlOrigin,
+        functionAssociations: [
           {
-            functionVersion: lambdaedgeIndexhtml.currentVersion,
-            eventType: cdk.aws_cloudfront.LambdaEdgeEventType.ORIGIN_REQUEST,
+            function: indexHtmlRewriteFunction,
+            eventType: cdk.aws_cloudfront.FunctionEventType.VIEWER_REQUEST,
           },
         ],
+        cachePolicy: consoleHtmlCachePolicy,
+        responseHeadersPolicy: consoleHtmlResponseHeadersPolicy,
         viewerProtocolPolicy: cdk.aws_cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
       },
       additionalBehaviors: {
+        '/css/*': {
+          origin: htmlOrigin,
+          cachePolicy: consoleAssetCachePolicy,
+          responseHeadersPolicy: consoleAssetResponseHeadersPolicy,
+          viewerProtocolPolicy: cdk.aws_cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
+        },
         '/api/*': {
           origin: new cdk.aws_cloudfront_origins.RestApiOrigin(apiGateway, {
             originPath: '',
           }),
           allowedMethods: cdk.aws_cloudfront.AllowedMethods.ALLOW_ALL,
           viewerProtocolPolicy: cdk.aws_cloudfront.ViewerProtocolPolicy.REDIRECT_TO_HTTPS,
-          cachePolicy: cdk.aws_cloudfront.CachePolicy.CACHING_DISABLED,
+          cachePolicy: consoleApiCachePolicy,
           originRequestPolicy: cdk.aws_cloudfront.OriginRequestPolicy.ALL_VIEWER_EXCEPT_HOST_HEADER,
+          compress: true,
         },
       },
       errorResponses: [
@@ -219,6 +595,13 @@ export class CflareAutoMigrationStack extends cdk.Stack {
     // create a stepfunction to deploy cloudfront distributions in a DNS Zone.
     const account = cdk.Stack.of(this).account;
 
+    // Cloudflare API tokens are stored per migration by quick-migration and read by the Cloudflare-facing steps
+    const cloudflareSecretReadStatement = new cdk.aws_iam.PolicyStatement({
+      effect: cdk.aws_iam.Effect.ALLOW,
+      actions: ['secretsmanager:GetSecretValue'],
+      resources: [`arn:aws:secretsmanager:${this.region}:${this.account}:secret:cflare-auto-migration/*`],
+    });
+
     // Lambda function definitions
     const createACMCertificateLambdaRole = createLambdaRole(this, 'CreateACMCertificate', [
       new cdk.aws_iam.PolicyStatement({
@@ -235,6 +618,7 @@ export class CflareAutoMigrationStack extends cdk.Stack {
       role: createACMCertificateLambdaRole,
       environment: {
         TABLE_NAME: migrationTable.tableName,
+        ADMISSION_TABLE_NAME: admissionTable.tableName,
       }
     });
 
@@ -249,6 +633,7 @@ export class CflareAutoMigrationStack extends cdk.Stack {
         actions: ['route53:ChangeResourceRecordSets'],
         resources: ['arn:aws:route53:::hostedzone/*'],
       }),
+      cloudflareSecretReadStatement,
     ]);
     const createValidationRecordInCloudflareLambda = new cdk.aws_lambda.Function(this, 'CreateValidationRecordInCloudflareLambda', {
       runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
@@ -258,29 +643,17 @@ export class CflareAutoMigrationStack extends cdk.Stack {
       role: createValidationRecordInCloudflareLambdaRole,
       environment: {
         TABLE_NAME: migrationTable.tableName,
+        ADMISSION_TABLE_NAME: admissionTable.tableName,
       }
     });
 
-    const checkValidationStatusLambdaRole = createLambdaRole(this, 'checkValidationStatus', [
-      new cdk.aws_iam.PolicyStatement({
-        effect: cdk.aws_iam.Effect.ALLOW,
-        actions: ['acm:DescribeCertificate'],
-        resources: [`arn:aws:acm:us-east-1:${this.account}:certificate/*`],
-      })
-    ]);
-    const checkValidationStatusLambda = new cdk.aws_lambda.Function(this, 'CheckValidationStatusLambda', {
-      runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
-      handler: 'CheckValidationStatus.lambda_handler',
-      code: cdk.aws_lambda.Code.fromAsset(lambdaDir + '/stepfunctions_lambda'),
-      role: checkValidationStatusLambdaRole
-    });
-
     const createOriginRecordLambdaRole = createLambdaRole(this, 'createOriginRecord', [
       new cdk.aws_iam.PolicyStatement({
         effect: cdk.aws_iam.Effect.ALLOW,
         actions: ['route53:ChangeResourceRecordSets', 'route53:GetHostedZone', 'route53:ListResourceRecordSets'],
         resources: ['arn:aws:route53:::hostedzone/*'],
-      })
+      }),
+      cloudflareSecretReadStatement,
     ]);
     const createOriginRecordLambda = new cdk.aws_lambda.Function(this, 'CreateOriginRecordLambda', {
       runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
@@ -290,13 +663,14 @@ export class CflareAutoMigrationStack extends cdk.Stack {
       role: createOriginRecordLambdaRole,
       environment: {
         TABLE_NAME: migrationTable.tableName,
+        ADMISSION_TABLE_NAME: admissionTable.tableName,
       }
     });
 
     const createWebACLLambdaRole = createLambdaRole(this, 'createWebACL', [
       new cdk.aws_iam.PolicyStatement({
         effect: cdk.aws_iam.Effect.ALLOW,
-        actions: ['wafv2:CreateWebACL'],
+        actions: ['wafv2:CreateWebACL', 'wafv2:ListWebACLs'],
         resources: ['*'],
       })
     ]);
@@ -308,13 +682,14 @@ export class CflareAutoMigrationStack extends cdk.Stack {
       role: createWebACLLambdaRole,
       environment: {
         TABLE_NAME: migrationTable.tableName,
+        ADMISSION_TABLE_NAME: admissionTable.tableName,
       }
     });
 
     const createCloudFrontDistributionLambdaRole = createLambdaRole(this, 'createCloudFrontDistribution', [
       new cdk.aws_iam.PolicyStatement({
         effect: cdk.aws_iam.Effect.ALLOW,
-        actions: ['cloudfront:CreateDistribution', 'wafv2:GetWebACL', 'wafv2:ListWebACLs'],
+        actions: ['cloudfront:CreateDistribution', 'cloudfront:GetDistributionConfig', 'cloudfront:UpdateDistribution', 'cloudfront:ListDistributions', 'wafv2:GetWebACL', 'wafv2:ListWebACLs'],
         resources: ['*'],
       })
     ]);
@@ -323,54 +698,128 @@ export class CflareAutoMigrationStack extends cdk.Stack {
       handler: 'CreateCloudFrontDistribution.lambda_handler',
       code: cdk.aws_lambda.Code.fromAsset(lambdaDir + '/stepfunctions_lambda'),
       timeout: cdk.Duration.seconds(30),
+      // Room for the origin geolocation index, loaded once per container
+      memorySize: 512,
       role: createCloudFrontDistributionLambdaRole,
       environment: {
         CACHE_POLICY_ID: custom_cloudflareCachePolicy.cachePolicyId,
         TABLE_NAME: migrationTable.tableName,
+        ADMISSION_TABLE_NAME: admissionTable.tableName,
       }
     });
 
-    const checkCFDistributionStatusLambdaRole = createLambdaRole(this, 'checkCFDistributionStatus', [
+    // Optional pool of Deployed distributions, enabled with `cdk deploy -c distributionPoolSize=<n>`.
+    // Records claim one and update it instead of creating and deploying a new distribution.
+    const distributionPoolSize = Number(this.node.tryGetContext('distributionPoolSize') ?? 0);
+    if (distributionPoolSize > 0) {
+      const distributionPoolTable = new cdk.aws_dynamodb.Table(this, 'DistributionPoolTable', {
+        partitionKey: { name: 'distribution_id', type: cdk.aws_dynamodb.AttributeType.STRING },
+        billingMode: cdk.aws_dynamodb.BillingMode.PAY_PER_REQUEST,
+        removalPolicy: cdk.RemovalPolicy.DESTROY,
+        timeToLiveAttribute: 'expire_at',  // set on claimed rows
+      });
+      distributionPoolTable.addGlobalSecondaryIndex({
+        indexName: 'status-index',
+        partitionKey: { name: 'status', type: cdk.aws_dynamodb.AttributeType.STRING },
+        sortKey: { name: 'created_at', type: cdk.aws_dynamodb.AttributeType.NUMBER },
+      });
+      distributionPoolTable.addGlobalSecondaryIndex({
+        indexName: 'claimed-by-index',
+        partitionKey: { name: 'claimed_by', type: cdk.aws_dynamodb.AttributeType.STRING },
+      });
+
+      const replenishDistributionPoolLambdaRole = createLambdaRole(this, 'replenishDistributionPool', [
+        new cdk.aws_iam.PolicyStatement({
+          effect: cdk.aws_iam.Effect.ALLOW,
+          actions: ['cloudfront:CreateDistribution', 'cloudfront:GetDistribution', 'cloudfront:ListDistributions'],
+          resources: ['*'],
+        })
+      ]);
+      const replenishDistributionPoolLambda = new cdk.aws_lambda.Function(this, 'ReplenishDistributionPoolLambda', {
+        runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
+        handler: 'ReplenishDistributionPool.lambda_handler',
+        code: cdk.aws_lambda.Code.fromAsset(lambdaDir + '/stepfunctions_lambda'),
+        timeout: cdk.Duration.seconds(60),
+        role: replenishDistributionPoolLambdaRole,
+        environment: {
+          CACHE_POLICY_ID: custom_cloudflareCachePolicy.cachePolicyId,
+          POOL_TABLE_NAME: distributionPoolTable.tableName,
+          POOL_SIZE: String(distributionPoolSize),
+          REPLENISH_BATCH: String(this.node.tryGetContext('distributionPoolReplenishBatch') ?? 2),
+          ADMISSION_TABLE_NAME: admissionTable.tableName,
+        },
+      });
+      distributionPoolTable.grantReadWriteData(replenishDistributionPoolLambda)
+      admissionTable.grantReadWriteData(replenishDistributionPoolLambda)
+
+      // top the pool up, and promote distributions that finished deploying
+      new cdk.aws_events.Rule(this, 'ReplenishDistributionPoolSchedule', {
+        schedule: cdk.aws_events.Schedule.rate(cdk.Duration.minutes(Number(this.node.tryGetContext('distributionPoolReplenishMinutes') ?? 5))),
+        targets: [new cdk.aws_events_targets.LambdaFunction(replenishDistributionPoolLambda)],
+      });
+
+      createCloudFrontDistributionLambda.addEnvironment('POOL_TABLE_NAME', distributionPoolTable.tableName);
+      distributionPoolTable.grantReadWriteData(createCloudFrontDistributionLambda)
+    }
+
+    // TTL of the migrated hostnames around the cutover, and of their CNAME once Route53 is INSYNC
+    const cutoverTtl = '60';
+    const finalTtl = '3600';
+
+    const updateDNSRecordLambdaRole = createLambdaRole(this, 'updateDNSRecord', [
       new cdk.aws_iam.PolicyStatement({
         effect: cdk.aws_iam.Effect.ALLOW,
-        actions: ['cloudfront:GetDistribution'],
-        resources: ['*'],
+        actions: ['route53:ChangeResourceRecordSets', 'route53:ListResourceRecordSets'],
+        resources: ['arn:aws:route53:::hostedzone/*'],
       })
     ]);
-    const checkCFDistributionStatusLambda = new cdk.aws_lambda.Function(this, 'CheckCFDistributionStatusLambda', {
+    const updateDNSRecordLambda = new cdk.aws_lambda.Function(this, 'UpdateDNSRecordLambda', {
       runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
-      handler: 'CheckCFDistributionStatus.lambda_handler',
+      handler: 'UpdateDNSRecord.lambda_handler',
       code: cdk.aws_lambda.Code.fromAsset(lambdaDir + '/stepfunctions_lambda'),
-      role: checkCFDistributionStatusLambdaRole
+      timeout: cdk.Duration.seconds(10),
+      role: updateDNSRecordLambdaRole,
+      environment: {
+        TABLE_NAME: migrationTable.tableName,
+        ADMISSION_TABLE_NAME: admissionTable.tableName,
+        CUTOVER_TTL: cutoverTtl,
+      },
     });
 
-    const updateDNSRecordLambdaRole = createLambdaRole(this, 'updateDNSRecord', [
+    const raiseDNSRecordTTLLambdaRole = createLambdaRole(this, 'raiseDNSRecordTTL', [
       new cdk.aws_iam.PolicyStatement({
         effect: cdk.aws_iam.Effect.ALLOW,
-        actions: ['route53:ChangeResourceRecordSets', 'route53:ListResourceRecordSets'],
+        actions: ['route53:ChangeResourceRecordSets'],
         resources: ['arn:aws:route53:::hostedzone/*'],
       })
     ]);
-    const updateDNSRecordLambda = new cdk.aws_lambda.Function(this, 'UpdateDNSRecordLambda', {
+    const raiseDNSRecordTTLLambda = new cdk.aws_lambda.Function(this, 'RaiseDNSRecordTTLLambda', {
       runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
-      handler: 'UpdateDNSRecord.lambda_handler',
+      handler: 'RaiseDNSRecordTTL.lambda_handler',
       code: cdk.aws_lambda.Code.fromAsset(lambdaDir + '/stepfunctions_lambda'),
       timeout: cdk.Duration.seconds(10),
-      role: updateDNSRecordLambdaRole,
+      role: raiseDNSRecordTTLLambdaRole,
       environment: {
         TABLE_NAME: migrationTable.tableName,
+        ADMISSION_TABLE_NAME: admissionTable.tableName,
+        FINAL_TTL: finalTtl,
       },
     });
 
-    const HandleErrorLambdaRole = createLambdaRole(this, 'HandleError', []);
-    const handleErrorLambda = new cdk.aws_lambda.Function(this, 'HandleErrorLambda', {
+    const verifyMigrationLambdaRole = createLambdaRole(this, 'verifyMigration', []);
+    const verifyMigrationLambda = new cdk.aws_lambda.Function(this, 'VerifyMigrationLambda', {
       runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
-      handler: 'HandleError.lambda_handler',
+      handler: 'VerifyMigration.lambda_handler',
       code: cdk.aws_lambda.Code.fromAsset(lambdaDir + '/stepfunctions_lambda'),
-      role: HandleErrorLambdaRole,
+      timeout: cdk.Duration.seconds(120),
+      memorySize: 512,
+      role: verifyMigrationLambdaRole,
       environment: {
-        TABLE_NAME: migrationTable.tableName
-      }
+        TABLE_NAME: migrationTable.tableName,
+        VERIFY_PATHS: '/',
+        VERIFY_REQUESTS_PER_PATH: '20',
+        VERIFY_CONCURRENCY: '20',
+      },
     });
 
     // Grant write permissions to the DynamoDB table
@@ -379,12 +828,25 @@ export class CflareAutoMigrationStack extends cdk.Stack {
     migrationTable.grantWriteData(createValidationRecordInCloudflareLambda)
     migrationTable.grantWriteData(createOriginRecordLambda)
     migrationTable.grantWriteData(createWebACLLambda)
-    migrationTable.grantWriteData(createCloudFrontDistributionLambda)
+    migrationTable.grantReadWriteData(createCloudFrontDistributionLambda)
     migrationTable.grantWriteData(updateDNSRecordLambda)
-    migrationTable.grantWriteData(handleErrorLambda)
+    migrationTable.grantWriteData(raiseDNSRecordTTLLambda)
+    migrationTable.grantWriteData(verifyMigrationLambda)
+
+    // Grant read/write permissions to the admission control token buckets
+    admissionTable.grantReadWriteData(createACMCertificateLambda)
+    admissionTable.grantReadWriteData(createValidationRecordInCloudflareLambda)
+    admissionTable.grantReadWriteData(createOriginRecordLambda)
+    admissionTable.grantReadWriteData(createWebACLLambda)
+    admissionTable.grantReadWriteData(createCloudFrontDistributionLambda)
+    admissionTable.grantReadWriteData(updateDNSRecordLambda)
+    admissionTable.grantReadWriteData(raiseDNSRecordTTLLambda)
     
     // Step Function Tasks
-    const createACMCertificateTask = new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Create ACM Certificate', {
+    // Failed records are written by native DynamoDB calls, one chain per state machine
+    const recordFailure = createRecordFailureChain(this, 'Migration', migrationTable);
+
+    const createACMCertificateTask = addRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Create ACM Certificate', {
       lambdaFunction: createACMCertificateLambda,
       resultPath: '$.certificateDetails',
       payloadResponseOnly: true,
@@ -392,7 +854,7 @@ export class CflareAutoMigrationStack extends cdk.Stack {
         "viewer_domain": cdk.aws_stepfunctions.JsonPath.stringAt("$.viewer_domain"),
         "migration_id":  cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
       })
-    }).addCatch(createHandleErrorTask(this, 'Create ACM Certificate', handleErrorLambda), {
+    })).addCatch(createHandleErrorTask(this, 'Create ACM Certificate', recordFailure), {
       errors: ['States.ALL'],
       resultPath: '$.error'
     });
@@ -401,30 +863,35 @@ export class CflareAutoMigrationStack extends cdk.Stack {
       time: cdk.aws_stepfunctions.WaitTime.duration(cdk.Duration.seconds(30))
     });
 
-    const createValidationRecordTask = new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Create Validation Record in Cloudflare', {
+    const createValidationRecordTask = addRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Create Validation Record in Cloudflare', {
       lambdaFunction: createValidationRecordInCloudflareLambda,
       resultPath: '$.validationDetails',
       payloadResponseOnly: true,
       payload: cdk.aws_stepfunctions.TaskInput.fromObject({
         "CertificateArn": cdk.aws_stepfunctions.JsonPath.stringAt("$.certificateDetails.CertificateArn"),
         "CloudflareZoneID": cdk.aws_stepfunctions.JsonPath.stringAt("$.CloudflareZoneID"),
-        "CloudflareAPIKey": cdk.aws_stepfunctions.JsonPath.stringAt("$.CloudflareAPIKey"),
+        "CloudflareSecretId": cdk.aws_stepfunctions.JsonPath.stringAt("$.CloudflareSecretId"),
         "ZoneID": cdk.aws_stepfunctions.JsonPath.stringAt("$.ZoneID"),
         "migration_id":  cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
       })
-    }).addCatch(createHandleErrorTask(this, 'Create Validation Record in Cloudflare', handleErrorLambda), {
+    })).addCatch(createHandleErrorTask(this, 'Create Validation Record in Cloudflare', recordFailure), {
       errors: ['States.ALL'],
       resultPath: '$.error'
     });
 
-    const checkValidationStatusTask = new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Check Validation Status', {
-      lambdaFunction: checkValidationStatusLambda,
-      resultPath: '$.validationStatus',
-      payloadResponseOnly: true,
-      payload: cdk.aws_stepfunctions.TaskInput.fromObject({
+    // Polling steps call the service directly instead of invoking a Lambda every round
+    const checkValidationStatusTask = addServiceRetryPolicies(new cdk.aws_stepfunctions_tasks.CallAwsService(this, 'Check Validation Status', {
+      service: 'acm',
+      action: 'describeCertificate',
+      iamResources: [`arn:aws:acm:us-east-1:${this.account}:certificate/*`],
+      parameters: {
         "CertificateArn": cdk.aws_stepfunctions.JsonPath.stringAt("$.certificateDetails.CertificateArn")
-      })
-    }).addCatch(createHandleErrorTask(this, 'Check Validation Status', handleErrorLambda), {
+      },
+      resultSelector: {
+        "ValidationStatus": cdk.aws_stepfunctions.JsonPath.stringAt("$.Certificate.DomainValidationOptions[0].ValidationStatus")
+      },
+      resultPath: '$.validationStatus',
+    })).addCatch(createHandleErrorTask(this, 'Check Validation Status', recordFailure), {
       errors: ['States.ALL'],
       resultPath: '$.error'
     });
@@ -435,7 +902,22 @@ export class CflareAutoMigrationStack extends cdk.Stack {
 
     const isValidatedChoice = new cdk.aws_stepfunctions.Choice(this, 'Is Validated?');
 
-    const createOriginRecordTask = new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Create Origin Record', {
+    // End states of the provisioning workflow; the parent branches on $.provisioningOutcome
+    const provisioningSucceeded = new cdk.aws_stepfunctions.Pass(this, 'Provisioning Succeeded', {
+      result: cdk.aws_stepfunctions.Result.fromString('SUCCEEDED'),
+      resultPath: '$.provisioningOutcome',
+    });
+    const provisioningDeferred = new cdk.aws_stepfunctions.Pass(this, 'Provisioning Deferred', {
+      result: cdk.aws_stepfunctions.Result.fromString('DEFERRED'),
+      resultPath: '$.provisioningOutcome',
+    });
+    const provisioningFailed = new cdk.aws_stepfunctions.Pass(this, 'Provisioning Failed', {
+      result: cdk.aws_stepfunctions.Result.fromString('FAILED'),
+      resultPath: '$.provisioningOutcome',
+    });
+    const recordProvisioningFailure = createRecordFailureChain(this, 'Provisioning', migrationTable, provisioningFailed);
+
+    const createOriginRecordTask = addProvisioningRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Create Origin Record', {
       lambdaFunction: createOriginRecordLambda,
       resultPath: '$.OriginDomain',
       payloadResponseOnly: true,
@@ -444,10 +926,13 @@ export class CflareAutoMigrationStack extends cdk.Stack {
         "origin_info": cdk.aws_stepfunctions.JsonPath.objectAt("$.origin_info"),
         "ZoneID": cdk.aws_stepfunctions.JsonPath.stringAt("$.ZoneID"),
         "CloudflareZoneID": cdk.aws_stepfunctions.JsonPath.stringAt("$.CloudflareZoneID"),
-        "CloudflareAPIKey": cdk.aws_stepfunctions.JsonPath.stringAt("$.CloudflareAPIKey"),
+        "CloudflareSecretId": cdk.aws_stepfunctions.JsonPath.stringAt("$.CloudflareSecretId"),
         "migration_id":  cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
       })
-    }).addCatch(createHandleErrorTask(this, 'Create Origin Record', handleErrorLambda), {
+    })).addCatch(provisioningDeferred, {
+      errors: deferredErrors,
+      resultPath: '$.error'
+    }).addCatch(createHandleErrorTask(this, 'Create Origin Record', recordProvisioningFailure), {
       errors: ['States.ALL'],
       resultPath: '$.error'
     });
@@ -461,16 +946,19 @@ export class CflareAutoMigrationStack extends cdk.Stack {
 
     const checkIfOriginIsIPChoice = new cdk.aws_stepfunctions.Choice(this, 'Check If Origin Is IP');
 
-    const createWebACLTask = new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Create Web ACL', {
+    const createWebACLTask = addProvisioningRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Create Web ACL', {
       lambdaFunction: createWebACLLambda,
       resultPath: '$.webAclDetails',
       payloadResponseOnly: true,
-    }).addCatch(createHandleErrorTask(this, 'Create Web ACL', handleErrorLambda), {
+    })).addCatch(provisioningDeferred, {
+      errors: deferredErrors,
+      resultPath: '$.error'
+    }).addCatch(createHandleErrorTask(this, 'Create Web ACL', recordProvisioningFailure), {
       errors: ['States.ALL'],
       resultPath: '$.error'
     });
 
-    const createCloudFrontDistributionTask = new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Create CloudFront Distribution', {
+    const createCloudFrontDistributionTask = addProvisioningRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Create CloudFront Distribution', {
       lambdaFunction: createCloudFrontDistributionLambda,
       resultPath: '$.distributionDetails',
       payloadResponseOnly: true,
@@ -479,33 +967,146 @@ export class CflareAutoMigrationStack extends cdk.Stack {
         "DomainName": cdk.aws_stepfunctions.JsonPath.stringAt("$.certificateDetails.DomainName"),
         "OriginDomain": cdk.aws_stepfunctions.JsonPath.stringAt("$.OriginDomain.OriginDomain"),
         "webAclArn": cdk.aws_stepfunctions.JsonPath.stringAt("$.webAclDetails.webAclArn"),
+        "origin_info": cdk.aws_stepfunctions.JsonPath.objectAt("$.origin_info"),
         "migration_id":  cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
       })
-    }).addCatch(createHandleErrorTask(this, 'Create CloudFront Distribution', handleErrorLambda), {
+    })).addCatch(provisioningDeferred, {
+      errors: deferredErrors,
+      resultPath: '$.error'
+    }).addCatch(createHandleErrorTask(this, 'Create CloudFront Distribution', recordProvisioningFailure), {
+      errors: ['States.ALL'],
+      resultPath: '$.error'
+    });
+
+    // The synchronous provisioning steps run as a nested Express workflow: its transitions are
+    // billed by duration instead of per transition, and it answers within seconds.
+    // A deferred run hands back what it already created, so the next run skips those steps.
+    const hasOriginDomainChoice = new cdk.aws_stepfunctions.Choice(this, 'Has Origin Domain?');
+    const hasWebACLChoice = new cdk.aws_stepfunctions.Choice(this, 'Has Web ACL?');
+
+    hasOriginDomainChoice
+      .when(cdk.aws_stepfunctions.Condition.isPresent('$.OriginDomain'), hasWebACLChoice)
+      .otherwise(checkIfOriginIsIPChoice);
+    checkIfOriginIsIPChoice
+      .when(cdk.aws_stepfunctions.Condition.stringEquals('$.origin_info.type', 'A'), createOriginRecordTask)
+      .otherwise(setOriginDomainDirectly);
+    createOriginRecordTask.next(hasWebACLChoice);
+    setOriginDomainDirectly.next(hasWebACLChoice);
+    hasWebACLChoice
+      .when(cdk.aws_stepfunctions.Condition.isPresent('$.webAclDetails'), createCloudFrontDistributionTask)
+      .otherwise(createWebACLTask);
+    createWebACLTask.next(createCloudFrontDistributionTask);
+    createCloudFrontDistributionTask.next(provisioningSucceeded);
+
+    const provisioningLambdaFunctions = [
+      createOriginRecordLambda,
+      createWebACLLambda,
+      createCloudFrontDistributionLambda,
+    ];
+
+    const provisioning_state_machine = new cdk.aws_stepfunctions.StateMachine(this, 'migrationProvisioning', {
+      definitionBody: cdk.aws_stepfunctions.DefinitionBody.fromChainable(hasOriginDomainChoice),
+      stateMachineType: cdk.aws_stepfunctions.StateMachineType.EXPRESS,
+      timeout: provisioningTimeout,
+      logs: {
+        destination: new cdk.aws_logs.LogGroup(this, 'MigrationProvisioningLogs', {
+          retention: cdk.aws_logs.RetentionDays.ONE_MONTH,
+          removalPolicy: cdk.RemovalPolicy.DESTROY,
+        }),
+        level: cdk.aws_stepfunctions.LogLevel.ERROR,
+      },
+    });
+
+    // The child gets the whole state and hands it back with OriginDomain, webAclDetails and distributionDetails added.
+    // It only fails without an outcome when it runs out of time, which marks the record FAILED.
+    const provisionResourcesTask = new cdk.aws_stepfunctions_tasks.StepFunctionsStartExecution(this, 'Provision Resources', {
+      stateMachine: provisioning_state_machine,
+      integrationPattern: cdk.aws_stepfunctions.IntegrationPattern.RUN_JOB,
+      input: cdk.aws_stepfunctions.TaskInput.fromJsonPathAt('$'),
+      outputPath: '$.Output',
+    }).addCatch(createHandleErrorTask(this, 'Provision Resources', recordFailure), {
       errors: ['States.ALL'],
       resultPath: '$.error'
     });
 
+    const provisioningOutcomeChoice = new cdk.aws_stepfunctions.Choice(this, 'Provisioning Outcome');
+
+    // Admission control queued a provisioning step for longer than an Express execution may run
+    const waitForProvisioningAdmission = new cdk.aws_stepfunctions.Wait(this, 'Wait For Provisioning Admission', {
+      time: cdk.aws_stepfunctions.WaitTime.duration(cdk.Duration.seconds(60))
+    });
+
+    // The child already marked the record FAILED
+    const provisioningEnded = new cdk.aws_stepfunctions.Pass(this, 'Provisioning Ended');
+
     const waitForCFDistribution = new cdk.aws_stepfunctions.Wait(this, 'Wait For CF Distribution', {
       time: cdk.aws_stepfunctions.WaitTime.duration(cdk.Duration.seconds(60))
     });
 
-    const checkCFDistributionStatusTask = new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Check CloudFront Distribution Status', {
-      lambdaFunction: checkCFDistributionStatusLambda,
+    const checkCFDistributionStatusTask = addServiceRetryPolicies(new cdk.aws_stepfunctions_tasks.CallAwsService(this, 'Check CloudFront Distribution Status', {
+      service: 'cloudfront',
+      action: 'getDistribution',
+      iamResources: [`arn:aws:cloudfront::${this.account}:distribution/*`],
+      parameters: {
+        "Id": cdk.aws_stepfunctions.JsonPath.stringAt("$.distributionDetails.DistributionId")
+      },
+      resultSelector: {
+        "Status": cdk.aws_stepfunctions.JsonPath.stringAt("$.Distribution.Status")
+      },
       resultPath: '$.distributionStatus',
+    })).addCatch(createHandleErrorTask(this, 'Check CloudFront Distribution Status', recordFailure), {
+      errors: ['States.ALL'],
+      resultPath: '$.error'
+    });
+
+    const isDistributionDeployedChoice = new cdk.aws_stepfunctions.Choice(this, 'IsDistributionDeployed');
+
+    const updateDNSRecordTask = addRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Update DNS Record', {
+      lambdaFunction: updateDNSRecordLambda,
+      resultPath: '$.dnsUpdate',
       payloadResponseOnly: true,
       payload: cdk.aws_stepfunctions.TaskInput.fromObject({
-        "DistributionId": cdk.aws_stepfunctions.JsonPath.stringAt("$.distributionDetails.DistributionId")
+        "viewer_domain": cdk.aws_stepfunctions.JsonPath.stringAt("$.viewer_domain"),
+        "CNAME": cdk.aws_stepfunctions.JsonPath.stringAt("$.distributionDetails.DistributionCname"),
+        "ZoneID": cdk.aws_stepfunctions.JsonPath.stringAt("$.ZoneID"),
+        "migration_id":  cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
       })
-    }).addCatch(createHandleErrorTask(this, 'Check CloudFront Distribution Status', handleErrorLambda), {
+    })).addCatch(createHandleErrorTask(this, 'Update DNS Record', recordFailure), {
       errors: ['States.ALL'],
       resultPath: '$.error'
     });
 
-    const isDistributionDeployedChoice = new cdk.aws_stepfunctions.Choice(this, 'IsDistributionDeployed');
+    // Records with a long TTL are lowered first and flipped once the lowered TTL is INSYNC and the old TTL ran out
+    const waitForOldTTL = new cdk.aws_stepfunctions.Wait(this, 'Wait For Old TTL', {
+      time: cdk.aws_stepfunctions.WaitTime.secondsPath('$.dnsUpdate.WaitSeconds')
+    });
 
-    const updateDNSRecordTask = new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Update DNS Record', {
-      lambdaFunction: updateDNSRecordLambda,
+    const waitForDNSChange = new cdk.aws_stepfunctions.Wait(this, 'Wait For DNS Change', {
+      time: cdk.aws_stepfunctions.WaitTime.duration(cdk.Duration.seconds(10))
+    });
+
+    // PENDING until every Route 53 authoritative name server serves the change
+    const checkDNSChangeStatusTask = addServiceRetryPolicies(new cdk.aws_stepfunctions_tasks.CallAwsService(this, 'Check DNS Change Status', {
+      service: 'route53',
+      action: 'getChange',
+      iamResources: ['arn:aws:route53:::change/*'],
+      parameters: {
+        "Id": cdk.aws_stepfunctions.JsonPath.stringAt("$.dnsUpdate.ChangeId")
+      },
+      resultSelector: {
+        "Status": cdk.aws_stepfunctions.JsonPath.stringAt("$.ChangeInfo.Status")
+      },
+      resultPath: '$.dnsChange',
+    })).addCatch(createHandleErrorTask(this, 'Check DNS Change Status', recordFailure), {
+      errors: ['States.ALL'],
+      resultPath: '$.error'
+    });
+
+    const isDNSChangeInSyncChoice = new cdk.aws_stepfunctions.Choice(this, 'IsDNSChangeInSync');
+
+    const raiseDNSRecordTTLTask = addRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Raise DNS TTL', {
+      lambdaFunction: raiseDNSRecordTTLLambda,
+      resultPath: '$.dnsTtl',
       payloadResponseOnly: true,
       payload: cdk.aws_stepfunctions.TaskInput.fromObject({
         "viewer_domain": cdk.aws_stepfunctions.JsonPath.stringAt("$.viewer_domain"),
@@ -513,7 +1114,24 @@ export class CflareAutoMigrationStack extends cdk.Stack {
         "ZoneID": cdk.aws_stepfunctions.JsonPath.stringAt("$.ZoneID"),
         "migration_id":  cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
       })
-    }).addCatch(createHandleErrorTask(this, 'Update DNS Record', handleErrorLambda), {
+    })).addCatch(createHandleErrorTask(this, 'Raise DNS TTL', recordFailure), {
+      errors: ['States.ALL'],
+      resultPath: '$.error'
+    });
+
+    // The record is COMPLETED once DNS is updated; a failed verification only ends the execution
+    const verificationSkipped = new cdk.aws_stepfunctions.Pass(this, 'Verification Skipped');
+
+    const verifyMigrationTask = addRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Verify Migration', {
+      lambdaFunction: verifyMigrationLambda,
+      resultPath: '$.verification',
+      payloadResponseOnly: true,
+      payload: cdk.aws_stepfunctions.TaskInput.fromObject({
+        "viewer_domain": cdk.aws_stepfunctions.JsonPath.stringAt("$.viewer_domain"),
+        "DistributionCname": cdk.aws_stepfunctions.JsonPath.stringAt("$.distributionDetails.DistributionCname"),
+        "migration_id":  cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
+      })
+    })).addCatch(verificationSkipped, {
       errors: ['States.ALL'],
       resultPath: '$.error'
     });
@@ -527,21 +1145,18 @@ export class CflareAutoMigrationStack extends cdk.Stack {
 
     // Define the validation choice
     isValidatedChoice
-      .when(cdk.aws_stepfunctions.Condition.stringEquals('$.validationStatus.ValidationStatus', 'SUCCESS'), checkIfOriginIsIPChoice)
+      .when(cdk.aws_stepfunctions.Condition.stringEquals('$.validationStatus.ValidationStatus', 'SUCCESS'), provisionResourcesTask)
       .otherwise(waitForCertValidation.next(checkValidationStatusTask));
 
-    // Define the origin choice
-    checkIfOriginIsIPChoice
-      .when(cdk.aws_stepfunctions.Condition.stringEquals('$.origin_info.type', 'A'), createOriginRecordTask)
-      .otherwise(setOriginDomainDirectly);
+    // Provision the origin record, WebACL and distribution in the Express child
+    provisionResourcesTask.next(provisioningOutcomeChoice);
 
-    // Continue the flow after origin choice
-    createOriginRecordTask.next(createWebACLTask);
-    setOriginDomainDirectly.next(createWebACLTask);
+    provisioningOutcomeChoice
+      .when(cdk.aws_stepfunctions.Condition.stringEquals('$.provisioningOutcome', 'SUCCEEDED'), waitForCFDistribution)
+      .when(cdk.aws_stepfunctions.Condition.stringEquals('$.provisioningOutcome', 'DEFERRED'), waitForProvisioningAdmission.next(provisionResourcesTask))
+      .otherwise(provisioningEnded);
 
-    createWebACLTask
-      .next(createCloudFrontDistributionTask)
-      .next(waitForCFDistribution)
+    waitForCFDistribution
       .next(checkCFDistributionStatusTask)
       .next(isDistributionDeployedChoice);
 
@@ -550,16 +1165,30 @@ export class CflareAutoMigrationStack extends cdk.Stack {
       .when(cdk.aws_stepfunctions.Condition.stringEquals('$.distributionStatus.Status', 'Deployed'), updateDNSRecordTask)
       .otherwise(waitForCFDistribution);
 
+    // The lowered TTL, and then the CNAME with its short TTL, until every Route53 name server serves it
+    updateDNSRecordTask.next(waitForDNSChange);
+
+    waitForDNSChange
+      .next(checkDNSChangeStatusTask)
+      .next(isDNSChangeInSyncChoice);
+
+    isDNSChangeInSyncChoice
+      .when(cdk.aws_stepfunctions.Condition.and(
+        cdk.aws_stepfunctions.Condition.stringEquals('$.dnsChange.Status', 'INSYNC'),
+        cdk.aws_stepfunctions.Condition.stringEquals('$.dnsUpdate.status', 'ttl_lowered')
+      ), waitForOldTTL.next(updateDNSRecordTask))
+      .when(cdk.aws_stepfunctions.Condition.stringEquals('$.dnsChange.Status', 'INSYNC'), raiseDNSRecordTTLTask)
+      .otherwise(waitForDNSChange);
+
+    raiseDNSRecordTTLTask.next(verifyMigrationTask);
+
     // Create the Step Function
     const stepFunctionlambdaFunctions = [
       createACMCertificateLambda,
       createValidationRecordInCloudflareLambda,
-      checkValidationStatusLambda,
-      createOriginRecordLambda,
-      createWebACLLambda,
-      createCloudFrontDistributionLambda,
-      checkCFDistributionStatusLambda,
       updateDNSRecordLambda,
+      raiseDNSRecordTTLLambda,
+      verifyMigrationLambda,
     ];
 
     const stepFunctionLambdaArns = stepFunctionlambdaFunctions.map(fn => fn.functionArn);
@@ -575,12 +1204,290 @@ export class CflareAutoMigrationStack extends cdk.Stack {
 
     const my_state_machine = new cdk.aws_stepfunctions.StateMachine(this, 'migrationCloudflare', {
       definition,
-      timeout: cdk.Duration.minutes(30),
+      timeout: cdk.Duration.minutes(120), // leaves room for executions queued by admission control
       role: stepFunctionRole
     });
 
     console.log(my_state_machine.stateMachineArn)
     lambdaQuickMigration.addEnvironment("STEP_FUNCTION_ARN", my_state_machine.stateMachineArn)
     lambdaQuickMigration.addEnvironment("TABLE_NAME", migrationTable.tableName)
+    lambdaQuickMigration.addEnvironment("CUTOVER_TTL", cutoverTtl)
+
+    // create a stepfunction to roll back the resources of a failed or aborted migration.
+    const prepareRollbackLambdaRole = createLambdaRole(this, 'prepareRollback', [
+      new cdk.aws_iam.PolicyStatement({
+        effect: cdk.aws_iam.Effect.ALLOW,
+        actions: ['states:StopExecution'],
+        resources: [`arn:aws:states:${this.region}:${this.account}:execution:${my_state_machine.stateMachineName}:*`],
+      }),
+      new cdk.aws_iam.PolicyStatement({
+        effect: cdk.aws_iam.Effect.ALLOW,
+        actions: ['secretsmanager:RestoreSecret'],
+        resources: [`arn:aws:secretsmanager:${this.region}:${this.account}:secret:cflare-auto-migration/*`],
+      })
+    ]);
+    const prepareRollbackLambda = new cdk.aws_lambda.Function(this, 'PrepareRollbackLambda', {
+      runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
+      handler: 'PrepareRollback.lambda_handler',
+      code: cdk.aws_lambda.Code.fromAsset(lambdaDir + '/stepfunctions_lambda'),
+      timeout: cdk.Duration.seconds(60),
+      role: prepareRollbackLambdaRole,
+      environment: {
+        TABLE_NAME: migrationTable.tableName,
+      }
+    });
+
+    const restoreDNSRecordLambdaRole = createLambdaRole(this, 'restoreDNSRecord', [
+      new cdk.aws_iam.PolicyStatement({
+        effect: cdk.aws_iam.Effect.ALLOW,
+        actions: ['route53:ListResourceRecordSets', 'route53:ChangeResourceRecordSets'],
+        resources: ['arn:aws:route53:::hostedzone/*'],
+      })
+    ]);
+    const restoreDNSRecordLambda = new cdk.aws_lambda.Function(this, 'RestoreDNSRecordLambda', {
+      runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
+      handler: 'RestoreDNSRecord.lambda_handler',
+      code: cdk.aws_lambda.Code.fromAsset(lambdaDir + '/stepfunctions_lambda'),
+      timeout: cdk.Duration.seconds(30),
+      role: restoreDNSRecordLambdaRole,
+      environment: {
+        TABLE_NAME: migrationTable.tableName,
+        ADMISSION_TABLE_NAME: admissionTable.tableName,
+      }
+    });
+
+    const disableDistributionLambdaRole = createLambdaRole(this, 'disableDistribution', [
+      new cdk.aws_iam.PolicyStatement({
+        effect: cdk.aws_iam.Effect.ALLOW,
+        actions: ['cloudfront:GetDistributionConfig', 'cloudfront:UpdateDistribution'],
+        resources: ['*'],
+      })
+    ]);
+    const disableDistributionLambda = new cdk.aws_lambda.Function(this, 'DisableDistributionLambda', {
+      runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
+      handler: 'DisableDistribution.lambda_handler',
+      code: cdk.aws_lambda.Code.fromAsset(lambdaDir + '/stepfunctions_lambda'),
+      timeout: cdk.Duration.seconds(30),
+      role: disableDistributionLambdaRole,
+      environment: {
+        TABLE_NAME: migrationTable.tableName,
+        ADMISSION_TABLE_NAME: admissionTable.tableName,
+      }
+    });
+
+    const deleteMigrationResourcesLambdaRole = createLambdaRole(this, 'deleteMigrationResources', [
+      new cdk.aws_iam.PolicyStatement({
+        effect: cdk.aws_iam.Effect.ALLOW,
+        actions: ['cloudfront:GetDistribution', 'cloudfront:DeleteDistribution', 'wafv2:GetWebACL', 'wafv2:DeleteWebACL'],
+        resources: ['*'],
+      }),
+      new cdk.aws_iam.PolicyStatement({
+        effect: cdk.aws_iam.Effect.ALLOW,
+        actions: ['acm:DeleteCertificate'],
+        resources: [`arn:aws:acm:us-east-1:${this.account}:certificate/*`],
+      }),
+      new cdk.aws_iam.PolicyStatement({
+        effect: cdk.aws_iam.Effect.ALLOW,
+        actions: ['route53:ChangeResourceRecordSets'],
+        resources: ['arn:aws:route53:::hostedzone/*'],
+      }),
+      cloudflareSecretReadStatement,
+    ]);
+    const deleteMigrationResourcesLambda = new cdk.aws_lambda.Function(this, 'DeleteMigrationResourcesLambda', {
+      runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
+      handler: 'DeleteMigrationResources.lambda_handler',
+      code: cdk.aws_lambda.Code.fromAsset(lambdaDir + '/stepfunctions_lambda'),
+      timeout: cdk.Duration.seconds(60),
+      role: deleteMigrationResourcesLambdaRole,
+      environment: {
+        TABLE_NAME: migrationTable.tableName,
+        ADMISSION_TABLE_NAME: admissionTable.tableName,
+      }
+    });
+
+    migrationTable.grantReadWriteData(prepareRollbackLambda)
+    migrationTable.grantReadWriteData(restoreDNSRecordLambda)
+    migrationTable.grantReadWriteData(disableDistributionLambda)
+    migrationTable.grantReadWriteData(deleteMigrationResourcesLambda)
+    admissionTable.grantReadWriteData(restoreDNSRecordLambda)
+    admissionTable.grantReadWriteData(disableDistributionLambda)
+    admissionTable.grantReadWriteData(deleteMigrationResourcesLambda)
+
+    const prepareRollbackTask = addRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Prepare Rollback', {
+      lambdaFunction: prepareRollbackLambda,
+      resultPath: '$.rollback',
+      payloadResponseOnly: true,
+      payload: cdk.aws_stepfunctions.TaskInput.fromObject({
+        "migration_id": cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
+      })
+    }));
+
+    // Tasks of the stopped executions may still be running and adding to the resource ledger. Stopping
+    // the parent does not stop its synchronous Express child, which runs until its own timeout, and
+    // the Lambda it last invoked (30s at most) can outlive that.
+    const waitForStoppedExecutions = new cdk.aws_stepfunctions.Wait(this, 'Wait For Stopped Executions', {
+      time: cdk.aws_stepfunctions.WaitTime.duration(provisioningTimeout.plus(cdk.Duration.seconds(30)))
+    });
+
+    const rollbackRecordFailed = new cdk.aws_stepfunctions.Pass(this, 'Rollback Record Failed');
+
+    // Records past the flip to CloudFront get their original A/AAAA records back before the distribution goes away
+    const restoreDNSRecordTask = addRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Restore DNS Record', {
+      lambdaFunction: restoreDNSRecordLambda,
+      resultPath: '$.dnsRestore',
+      payloadResponseOnly: true,
+      payload: cdk.aws_stepfunctions.TaskInput.fromObject({
+        "migration_id": cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
+        "dns_record": cdk.aws_stepfunctions.JsonPath.stringAt("$.dns_record"),
+        "ZoneID": cdk.aws_stepfunctions.JsonPath.stringAt("$.ZoneID"),
+      })
+    })).addCatch(rollbackRecordFailed, {
+      errors: ['States.ALL'],
+      resultPath: '$.error'
+    });
+
+    // Resolvers may still hold the CNAME to the distribution for its TTL
+    const waitForRestoredDNSRecord = new cdk.aws_stepfunctions.Wait(this, 'Wait For Restored DNS Record', {
+      time: cdk.aws_stepfunctions.WaitTime.secondsPath('$.dnsRestore.WaitSeconds')
+    });
+
+    const disableDistributionTask = addRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Disable Distribution', {
+      lambdaFunction: disableDistributionLambda,
+      resultPath: '$.distribution',
+      payloadResponseOnly: true,
+      payload: cdk.aws_stepfunctions.TaskInput.fromObject({
+        "migration_id": cdk.aws_stepfunctions.JsonPath.stringAt("$.migration_id"),
+        "dns_record": cdk.aws_stepfunctions.JsonPath.stringAt("$.dns_record"),
+      })
+    })).addCatch(rollbackRecordFailed, {
+      errors: ['States.ALL'],
+      resultPath: '$.error'
+    });
+
+    const waitForDisabledDistribution = new cdk.aws_stepfunctions.Wait(this, 'Wait For Disabled Distribution', {
+      time: cdk.aws_stepfunctions.WaitTime.duration(cdk.Duration.seconds(60))
+    });
+
+    const checkDisabledDistributionStatusTask = addServiceRetryPolicies(new cdk.aws_stepfunctions_tasks.CallAwsService(this, 'Check Disabled Distribution Status', {
+      service: 'cloudfront',
+      action: 'getDistribution',
+      iamResources: [`arn:aws:cloudfront::${this.account}:distribution/*`],
+      parameters: {
+        "Id": cdk.aws_stepfunctions.JsonPath.stringAt("$.distribution.DistributionId")
+      },
+      resultSelector: {
+        "Status": cdk.aws_stepfunctions.JsonPath.stringAt("$.Distribution.Status")
+      },
+      resultPath: '$.distributionStatus',
+    })).addCatch(rollbackRecordFailed, {
+      errors: ['States.ALL'],
+      resultPath: '$.error'
+    });
+
+    const deleteMigrationResourcesTask = addRetryPolicies(new cdk.aws_stepfunctions_tasks.LambdaInvoke(this, 'Delete Migration Resources', {
+      lambdaFunction: deleteMigrationResourcesLambda,
+      resultPath: '$.rollbackResult',
+      payloadResponseOnly: true,
+    })).addCatch(rollbackRecordFailed, {
+      errors: ['States.ALL'],
+      resultPath: '$.error'
+    });
+
+    const hasDistributionChoice = new cdk.aws_stepfunctions.Choice(this, 'Has Distribution?');
+    const isDistributionDisabledChoice = new cdk.aws_stepfunctions.Choice(this, 'IsDistributionDisabled');
+
+    hasDistributionChoice
+      .when(cdk.aws_stepfunctions.Condition.stringEquals('$.distribution.DistributionId', ''), deleteMigrationResourcesTask)
+      .otherwise(waitForDisabledDistribution.next(checkDisabledDistributionStatusTask).next(isDistributionDisabledChoice));
+
+    isDistributionDisabledChoice
+      .when(cdk.aws_stepfunctions.Condition.stringEquals('$.distributionStatus.Status', 'Deployed'), deleteMigrationResourcesTask)
+      .otherwise(waitForDisabledDistribution);
+
+    // Bounded parallelism: records are rolled back a few at a time, on top of the admission control buckets
+    const rollbackRecordsMap = new cdk.aws_stepfunctions.Map(this, 'Rollback Records', {
+      itemsPath: '$.rollback.records',
+      maxConcurrency: 10,
+      itemSelector: {
+        "migration_id": cdk.aws_stepfunctions.JsonPath.stringAt("$$.Map.Item.Value.migration_id"),
+        "dns_record": cdk.aws_stepfunctions.JsonPath.stringAt("$$.Map.Item.Value.dns_record"),
+        "ZoneID": cdk.aws_stepfunctions.JsonPath.stringAt("$.rollback.ZoneID"),
+        "CloudflareZoneID": cdk.aws_stepfunctions.JsonPath.stringAt("$.rollback.CloudflareZoneID"),
+        "CloudflareSecretId": cdk.aws_stepfunctions.JsonPath.stringAt("$.rollback.CloudflareSecretId"),
+      },
+      resultPath: cdk.aws_stepfunctions.JsonPath.DISCARD,
+    }).itemProcessor(restoreDNSRecordTask.next(waitForRestoredDNSRecord).next(disableDistributionTask).next(hasDistributionChoice));
+
+    // Scheduled for deletion only: rolling back again within the recovery window restores it (PrepareRollback)
+    const deleteCloudflareSecretTask = addServiceRetryPolicies(new cdk.aws_stepfunctions_tasks.CallAwsService(this, 'Delete Cloudflare Secret', {
+      service: 'secretsmanager',
+      action: 'deleteSecret',
+      iamResources: [`arn:aws:secretsmanager:${this.region}:${this.account}:secret:cflare-auto-migration/*`],
+      parameters: {
+        "SecretId": cdk.aws_stepfunctions.JsonPath.stringAt("$.rollback.CloudflareSecretId"),
+        "RecoveryWindowInDays": 7
+      },
+      resultPath: cdk.aws_stepfunctions.JsonPath.DISCARD,
+    })).addCatch(new cdk.aws_stepfunctions.Pass(this, 'Cloudflare Secret Already Deleted'), {
+      errors: ['SecretsManager.ResourceNotFoundException', 'SecretsManager.InvalidRequestException'],
+      resultPath: '$.error'
+    });
+
+    const rollback_state_machine = new cdk.aws_stepfunctions.StateMachine(this, 'rollbackMigration', {
+      definitionBody: cdk.aws_stepfunctions.DefinitionBody.fromChainable(
+        prepareRollbackTask
+          .next(waitForStoppedExecutions)
+          .next(rollbackRecordsMap)
+          .next(deleteCloudflareSecretTask)
+      ),
+      timeout: cdk.Duration.minutes(120),
+    });
+
+    // API to start a rollback of a migration
+    const lambdaRollbackMigrationRole = createLambdaRole(this, 'RollbackMigration', []);
+    const lambdaRollbackMigration = new cdk.aws_lambda.Function(this, 'LambdaRollbackMigration', {
+      runtime: cdk.aws_lambda.Runtime.PYTHON_3_12,
+      code: cdk.aws_lambda.Code.fromAsset(lambdaDir+'/rollback-migration'),
+      handler: 'index.lambda_handler',
+      timeout: cdk.Duration.seconds(15),
+      role: lambdaRollbackMigrationRole,
+      environment: {
+        STEP_FUNCTION_ARN: rollback_state_machine.stateMachineArn,
+      }
+    });
+    rollback_state_machine.grantStartExecution(lambdaRollbackMigration)
+
+    // create a lambda integration with the API gateway and the lambda function
+    const lambdaRollbackMigrationIntegration = new cdk.aws_apigateway.LambdaIntegration(lambdaRollbackMigration);
+
+    // create a resource and map it to the lambda integration
+    const apiRollbackMigrationResource = apiGateway.root.addResource('rollback-migration');
+
+    // add the integration to the resource
+    apiRollbackMigrationResource.addMethod('POST', lambdaRollbackMigrationIntegration);
+
+    // API trace capture for the workflow handlers, enabled with `cdk deploy -c apiTrace=record`.
+    // Traces are replayed offline with tools/replay_trace.py.
+    const apiTraceMode = this.node.tryGetContext('apiTrace') === 'record' ? 'record' : 'off';
+    const apiTraceBucket = new cdk.aws_s3.Bucket(this, 'ApiTraceBucket', {
+      blockPublicAccess: cdk.aws_s3.BlockPublicAccess.BLOCK_ALL,
+      encryption: cdk.aws_s3.BucketEncryption.S3_MANAGED,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+      autoDeleteObjects: true,
+      lifecycleRules: [{ expiration: cdk.Duration.days(30) }],
+    });
+    const tracedLambdaFunctions = [
+      ...stepFunctionlambdaFunctions,
+      ...provisioningLambdaFunctions,
+      prepareRollbackLambda,
+      restoreDNSRecordLambda,
+      disableDistributionLambda,
+      deleteMigrationResourcesLambda,
+    ];
+    for (const fn of tracedLambdaFunctions) {
+      fn.addEnvironment('API_TRACE_MODE', apiTraceMode);
+      fn.addEnvironment('API_TRACE_BUCKET', apiTraceBucket.bucketName);
+      apiTraceBucket.grantPut(fn);
+    }
   }
 }
\ No newline at end of file
@@ -0,0 +1,13 @@
+import os
+import sys
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# The Lambda handlers import their helpers as top-level modules, like the Lambda runtime does
+sys.path.insert(0, os.path.join(ROOT_DIR, 'asset', 'lambda', 'stepfunctions_lambda'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'asset', 'lambda', 'quick-migration'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'tools'))
+
+# Handler modules create their boto3 clients at import time; no call reaches AWS in these tests
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('TABLE_NAME', 'migration-test')
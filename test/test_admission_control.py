@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip('boto3')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+import admission_control  # noqa: E402
+
+
+class FakeBucketTable:
+    # Just the calls admission_control makes against the admission table
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key, ConsistentRead):
+        item = self.items.get(Key['bucket_id'])
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, Item, ConditionExpression):
+        if Item['bucket_id'] in self.items:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem')
+        self.items[Item['bucket_id']] = dict(Item)
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression, ExpressionAttributeValues):
+        item = self.items.get(Key['bucket_id'])
+        if item is None:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+        if UpdateExpression.startswith('ADD'):
+            item['tokens'] += ExpressionAttributeValues[':c']
+        else:
+            item.update(tokens=ExpressionAttributeValues[':t'], last_refill=ExpressionAttributeValues[':now'])
+
+
+@pytest.fixture
+def buckets(monkeypatch):
+    table = FakeBucketTable()
+    monkeypatch.setenv('ADMISSION_TABLE_NAME', 'admission-test')
+    monkeypatch.setattr(admission_control.dynamodb, 'Table', lambda name: table)
+    # Frozen clock: no refill between calls
+    monkeypatch.setattr(admission_control.time, 'time', lambda: 1000.0)
+    return table
+
+
+def tokens(table, bucket_id):
+    return float(table.items[bucket_id]['tokens'])
+
+
+def test_acquire_tokens_takes_every_bucket(buckets):
+    admission_control.acquire_tokens([('route53:ChangeResourceRecordSets', None, 1), ('cloudflare', 'cloudflare#a', 2)])
+
+    assert tokens(buckets, 'route53:ChangeResourceRecordSets') == 4
+    assert tokens(buckets, 'cloudflare#a') == 8
+
+
+def test_denied_acquire_refunds_the_tokens_already_taken(buckets):
+    admission_control.acquire_token('cloudflare', 'cloudflare#a', cost=9)
+
+    with pytest.raises(admission_control.AdmissionDeniedError):
+        admission_control.acquire_tokens([('route53:ChangeResourceRecordSets', None, 1), ('cloudflare', 'cloudflare#a', 2)])
+
+    assert tokens(buckets, 'route53:ChangeResourceRecordSets') == 5
+    assert tokens(buckets, 'cloudflare#a') == 1
+
+
+def test_repeated_denials_do_not_drain_the_other_buckets(buckets):
+    admission_control.acquire_token('cloudflare', 'cloudflare#a', cost=10)
+
+    for _ in range(10):
+        with pytest.raises(admission_control.AdmissionDeniedError):
+            admission_control.acquire_tokens([('route53:ChangeResourceRecordSets', None, 1), ('cloudflare', 'cloudflare#a', 2)])
+
+    admission_control.acquire_token('route53:ChangeResourceRecordSets', cost=5)
+
+
+def test_requests_on_one_bucket_are_admitted_together_up_to_its_burst(buckets):
+    # Seven round-robin origin records at two Cloudflare calls each
+    admission_control.acquire_tokens([('cloudflare', 'cloudflare#a', 2)] * 7)
+
+    assert tokens(buckets, 'cloudflare#a') == 0
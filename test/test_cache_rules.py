@@ -0,0 +1,173 @@
+import pytest
+
+pytest.importorskip('botocore')
+
+import cache_rules  # noqa: E402
+
+
+class FakeCloudFront:
+    # Keeps created cache policies so lookups by name find them
+    def __init__(self):
+        self.policies = {}
+
+    def list_cache_policies(self, Type, Marker=None):
+        return {'CachePolicyList': {'Items': [
+            {'CachePolicy': {'Id': policy_id, 'CachePolicyConfig': {'Name': name}}}
+            for name, policy_id in self.policies.items()
+        ]}}
+
+    def create_cache_policy(self, CachePolicyConfig):
+        policy_id = f'policy-{len(self.policies) + 1}'
+        self.policies[CachePolicyConfig['Name']] = policy_id
+        return {'CachePolicy': {'Id': policy_id}}
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('true', [(['*'], None)]),
+    ('http.request.uri.path.extension eq "png"', [(['*.png'], None)]),
+    ('http.request.uri.path.extension in {"css" "js"}', [(['*.css', '*.js'], None)]),
+    ('starts_with(http.request.uri.path, "/static/")', [(['/static/*'], None)]),
+    ('ends_with(http.request.uri.path, ".pdf")', [(['*.pdf'], None)]),
+    ('http.request.uri.path wildcard "/img/*"', [(['/img/*'], None)]),
+    ('(http.host eq "WWW.example.com" and starts_with(http.request.uri.path, "/a"))', [(['/a*'], ['www.example.com'])]),
+    ('http.host in {"a.example.com" "b.example.com"}', [(['*'], ['a.example.com', 'b.example.com'])]),
+    (
+        '(http.request.uri.path eq "/x") or (http.host eq "api.example.com" and http.request.uri.path eq "/y")',
+        [(['/x'], None), (['/y'], ['api.example.com'])]
+    ),
+    # ' or ' inside a quoted string is not an operator
+    ('http.request.uri.path eq "/this or that"', [(['/this or that'], None)]),
+])
+def test_translate_expression(expression, expected):
+    assert cache_rules.translate_expression(expression) == expected
+
+
+@pytest.mark.parametrize('expression', [
+    'http.cookie contains "session"',
+    'not http.request.uri.path eq "/x"',
+    'http.request.uri.path eq "/a" and http.request.uri.path eq "/b"',
+    'http.host eq "a.example.com" and http.host eq "b.example.com"',
+])
+def test_translate_expression_rejects_what_path_patterns_cannot_express(expression):
+    with pytest.raises(ValueError):
+        cache_rules.translate_expression(expression)
+
+
+def test_cache_rule_override_origin_pins_the_ttl():
+    notes = []
+    rule = {
+        'action': 'set_cache_settings',
+        'action_parameters': {
+            'cache': True,
+            'edge_ttl': {'mode': 'override_origin', 'default': 600},
+            'cache_key': {'custom_key': {'query_string': {'include': {'list': ['v', 'lang']}}}}
+        }
+    }
+
+    spec = cache_rules.translate_cache_rule(rule, ('all', []), notes)
+
+    assert spec == {
+        'min_ttl': 600, 'default_ttl': 600, 'max_ttl': 600,
+        'query_string_behavior': 'whitelist', 'query_strings': ['lang', 'v']
+    }
+    assert notes == []
+
+
+def test_cache_rule_bypass_and_unsupported_parts():
+    notes = []
+    assert cache_rules.translate_cache_rule(
+        {'action': 'set_cache_settings', 'action_parameters': {'cache': False}}, ('all', []), notes
+    ) == 'disabled'
+
+    spec = cache_rules.translate_cache_rule({
+        'action': 'set_cache_settings',
+        'action_parameters': {
+            'cache_key': {'custom_key': {'query_string': {'exclude': {'all': True}}, 'cookie': {'include': ['id']}}},
+            'browser_ttl': {'mode': 'override_origin', 'default': 60}
+        }
+    }, ('all', []), notes)
+
+    assert spec['query_string_behavior'] == 'none'
+    assert (spec['min_ttl'], spec['default_ttl'], spec['max_ttl']) == (0, cache_rules.DEFAULT_EDGE_TTL, cache_rules.MAX_TTL)
+    assert notes == ['custom cache key cookie settings are not carried over', 'browser TTL overrides are not carried over']
+
+    with pytest.raises(ValueError):
+        cache_rules.translate_cache_rule({'action': 'rewrite'}, ('all', []), [])
+
+
+def test_page_rule_translation():
+    notes = []
+    assert cache_rules.translate_page_rule({'actions': [{'id': 'always_use_https'}]}, ('all', []), notes) is None
+    assert cache_rules.translate_page_rule({'actions': [{'id': 'cache_level', 'value': 'bypass'}]}, ('all', []), notes) == 'disabled'
+
+    spec = cache_rules.translate_page_rule({'actions': [
+        {'id': 'cache_level', 'value': 'simplified'},
+        {'id': 'edge_cache_ttl', 'value': 86400},
+        {'id': 'browser_cache_ttl', 'value': 3600}
+    ]}, ('all', []), notes)
+
+    assert spec == {
+        'min_ttl': 86400, 'default_ttl': 86400, 'max_ttl': 86400,
+        'query_string_behavior': 'none', 'query_strings': []
+    }
+    assert notes == ['browser cache TTL is not carried over']
+
+
+def test_page_rule_matches():
+    def rule(target):
+        return {'targets': [{'constraint': {'value': target}}]}
+
+    assert cache_rules.page_rule_matches(rule('*example.com/static/*')) == [(['/static/*'], None)]
+    assert cache_rules.page_rule_matches(rule('https://Shop.example.com/*')) == [(['/*'], ['shop.example.com'])]
+    assert cache_rules.page_rule_matches(rule('www.example.com')) == [(['*'], ['www.example.com'])]
+
+
+def test_build_cache_plan_orders_and_deduplicates(monkeypatch):
+    # Cloudflare evaluates later cache rules last (they win) and cache rules after page rules;
+    # CloudFront picks the first matching behavior, so the plan lists them the other way round
+    cache_rule_set = [
+        {'id': 'r1', 'description': 'images', 'action': 'set_cache_settings',
+         'expression': 'http.request.uri.path.extension eq "png"',
+         'action_parameters': {'edge_ttl': {'mode': 'override_origin', 'default': 600}}},
+        {'id': 'r2', 'description': 'no api cache', 'action': 'set_cache_settings',
+         'expression': 'starts_with(http.request.uri.path, "/api/")',
+         'action_parameters': {'cache': False}},
+        {'id': 'r3', 'description': 'cookies', 'action': 'set_cache_settings',
+         'expression': 'http.cookie contains "session"', 'action_parameters': {}},
+        {'id': 'r4', 'enabled': False, 'action': 'set_cache_settings', 'expression': 'true', 'action_parameters': {}},
+    ]
+    responses = {
+        '/zones/z/settings': [{'id': 'cache_level', 'value': 'simplified'}],
+        '/zones/z/rulesets/phases/http_request_cache_settings/entrypoint': {'rules': cache_rule_set},
+        '/zones/z/pagerules?status=active': [
+            {'priority': 1, 'targets': [{'constraint': {'value': '*example.com/*.png'}}],
+             'actions': [{'id': 'edge_cache_ttl', 'value': 600}]},
+        ],
+    }
+    monkeypatch.setattr(cache_rules, 'cloudflare_get', lambda token, path: responses[path])
+    cloudfront = FakeCloudFront()
+
+    plan = cache_rules.build_cache_plan('token', 'z', cloudfront)
+
+    patterns = [behavior['path_pattern'] for behavior in plan['behaviors']]
+    assert patterns[:3] == ['/api/*', '*.png', '/*.png']
+    assert patterns[3:] == cache_rules.DEFAULT_PATH_PATTERNS
+    assert plan['behaviors'][0]['cache_policy_id'] == cache_rules.CACHING_DISABLED_POLICY_ID
+    # The page rule pins the same TTLs and query strings as the cache rule, so both share a policy
+    assert plan['behaviors'][1]['cache_policy_id'] == plan['behaviors'][2]['cache_policy_id']
+    assert plan['policy_count'] == len(cloudfront.policies) == 2
+    assert plan['default_cache_policy_id'] == cache_rules.ORIGIN_HEADERS_POLICY_ID
+    assert plan['unmapped'] == ['Cache rule "cookies": unsupported condition "http.cookie contains "session""']
+
+
+def test_build_cache_plan_reports_unreadable_sources(monkeypatch):
+    def cloudflare_get(token, path):
+        raise OSError('connection reset')
+
+    monkeypatch.setattr(cache_rules, 'cloudflare_get', cloudflare_get)
+
+    plan = cache_rules.build_cache_plan('token', 'z', FakeCloudFront())
+
+    assert [behavior['path_pattern'] for behavior in plan['behaviors']] == cache_rules.DEFAULT_PATH_PATTERNS
+    assert plan['default_cache_policy_id'] == cache_rules.ORIGIN_HEADERS_QUERY_STRINGS_POLICY_ID
+    assert len(plan['unmapped']) == 3
@@ -0,0 +1,147 @@
+import copy
+
+import pytest
+
+pytest.importorskip('boto3')
+
+import RestoreDNSRecord  # noqa: E402
+import UpdateDNSRecord  # noqa: E402
+
+ZONE_ID = 'Z123'
+MIGRATION_ID = 'm-1'
+DISTRIBUTION_CNAME = 'd111111abcdef8.cloudfront.net'
+
+
+class FakeRoute53:
+    # Record sets of one hosted zone, keyed by (name, type), changed batch by batch like Route 53
+    def __init__(self, record_sets):
+        self.record_sets = {(r['Name'], r['Type']): r for r in record_sets}
+        self.batches = []
+
+    def list_resource_record_sets(self, HostedZoneId, StartRecordName, MaxItems):
+        start = StartRecordName.rstrip('.') + '.'
+        names = sorted(key for key in self.record_sets if key[0] >= start)
+        return {'ResourceRecordSets': [copy.deepcopy(self.record_sets[key]) for key in names[:int(MaxItems)]]}
+
+    def change_resource_record_sets(self, HostedZoneId, ChangeBatch):
+        record_sets = dict(self.record_sets)
+        for change in ChangeBatch['Changes']:
+            record = dict(change['ResourceRecordSet'], Name=change['ResourceRecordSet']['Name'].rstrip('.') + '.')
+            key = (record['Name'], record['Type'])
+            if change['Action'] == 'DELETE':
+                assert record_sets.get(key) == record, f"DELETE of {key} does not match the record set"
+                del record_sets[key]
+            else:
+                record_sets[key] = record
+        # A CNAME cannot coexist with other record sets of the same name
+        for name, record_type in record_sets:
+            if record_type == 'CNAME':
+                assert [key for key in record_sets if key[0] == name] == [(name, 'CNAME')]
+        self.record_sets = record_sets
+        self.batches.append(ChangeBatch['Changes'])
+        return {'ChangeInfo': {'Id': f'/change/C{len(self.batches)}'}}
+
+    def answer(self, name):
+        return {key[1]: [v['Value'] for v in r['ResourceRecords']] for key, r in self.record_sets.items() if key[0] == name}
+
+
+class FakeTable:
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+    def get_item(self, Key, ConsistentRead):
+        return {'Item': {'resources': copy.deepcopy(self.ledger)}}
+
+
+class FakeDynamoDB:
+    def __init__(self, ledger):
+        self.ledger = ledger
+
+    def Table(self, name):
+        return FakeTable(self.ledger)
+
+
+@pytest.fixture
+def workflow(monkeypatch):
+    def setup(record_sets):
+        route53 = FakeRoute53(record_sets)
+        ledger = {}
+        statuses = []
+        for module in (UpdateDNSRecord, RestoreDNSRecord):
+            monkeypatch.setattr(module.boto3, 'client', lambda service, **kwargs: route53)
+            monkeypatch.setattr(module, 'acquire_token', lambda *args, **kwargs: None)
+            monkeypatch.setattr(module, 'record_resources', lambda migration_id, dns_record, resources: ledger.update(copy.deepcopy(resources)))
+        monkeypatch.setattr(RestoreDNSRecord.boto3, 'resource', lambda service, **kwargs: FakeDynamoDB(ledger))
+        monkeypatch.setattr(UpdateDNSRecord, 'update_record_status', lambda *args, **kwargs: statuses.append(args[3]))
+        monkeypatch.setattr(RestoreDNSRecord, 'set_rollback_status', lambda *args, **kwargs: statuses.append(args[2]))
+        return route53, ledger, statuses
+    return setup
+
+
+def update(hostname):
+    return UpdateDNSRecord.lambda_handler({
+        'viewer_domain': hostname, 'CNAME': DISTRIBUTION_CNAME, 'ZoneID': ZONE_ID, 'migration_id': MIGRATION_ID
+    }, None)
+
+
+def restore(hostname):
+    return RestoreDNSRecord.lambda_handler({'migration_id': MIGRATION_ID, 'dns_record': hostname, 'ZoneID': ZONE_ID}, None)
+
+
+def record_set(name, record_type, values, ttl=60):
+    return {'Name': name, 'Type': record_type, 'TTL': ttl, 'ResourceRecords': [{'Value': value} for value in values]}
+
+
+def test_address_origin_flips_and_restores(workflow):
+    route53, ledger, statuses = workflow([
+        record_set('www.example.com.', 'A', ['192.0.2.1', '192.0.2.2']),
+        record_set('www.example.com.', 'AAAA', ['2001:db8::1']),
+    ])
+
+    assert update('www.example.com')['status'] == 'success'
+    assert route53.answer('www.example.com.') == {'CNAME': [DISTRIBUTION_CNAME]}
+    assert [r['Type'] for r in ledger['replaced_route53_records']] == ['A', 'AAAA']
+
+    assert restore('www.example.com') == {'WaitSeconds': 60}
+    assert route53.answer('www.example.com.') == {'A': ['192.0.2.1', '192.0.2.2'], 'AAAA': ['2001:db8::1']}
+    assert statuses == ['SUCCEEDED']
+
+
+def test_cname_origin_flips_and_restores(workflow):
+    route53, ledger, statuses = workflow([record_set('shop.example.com.', 'CNAME', ['shops.myshopify.com'])])
+
+    assert update('shop.example.com')['status'] == 'success'
+    assert route53.answer('shop.example.com.') == {'CNAME': [DISTRIBUTION_CNAME]}
+    assert ledger['replaced_route53_records'] == [record_set('shop.example.com.', 'CNAME', ['shops.myshopify.com'])]
+
+    assert restore('shop.example.com') == {'WaitSeconds': 60}
+    assert route53.answer('shop.example.com.') == {'CNAME': ['shops.myshopify.com']}
+
+
+def test_retried_flip_keeps_the_original_records_in_the_ledger(workflow):
+    route53, ledger, _ = workflow([record_set('shop.example.com.', 'CNAME', ['shops.myshopify.com'])])
+
+    update('shop.example.com')
+    update('shop.example.com')
+
+    assert ledger['replaced_route53_records'] == [record_set('shop.example.com.', 'CNAME', ['shops.myshopify.com'])]
+
+
+def test_restore_waits_for_the_raised_cname_ttl_even_when_retried(workflow):
+    route53, ledger, _ = workflow([record_set('www.example.com.', 'A', ['192.0.2.1'])])
+    update('www.example.com')
+    # Raise DNS TTL after the change is INSYNC
+    route53.change_resource_record_sets(HostedZoneId=ZONE_ID, ChangeBatch={'Changes': [
+        {'Action': 'UPSERT', 'ResourceRecordSet': record_set('www.example.com', 'CNAME', [DISTRIBUTION_CNAME], ttl=3600)}
+    ]})
+
+    assert restore('www.example.com') == {'WaitSeconds': 3600}
+    assert restore('www.example.com') == {'WaitSeconds': 3600}
+    assert route53.answer('www.example.com.') == {'A': ['192.0.2.1']}
+
+
+def test_record_without_a_flip_has_nothing_to_restore(workflow):
+    route53, _, _ = workflow([record_set('www.example.com.', 'A', ['192.0.2.1'])])
+
+    assert restore('www.example.com') == {'WaitSeconds': 0}
+    assert route53.batches == []
@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_probe
+
+SLOW_SECONDS = 2
+
+# Sent without Content-Length in several writes, the end of the body is the server closing the connection
+STREAMED_PARTS = [b'first part, ', b'second part, ', b'last part']
+
+
+def make_handler(responses):
+    # responses: {path: (status, body)}; /slow answers after SLOW_SECONDS, /streamed sends STREAMED_PARTS
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/slow':
+                time.sleep(SLOW_SECONDS)
+            if self.path == '/streamed':
+                # HTTP/1.0 handler: the connection closes after the response
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain')
+                self.end_headers()
+                for part in STREAMED_PARTS:
+                    self.wfile.write(part)
+                    self.wfile.flush()
+                    time.sleep(0.05)
+                return
+            status, body = responses.get(self.path, (200, b'same'))
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def servers():
+    # Two local stand-ins for the Cloudflare and CloudFront edges of the same hostname
+    started = []
+    for responses in [
+        {'/status': (200, b'same'), '/body': (200, b'cloudflare')},
+        {'/status': (404, b'missing'), '/body': (200, b'cloudfront')},
+    ]:
+        server = ThreadingHTTPServer(('127.0.0.1', 0), make_handler(responses))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        started.append(server)
+    yield {
+        name: {'connect_host': '127.0.0.1', 'port': server.server_address[1], 'tls': False}
+        for name, server in zip(['cloudflare', 'cloudfront'], started)
+    }
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def run_probe(targets, paths, timeout=5):
+    return asyncio.run(http_probe.probe('www.example.com', targets, paths, requests_per_path=3, timeout=timeout))
+
+
+def test_probe_match(servers):
+    result = run_probe(servers, ['/', '/index.html'])
+
+    assert result['match']
+    assert result['mismatches'] == []
+    for target in result['targets'].values():
+        assert target['requests'] == 6
+        assert target['errors'] == 0
+        assert target['ttfb_p50_ms'] >= 0
+
+
+def test_probe_status_mismatch(servers):
+    result = run_probe(servers, ['/', '/status'])
+
+    assert not result['match']
+    assert result['mismatches'] == ['/status: status 200 vs 404']
+
+
+def test_probe_body_mismatch(servers):
+    result = run_probe(servers, ['/body'])
+
+    assert not result['match']
+    assert result['mismatches'] == ['/body: body differs']
+
+
+def test_probe_timeout(servers):
+    result = run_probe(servers, ['/slow'], timeout=0.5)
+
+    assert not result['match']
+    # Only errors on both sides: nothing to compare, the errors alone fail the probe
+    assert result['mismatches'] == []
+    for target in result['targets'].values():
+        assert target['errors'] == 3
+        assert target['first_error'].startswith('TimeoutError')
+        assert target['ttfb_p50_ms'] == -1
+
+
+def test_fetch_reads_close_delimited_body(servers):
+    response = asyncio.run(http_probe.fetch(servers['cloudflare'], 'www.example.com', '/streamed', 5))
+
+    assert response['status'] == 200
+    assert response['body_sha256'] == hashlib.sha256(b''.join(STREAMED_PARTS)).hexdigest()
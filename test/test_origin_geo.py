@@ -0,0 +1,130 @@
+import ipaddress
+
+import pytest
+
+import build_geo_index
+import origin_geo
+
+# (network, country/continent[/longitude], asn, expected shield region, expected price class)
+SYNTHETIC_NETWORKS = [
+    ('3.0.0.0/15', 'US/NA', '16509', 'us-east-1', 'PriceClass_100'),
+    ('34.192.0.0/12', 'US/NA/-78', '14618', 'us-east-1', 'PriceClass_100'),
+    ('34.208.0.0/12', 'US/NA/-120', '16509', 'us-west-2', 'PriceClass_100'),
+    ('13.52.0.0/16', 'US/NA/-122', '16509', 'us-west-2', 'PriceClass_100'),
+    ('15.222.0.0/15', 'CA/NA/-74', '16509', 'us-east-1', 'PriceClass_100'),
+    ('40.176.0.0/15', 'CA/NA/-114', '16509', 'us-west-2', 'PriceClass_100'),
+    ('15.200.0.0/16', 'MX/NA', '8151', 'us-east-2', 'PriceClass_100'),
+    ('18.130.0.0/16', 'GB/EU', '16509', 'eu-west-2', 'PriceClass_100'),
+    ('52.28.0.0/16', 'DE/EU', '16509', 'eu-central-1', 'PriceClass_100'),
+    ('13.112.0.0/14', 'JP/AS', '16509', 'ap-northeast-1', 'PriceClass_200'),
+    ('13.124.0.0/16', 'KR/AS', '16509', 'ap-northeast-2', 'PriceClass_200'),
+    ('13.126.0.0/15', 'IN/AS', '16509', 'ap-south-1', 'PriceClass_200'),
+    ('13.228.0.0/15', 'SG/AS', '16509', 'ap-southeast-1', 'PriceClass_200'),
+    ('15.184.0.0/16', 'BH/AS', '16509', 'ap-south-1', 'PriceClass_200'),
+    ('13.244.0.0/15', 'ZA/AF', '16509', 'eu-west-1', 'PriceClass_200'),
+    ('41.0.0.0/16', 'NG/AF', '37148', 'eu-west-1', 'PriceClass_200'),
+    ('18.228.0.0/16', 'BR/SA', '16509', 'sa-east-1', 'PriceClass_All'),
+    ('13.54.0.0/15', 'AU/OC', '16509', 'ap-southeast-2', 'PriceClass_All'),
+    ('2406:da14::/32', 'JP/AS', '16509', 'ap-northeast-1', 'PriceClass_200'),
+    ('2a05:d014::/32', 'DE/EU', '16509', 'eu-central-1', 'PriceClass_100'),
+    ('2600:1f18::/32', 'US/NA', '16509', 'us-east-1', 'PriceClass_100'),
+    ('2600:1f14::/32', 'US/NA/-120', '16509', 'us-west-2', 'PriceClass_100'),
+    # Anycast CDN origins keep the defaults whatever they geolocate to
+    ('104.16.0.0/13', 'US/NA', '13335', None, 'PriceClass_100'),
+    ('151.101.0.0/16', 'US/NA', '54113', None, 'PriceClass_100'),
+    ('2606:4700::/32', 'US/NA', '13335', None, 'PriceClass_100'),
+]
+
+DEFAULTS = (None, origin_geo.DEFAULT_PRICE_CLASS)
+
+
+@pytest.fixture(scope='module')
+def index(tmp_path_factory):
+    rows = [(*build_geo_index.network_range(network), value, asn) for network, value, asn, _, _ in SYNTHETIC_NETWORKS]
+    path = tmp_path_factory.mktemp('geo') / 'geo_index.csv.gz'
+    build_geo_index.write_index(
+        path,
+        build_geo_index.non_overlapping([(start, end, value) for start, end, value, _ in rows]),
+        build_geo_index.non_overlapping([(start, end, asn) for start, end, _, asn in rows])
+    )
+    return origin_geo.load_index(str(path))
+
+
+# Both ends of every synthetic network
+BOUNDARY_ADDRESSES = [
+    pytest.param(str(address), value, asn, region, price_class, id=str(address))
+    for network, value, asn, region, price_class in SYNTHETIC_NETWORKS
+    for address in (ipaddress.ip_network(network).network_address, ipaddress.ip_network(network).broadcast_address)
+]
+
+
+@pytest.mark.parametrize('address, value, asn, region, price_class', BOUNDARY_ADDRESSES)
+def test_lookup_range_boundaries(index, address, value, asn, region, price_class):
+    country, continent, found_asn, longitude = origin_geo.lookup(address, index)
+
+    assert '/'.join(str(part) for part in (country, continent, longitude) if part is not None) == value
+    assert str(found_asn) == asn
+
+
+@pytest.mark.parametrize('address', ['2.255.255.255', '3.2.0.0', '52.27.255.255', '52.29.0.0', '2a05:d013:ffff:ffff:ffff:ffff:ffff:ffff', '2a05:d015::'])
+def test_lookup_just_outside_a_range(index, address):
+    assert origin_geo.lookup(address, index) == (None, None, None, None)
+
+
+@pytest.mark.parametrize('address, value, asn, region, price_class', BOUNDARY_ADDRESSES)
+def test_country_maps_to_shield_region_and_price_class(index, address, value, asn, region, price_class):
+    assert origin_geo.select_origin_placement([address], index) == (region, price_class)
+
+
+@pytest.mark.parametrize('address', ['104.16.0.1', '104.23.255.255', '151.101.1.69', '2606:4700::6810:84e5'])
+def test_anycast_origins_keep_the_defaults(index, address):
+    assert origin_geo.select_origin_placement([address], index) == DEFAULTS
+
+
+def test_anycast_address_wins_over_geolocated_ones(index):
+    assert origin_geo.select_origin_placement(['52.28.0.1', '104.16.0.1'], index) == DEFAULTS
+
+
+@pytest.mark.parametrize('address', ['1.1.1.1', '10.0.0.1', '192.168.1.1', '2001:db8::1', 'not-an-address'])
+def test_unknown_addresses_keep_the_defaults(index, address):
+    assert origin_geo.select_origin_placement([address], index) == DEFAULTS
+
+
+def test_round_robin_origin_takes_majority_region_and_widest_price_class(index):
+    addresses = ['52.28.0.1', '52.28.10.1', '18.228.0.1']
+
+    assert origin_geo.select_origin_placement(addresses, index) == ('eu-central-1', 'PriceClass_All')
+
+
+def test_missing_index_keeps_the_defaults(tmp_path):
+    empty = origin_geo.load_index(str(tmp_path / 'missing.csv.gz'))
+
+    assert origin_geo.lookup('3.0.0.1', empty) == (None, None, None, None)
+    assert origin_geo.select_origin_placement(['3.0.0.1', '2600:1f18::1'], empty) == DEFAULTS
+
+
+def test_index_built_from_city_blocks_keeps_the_longitude_to_split_the_coasts(tmp_path):
+    (tmp_path / 'locations.csv').write_text(
+        'geoname_id,continent_code,country_iso_code,subdivision_1_iso_code\n'
+        '5809844,NA,US,WA\n'
+        '4930956,NA,US,MA\n'
+        '2921044,EU,DE,\n'
+    )
+    (tmp_path / 'blocks.csv').write_text(
+        'network,geoname_id,registered_country_geoname_id,latitude,longitude\n'
+        '34.208.0.0/13,5809844,6252001,47.6,-122.3\n'
+        '34.216.0.0/13,5809844,6252001,47.6,-122.4\n'
+        '52.0.0.0/16,4930956,6252001,42.4,-71.1\n'
+        '52.28.0.0/16,2921044,2921044,50.1,8.7\n'
+    )
+
+    rows = build_geo_index.read_country_rows([str(tmp_path / 'blocks.csv')], str(tmp_path / 'locations.csv'))
+
+    # Both Seattle ranges round to the same longitude and merge into one
+    assert [value for _, _, value in rows] == ['US/NA/-122', 'US/NA/-71', 'DE/EU']
+    path = tmp_path / 'geo_index.csv.gz'
+    build_geo_index.write_index(path, rows, [])
+    index = origin_geo.load_index(str(path))
+    assert origin_geo.select_origin_placement(['34.223.255.255'], index) == ('us-west-2', 'PriceClass_100')
+    assert origin_geo.select_origin_placement(['52.0.0.1'], index) == ('us-east-1', 'PriceClass_100')
+    assert origin_geo.select_origin_placement(['52.28.0.1'], index) == ('eu-central-1', 'PriceClass_100')
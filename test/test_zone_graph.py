@@ -0,0 +1,107 @@
+import pytest
+
+import zone_graph
+
+ZONE = 'example.com'
+
+
+def record(name, record_type, content, proxied=True):
+    return {'name': name, 'type': record_type, 'content': content, 'proxied': proxied}
+
+
+def test_chain_resolves_to_the_addresses_at_its_end():
+    records = [
+        record('www.example.com', 'CNAME', 'app.example.com.'),
+        record('app.example.com', 'CNAME', 'Origin.Example.com'),
+        record('origin.example.com', 'A', '192.0.2.1', proxied=False),
+        record('origin.example.com', 'AAAA', '2001:db8::1', proxied=False),
+    ]
+
+    groups, failures = zone_graph.plan_migration(records, ZONE)
+
+    assert failures == {}
+    www = next(group for group in groups if group['hostname'] == 'www.example.com')
+    assert www['chain'] == ['www.example.com', 'app.example.com', 'origin.example.com']
+    assert www['origin_info'] == {
+        'type': 'A',
+        'value': '192.0.2.1',
+        'records': [{'type': 'A', 'value': '192.0.2.1'}, {'type': 'AAAA', 'value': '2001:db8::1'}]
+    }
+
+
+def test_chain_stops_at_a_name_outside_the_zone():
+    records = [
+        record('www.example.com', 'CNAME', 'shop.example.com'),
+        record('shop.example.com', 'CNAME', 'shops.myshopify.com.'),
+    ]
+
+    groups, failures = zone_graph.plan_migration(records, ZONE)
+
+    assert failures == {}
+    for group in groups:
+        assert group['origin_info']['type'] == 'CNAME'
+        assert group['origin_info']['value'] == 'shops.myshopify.com'
+
+
+def test_resolution_is_memoized_along_the_chain():
+    index = zone_graph.build_zone_index([
+        record('a.example.com', 'CNAME', 'b.example.com'),
+        record('b.example.com', 'CNAME', 'c.example.com'),
+        record('c.example.com', 'A', '192.0.2.1'),
+    ])
+    resolved = {}
+
+    zone_graph.resolve_origin(index, ZONE, 'a.example.com', resolved)
+
+    assert resolved['b.example.com'] == ([{'type': 'A', 'value': '192.0.2.1'}], ['b.example.com', 'c.example.com'])
+    records, chain = zone_graph.resolve_origin(index, ZONE, 'b.example.com', resolved)
+    assert chain == ['b.example.com', 'c.example.com']
+
+
+def test_cname_cycle_is_unplannable():
+    records = [
+        record('a.example.com', 'CNAME', 'b.example.com'),
+        record('b.example.com', 'CNAME', 'a.example.com'),
+        record('c.example.com', 'CNAME', 'a.example.com'),
+        record('ok.example.com', 'A', '192.0.2.1'),
+    ]
+
+    groups, failures = zone_graph.plan_migration(records, ZONE)
+
+    assert [group['hostname'] for group in groups] == ['ok.example.com']
+    assert failures['a.example.com'] == 'CNAME cycle: a.example.com -> b.example.com -> a.example.com'
+    assert failures['c.example.com'].startswith('CNAME cycle: c.example.com -> a.example.com')
+    assert set(failures) == {'a.example.com', 'b.example.com', 'c.example.com'}
+
+
+def test_dangling_name_is_unplannable():
+    index = zone_graph.build_zone_index([record('www.example.com', 'CNAME', 'gone.example.com')])
+
+    with pytest.raises(zone_graph.UnresolvableOriginError, match='gone.example.com has no A, AAAA or CNAME record'):
+        zone_graph.resolve_origin(index, ZONE, 'www.example.com', {})
+
+
+def test_proxied_dependencies_are_migrated_first():
+    # Listed dependents first: www goes through app, app through api, all of them proxied
+    records = [
+        record('www.example.com', 'CNAME', 'app.example.com'),
+        record('app.example.com', 'CNAME', 'api.example.com'),
+        record('static.example.com', 'A', '192.0.2.2'),
+        record('api.example.com', 'A', '192.0.2.1'),
+        record('api.example.com', 'A', '192.0.2.3'),
+    ]
+
+    groups, failures = zone_graph.plan_migration(records, ZONE)
+
+    # One group per hostname, the round-robin addresses of api stay together
+    assert [group['hostname'] for group in groups] == ['static.example.com', 'api.example.com', 'app.example.com', 'www.example.com']
+    assert len(groups[1]['origin_info']['records']) == 2
+
+
+def test_kahn_order_keeps_ties_in_input_order():
+    order = zone_graph.topological_order(
+        ['b.example.com', 'a.example.com', 'c.example.com'],
+        {'b.example.com': ['a.example.com'], 'a.example.com': [], 'c.example.com': []}
+    )
+
+    assert order == ['a.example.com', 'c.example.com', 'b.example.com']
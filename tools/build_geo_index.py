@@ -0,0 +1,122 @@
+"""Build the offline origin geolocation index used by CreateCloudFrontDistribution.
+
+The index maps origin addresses to a country, continent and ASN, from which the Lambda picks
+the Origin Shield region and price class (asset/lambda/stepfunctions_lambda/origin_geo.py).
+It is built from the MaxMind GeoLite2 City and ASN CSV downloads, which cannot be
+redistributed, so the generated file is not part of the repository:
+
+    python tools/build_geo_index.py build \\
+        --city-blocks GeoLite2-City-Blocks-IPv4.csv --city-blocks GeoLite2-City-Blocks-IPv6.csv \\
+        --locations GeoLite2-City-Locations-en.csv \\
+        --asn-blocks GeoLite2-ASN-Blocks-IPv4.csv --asn-blocks GeoLite2-ASN-Blocks-IPv6.csv
+
+writes asset/lambda/stepfunctions_lambda/geo_index.csv.gz, which `cdk deploy` bundles with the
+Lambda code. The lookup and placement logic is tested against a small synthetic index in
+test/test_origin_geo.py.
+
+The City blocks carry the longitude that splits US and Canadian origins between the east and
+west coast shield regions. The GeoLite2 Country files work too, every US and Canadian origin
+then gets the east coast region.
+"""
+import argparse
+import csv
+import gzip
+import ipaddress
+import os
+import sys
+
+HANDLERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'asset', 'lambda', 'stepfunctions_lambda')
+sys.path.insert(0, HANDLERS_DIR)
+
+import origin_geo  # noqa: E402
+
+
+def network_range(network):
+    network = ipaddress.ip_network(network)
+    return origin_geo.address_to_int(network.network_address), origin_geo.address_to_int(network.broadcast_address)
+
+
+def non_overlapping(rows):
+    # Sorted by start; a range starting inside the previous one is dropped (IPv4-mapped duplicates)
+    result = []
+    for row in sorted(rows):
+        if result and row[0] <= result[-1][1]:
+            continue
+        result.append(row)
+    return result
+
+
+def merge_adjacent(rows):
+    # City blocks split a country into many ranges, consecutive ones with the same value become one
+    result = []
+    for row in rows:
+        if result and row[0] == result[-1][1] + 1 and row[2] == result[-1][2]:
+            result[-1] = (result[-1][0], row[1], row[2])
+        else:
+            result.append(row)
+    return result
+
+
+def read_country_rows(block_paths, locations_path):
+    locations = {}
+    with open(locations_path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row['country_iso_code']:
+                locations[row['geoname_id']] = f"{row['country_iso_code']}/{row['continent_code']}"
+
+    rows = []
+    for path in block_paths:
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                # Anycast and satellite blocks have no country, fall back to the registered one
+                value = locations.get(row['geoname_id']) or locations.get(row['registered_country_geoname_id'])
+                if not value:
+                    continue
+                # Whole degrees are enough to pick a coast, and keep neighbouring ranges mergeable
+                if row.get('longitude') and value.split('/')[0] in origin_geo.WEST_SHIELD_REGIONS:
+                    value += f"/{round(float(row['longitude']))}"
+                rows.append((*network_range(row['network']), value))
+    return merge_adjacent(non_overlapping(rows))
+
+
+def read_asn_rows(block_paths):
+    rows = []
+    for path in block_paths:
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                rows.append((*network_range(row['network']), row['autonomous_system_number']))
+    return non_overlapping(rows)
+
+
+def write_index(path, geo_rows, asn_rows):
+    with gzip.open(path, 'wt', newline='') as f:
+        writer = csv.writer(f)
+        for start, end, value in geo_rows:
+            writer.writerow(['geo', start, end, value])
+        for start, end, value in asn_rows:
+            writer.writerow(['asn', start, end, value])
+
+
+def build_command(args):
+    geo_rows = read_country_rows(args.city_blocks, args.locations)
+    asn_rows = read_asn_rows(args.asn_blocks)
+    write_index(args.output, geo_rows, asn_rows)
+    print(f"Wrote {len(geo_rows)} location ranges and {len(asn_rows)} ASN ranges to {args.output} ({os.path.getsize(args.output)} bytes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='build the index from GeoLite2 CSV files')
+    build.add_argument('--city-blocks', '--country-blocks', dest='city_blocks', action='append', required=True)
+    build.add_argument('--locations', required=True)
+    build.add_argument('--asn-blocks', action='append', default=[])
+    build.add_argument('--output', default=origin_geo.GEO_INDEX_PATH)
+
+    args = parser.parse_args()
+    build_command(args)
+
+
+if __name__ == '__main__':
+    main()
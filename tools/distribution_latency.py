@@ -0,0 +1,78 @@
+"""Compare distribution readiness for pooled and freshly created distributions.
+
+For every execution of the migration state machine, measures the time from entering
+'Provision Resources' (or 'Create CloudFront Distribution' in executions started before the
+provisioning steps moved to the Express child) to entering 'Update DNS Record', which covers
+creating (or claiming and updating) the distribution and the Wait For CF Distribution loop
+until it is Deployed. Executions are grouped by the DistributionSource the task returned:
+
+    python tools/distribution_latency.py arn:aws:states:...:stateMachine:migrationCloudflare... --max-executions 200
+"""
+import argparse
+import json
+import math
+
+import boto3
+
+START_STATES = ('Provision Resources', 'Create CloudFront Distribution')
+END_STATE = 'Update DNS Record'
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+def list_executions(client, state_machine_arn, max_executions):
+    paginator = client.get_paginator('list_executions')
+    count = 0
+    for page in paginator.paginate(stateMachineArn=state_machine_arn, statusFilter='SUCCEEDED'):
+        for execution in page['executions']:
+            yield execution['executionArn']
+            count += 1
+            if count >= max_executions:
+                return
+
+
+def measure_execution(client, execution_arn):
+    started = ended = source = None
+    paginator = client.get_paginator('get_execution_history')
+    for page in paginator.paginate(executionArn=execution_arn):
+        for event in page['events']:
+            if event['type'] == 'TaskStateEntered' and event['stateEnteredEventDetails']['name'] in START_STATES and started is None:
+                started = event['timestamp']
+            elif event['type'] == 'TaskStateExited' and event['stateExitedEventDetails']['name'] in START_STATES:
+                output = json.loads(event['stateExitedEventDetails'].get('output') or '{}')
+                source = output.get('distributionDetails', {}).get('DistributionSource', 'created')
+            elif event['type'] == 'TaskStateEntered' and event['stateEnteredEventDetails']['name'] == END_STATE and ended is None:
+                ended = event['timestamp']
+    if started is None or ended is None:
+        return None
+    return source, (ended - started).total_seconds()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('state_machine_arn')
+    parser.add_argument('--max-executions', type=int, default=100)
+    args = parser.parse_args()
+
+    client = boto3.client('stepfunctions')
+    by_source = {}
+    for execution_arn in list_executions(client, args.state_machine_arn, args.max_executions):
+        measured = measure_execution(client, execution_arn)
+        if measured:
+            source, seconds = measured
+            by_source.setdefault(source, []).append(seconds)
+
+    print(f"{'source':10} {'records':>8} {'p50 (s)':>9} {'p95 (s)':>9}")
+    for source, durations in sorted(by_source.items()):
+        print(f"{source:10} {len(durations):>8} {percentile(durations, 50):>9.0f} {percentile(durations, 95):>9.0f}")
+
+    if 'pool' in by_source and 'created' in by_source:
+        saved = percentile(by_source['created'], 50) - percentile(by_source['pool'], 50)
+        print(f"\nA pooled distribution saves {saved:.0f}s per record at the median")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Per-record latency and state transitions of the migration workflow.
+
+Reads the history of recent executions of the migration state machine (one execution per
+record) and reports their duration, the number of state transitions billed to the
+Standard workflow, how many tasks invoked a Lambda function or called a service directly,
+and the time spent in the polling and error handling tasks. Runs of the nested Express provisioning workflow are billed by duration,
+which is taken from the BillingDetails the 'Provision Resources' task returns:
+
+    python tools/execution_stats.py arn:aws:states:...:stateMachine:migrationCloudflare... --output after.json
+
+Run it once against executions from before a change and once after, then compare the two reports.
+"""
+import argparse
+import json
+import math
+
+import boto3
+
+PROVISIONING_STATE = 'Provision Resources'
+
+# Tasks whose latency is reported per execution; error handling tasks are matched by prefix
+POLLING_STATES = ('Check Validation Status', 'Check CloudFront Distribution Status', 'Check DNS Change Status')
+ERROR_HANDLING_PREFIXES = ('Handle Error', 'Record Failure', 'Refresh Failed Record', 'Count Failure', 'Bump Migration Version')
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+def list_executions(client, state_machine_arn, max_executions):
+    paginator = client.get_paginator('list_executions')
+    count = 0
+    for page in paginator.paginate(stateMachineArn=state_machine_arn, statusFilter='SUCCEEDED'):
+        for execution in page['executions']:
+            yield execution
+            count += 1
+            if count >= max_executions:
+                return
+
+
+def measure_execution(client, execution):
+    transitions = 0
+    express_billed_ms = 0
+    lambda_invocations = 0
+    service_calls = 0
+    polling_task_ms = 0
+    error_handling_ms = 0
+    state, scheduled = None, None
+    paginator = client.get_paginator('get_execution_history')
+    for page in paginator.paginate(executionArn=execution['executionArn']):
+        for event in page['events']:
+            # Standard workflows bill one transition per state entered
+            if event['type'].endswith('StateEntered'):
+                transitions += 1
+                state = event['stateEnteredEventDetails']['name']
+            elif event['type'] == 'TaskScheduled':
+                if event['taskScheduledEventDetails']['resourceType'] == 'lambda':
+                    lambda_invocations += 1
+                else:
+                    service_calls += 1
+                scheduled = event['timestamp']
+            elif event['type'].endswith('StateExited') and scheduled:
+                elapsed_ms = (event['timestamp'] - scheduled).total_seconds() * 1000
+                if state in POLLING_STATES:
+                    polling_task_ms += elapsed_ms
+                elif state.startswith(ERROR_HANDLING_PREFIXES):
+                    error_handling_ms += elapsed_ms
+                scheduled = None
+            elif event['type'] == 'TaskSucceeded' and event['taskSucceededEventDetails'].get('resourceType') == 'states':
+                output = json.loads(event['taskSucceededEventDetails'].get('output') or '{}')
+                express_billed_ms += output.get('BillingDetails', {}).get('BilledDurationInMilliseconds', 0)
+    return {
+        'execution': execution['executionArn'],
+        'duration_s': (execution['stopDate'] - execution['startDate']).total_seconds(),
+        'transitions': transitions,
+        'express_billed_ms': express_billed_ms,
+        'lambda_invocations': lambda_invocations,
+        'service_calls': service_calls,
+        'polling_task_ms': polling_task_ms,
+        'error_handling_ms': error_handling_ms
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('state_machine_arn')
+    parser.add_argument('--max-executions', type=int, default=100)
+    parser.add_argument('--output', help='write the per-execution results as JSON')
+    args = parser.parse_args()
+
+    client = boto3.client('stepfunctions')
+    results = [measure_execution(client, execution) for execution in list_executions(client, args.state_machine_arn, args.max_executions)]
+    if not results:
+        print("No succeeded executions found")
+        return
+
+    print(f"{'':22} {'p50':>9} {'p95':>9} {'mean':>9}")
+    for key, label in (('duration_s', 'duration (s)'), ('transitions', 'transitions'), ('express_billed_ms', 'express billed (ms)'),
+                       ('lambda_invocations', 'lambda invocations'), ('service_calls', 'service calls'),
+                       ('polling_task_ms', 'polling tasks (ms)'), ('error_handling_ms', 'error handling (ms)')):
+        values = [result[key] for result in results]
+        print(f"{label:22} {percentile(values, 50):>9.0f} {percentile(values, 95):>9.0f} {sum(values) / len(values):>9.1f}")
+    print(f"\n{len(results)} executions")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Replay recorded API traces against the workflow handlers.
+
+Traces are recorded by deploying with `cdk deploy -c apiTrace=record`, which makes every
+workflow handler write a gzip JSONL trace per invocation to the API trace bucket. After
+downloading them (aws s3 sync s3://<bucket>/traces/<migration_id> traces/), run:
+
+    python tools/replay_trace.py traces/ --scale 0.5 --output before.json
+
+Each trace runs in its own process with API_TRACE_MODE=replay, so every AWS and Cloudflare
+call is answered from the trace after sleeping for the recorded latency times --scale. Handler
+code runs for real, which makes two runs over the same traces comparable across code changes.
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+HANDLERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'asset', 'lambda', 'stepfunctions_lambda')
+
+# Handlers whose own network traffic is not captured (the verifier's HTTP probes)
+LIVE_NETWORK_HANDLERS = {'VerifyMigration'}
+
+
+def find_traces(paths):
+    traces = []
+    for path in paths:
+        if os.path.isdir(path):
+            traces.extend(sorted(glob.glob(os.path.join(path, '**', '*.jsonl.gz'), recursive=True)))
+        else:
+            traces.append(path)
+    return traces
+
+
+def replay_one(trace_path):
+    # Runs in the child process: environment first, then the handler imports
+    sys.path.insert(0, HANDLERS_DIR)
+    import api_trace
+
+    header, _ = api_trace.load_trace(trace_path)
+    os.environ.update(header.get('environment', {}))
+    module_name, function_name = header['handler'].rsplit('.', 1)
+    handler = getattr(__import__(module_name), function_name)
+
+    started = time.perf_counter()
+    try:
+        handler(header['event'], None)
+        outcome = 'success'
+    except Exception as e:
+        outcome = f'{type(e).__name__}: {e}'
+    return {
+        'trace': trace_path,
+        'handler': module_name,
+        'recorded_outcome': header.get('outcome'),
+        'outcome': outcome,
+        'recorded_ms': header.get('duration_ms'),
+        'replayed_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def replay(trace_path, scale):
+    env = dict(
+        os.environ,
+        API_TRACE_MODE='replay',
+        API_TRACE_FILE=trace_path,
+        API_TRACE_SCALE=str(scale),
+        AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+        AWS_ACCESS_KEY_ID='replay',
+        AWS_SECRET_ACCESS_KEY='replay'
+    )
+    completed = subprocess.run(
+        [sys.executable, __file__, '--single', trace_path],
+        env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        return {'trace': trace_path, 'outcome': f'replay crashed: {completed.stderr.strip()[-500:]}'}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, -(-len(ordered) * p // 100) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('traces', nargs='*', help='trace files or directories')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier for the recorded latencies (0 replays as fast as possible)')
+    parser.add_argument('--output', help='write the per-trace results as JSON')
+    parser.add_argument('--single', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        print(json.dumps(replay_one(args.single)))
+        return
+
+    results = []
+    for trace_path in find_traces(args.traces):
+        handler = os.path.basename(os.path.dirname(trace_path))
+        if handler.split('.')[0] in LIVE_NETWORK_HANDLERS:
+            print(f"skip   {trace_path} (makes uncaptured network calls)")
+            continue
+        result = replay(trace_path, args.scale)
+        mismatch = '' if result.get('outcome') == result.get('recorded_outcome') else f" (recorded: {result.get('recorded_outcome')})"
+        print(f"{result.get('replayed_ms', '-'):>9} ms  {trace_path}: {result['outcome']}{mismatch}")
+        results.append(result)
+
+    by_handler = {}
+    for result in results:
+        if 'replayed_ms' in result:
+            by_handler.setdefault(result['handler'], []).append(result)
+    print()
+    print(f"{'handler':40} {'runs':>5} {'recorded p50':>13} {'replayed p50':>13} {'replayed p95':>13}")
+    for handler, handler_results in sorted(by_handler.items()):
+        recorded = [r['recorded_ms'] for r in handler_results if r.get('recorded_ms') is not None]
+        replayed = [r['replayed_ms'] for r in handler_results]
+        print(f"{handler:40} {len(handler_results):>5} {percentile(recorded, 50) if recorded else '-':>13} {percentile(replayed, 50):>13} {percentile(replayed, 95):>13}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
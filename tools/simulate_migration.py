@@ -0,0 +1,458 @@
+"""Discrete-event simulator of the migrationCloudflare workflow.
+
+Plays a record manifest through the workflow offline: step latencies, the 30s/60s/10s waits
+and polling loops, the admission token buckets (read from admission_control.py), the retry
+policies of the state machine, the Express provisioning deferral and account quotas. It
+reports the predicted completion time, where admission control queues executions (throttle
+hot spots) and the lowest concurrency that still finishes as fast as the best one.
+
+Latencies come from a profile built from past migrations in the migration table:
+
+    python tools/simulate_migration.py profile --table <MigrationTable> --migration-id <id> -o profile.json
+
+and then:
+
+    python tools/simulate_migration.py run --records 2000 --profile profile.json --concurrency 25,50,100,200,0
+
+A manifest (--manifest) is a JSON list of {"hostname": ..., "origin_type": "A" | "CNAME",
+"origins": <A/AAAA values>} objects or a text file with one hostname per line. Concurrency 0 starts every execution at
+once, which is what quick-migration does today. Steps without samples in the profile use
+the built-in defaults below.
+"""
+import argparse
+import ast
+import heapq
+import json
+import math
+import os
+import random
+import time
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'asset', 'lambda', 'stepfunctions_lambda')
+ADMISSION_CONTROL = os.path.join(LAMBDA_DIR, 'admission_control.py')
+CLOUDFLARE_DNS = os.path.join(LAMBDA_DIR, 'cloudflare_dns.py')
+
+# Retry policies of lib/cflare-auto-migration-stack.ts: (interval, backoff rate, max delay, max attempts)
+ADMISSION_RETRY = (2, 1.5, 60, 60)
+PROVISIONING_ADMISSION_RETRY = (2, 1.5, 15, 6)
+
+# Parent wait before starting a deferred provisioning run again
+PROVISIONING_DEFER_SECONDS = 60
+
+# Steps the state machine runs as direct service integrations instead of Lambda invocations
+SERVICE_INTEGRATION_STEPS = {'Check Validation Status', 'Check CloudFront Distribution Status', 'Check DNS Change Status'}
+
+# Default account quotas; raised ones are passed with --quota name=value
+SERVICE_QUOTAS = {
+    'acm_certificates': 2500,
+    'web_acls': 100,
+    'distributions': 500,
+}
+
+# (median, p95) seconds, sampled from a log-normal distribution
+DEFAULT_PROFILE = {
+    'Create ACM Certificate': (0.8, 2),
+    'Create Validation Record in Cloudflare': (1.2, 3),
+    'Check Validation Status': (0.1, 0.3),
+    'Create Origin Record': (1.5, 4),
+    'Create Web ACL': (1.0, 3),
+    'Create CloudFront Distribution': (1.5, 4),
+    'Check CloudFront Distribution Status': (0.1, 0.3),
+    'Update DNS Record': (0.6, 1.5),
+    'Check DNS Change Status': (0.2, 0.5),
+    'Raise DNS TTL': (0.4, 1),
+    'Verify Migration': (4, 10),
+    # Time ACM needs to validate once the record exists, CloudFront to deploy, Route53 to be INSYNC
+    'validation': (120, 600),
+    'deploy': (240, 600),
+    'dns_sync': (30, 60),
+}
+
+
+def load_constant(path, name):
+    # Read a module-level constant without importing the module (the Lambda modules need boto3 and AWS credentials)
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(target, 'id', None) == name for target in node.targets):
+            return ast.literal_eval(node.value)
+    raise RuntimeError(f'{name} not found in {path}')
+
+
+def load_rate_limits():
+    return load_constant(ADMISSION_CONTROL, 'API_RATE_LIMITS')
+
+
+class Sampler:
+    def __init__(self, profile, rng):
+        self.samples = {name: values for name, values in profile.items() if values}
+        self.rng = rng
+
+    def __call__(self, name):
+        if name in self.samples:
+            return self.rng.choice(self.samples[name])
+        median, p95 = DEFAULT_PROFILE[name]
+        sigma = math.log(p95 / median) / 1.645
+        return self.rng.lognormvariate(math.log(median), sigma)
+
+
+class Simulation:
+    def __init__(self, records, rate_limits, cloudflare_calls, sample, quotas, concurrency, rng):
+        self.records = records
+        self.rate_limits = rate_limits
+        # Cloudflare API calls per DNS record, each one takes a token
+        self.cloudflare_calls = cloudflare_calls
+        self.sample = sample
+        self.quotas = quotas
+        self.concurrency = concurrency or len(records)
+        self.rng = rng
+
+        self.now = 0.0
+        self.events = []
+        self.sequence = 0
+        self.buckets = {}
+        self.usage = {name: 0 for name in quotas}
+        self.denials = {}
+        self.transitions = 0
+        self.invocations = 0
+        self.completion_times = []
+        self.failures = {}
+
+    # --- token buckets, same arithmetic as admission_control.acquire_token
+
+    def acquire(self, api):
+        # api is a bucket name, or (bucket name, cost) for handlers making several calls against it
+        api_name, cost = api if isinstance(api, tuple) else (api, 1)
+        rate, burst = self.rate_limits[api_name]
+        tokens, last = self.buckets.get(api_name, (float(burst), self.now))
+        tokens = min(float(burst), tokens + (self.now - last) * rate)
+        if tokens < cost:
+            self.buckets[api_name] = (tokens, self.now)
+            self.denials[api_name] = self.denials.get(api_name, 0) + 1
+            return False
+        self.buckets[api_name] = (tokens - cost, self.now)
+        return True
+
+    def refund(self, api):
+        # admission_control.refund_token: tokens go back unused, capped again by the next acquire
+        api_name, cost = api if isinstance(api, tuple) else (api, 1)
+        tokens, last = self.buckets[api_name]
+        self.buckets[api_name] = (tokens + cost, last)
+
+    def acquire_all(self, apis):
+        # admission_control.acquire_tokens: costs per bucket are merged and capped at its burst,
+        # a denial refunds the tokens already taken
+        costs = {}
+        for api in apis:
+            api_name, cost = api if isinstance(api, tuple) else (api, 1)
+            costs[api_name] = costs.get(api_name, 0) + cost
+        acquired = []
+        for api in [(api_name, min(cost, self.rate_limits[api_name][1])) for api_name, cost in costs.items()]:
+            if not self.acquire(api):
+                for taken in acquired:
+                    self.refund(taken)
+                return False
+            acquired.append(api)
+        return True
+
+    # --- workflow building blocks; generators yield the seconds to sleep
+
+    def wait(self, seconds):
+        self.transitions += 1
+        yield seconds
+
+    def task(self, name, apis=(), retry=ADMISSION_RETRY, quota=None):
+        # Returns True when the step ran, False when admission retries ran out
+        interval, backoff, max_delay, max_attempts = retry
+        self.transitions += 1
+        for attempt in range(1, max_attempts + 1):
+            if name not in SERVICE_INTEGRATION_STEPS:
+                self.invocations += 1
+            if self.acquire_all(apis):
+                yield self.sample(name)
+                if quota:
+                    if self.usage[quota] >= self.quotas[quota]:
+                        raise QuotaExceeded(quota)
+                    self.usage[quota] += 1
+                return True
+            if attempt < max_attempts:
+                self.transitions += 1  # a retry is billed as a transition
+                yield self.rng.uniform(0, min(interval * backoff ** (attempt - 1), max_delay))
+        return False
+
+    def poll(self, name, ready_at, wait_seconds):
+        # Task, Choice and Wait per round until the resource reports ready
+        while True:
+            yield from self.task(name)
+            self.transitions += 1
+            if self.now >= ready_at:
+                return
+            yield from self.wait(wait_seconds)
+
+    def provision(self, record):
+        # Express child: short admission retries, deferred to the parent when they run out
+        done = set()
+        steps = []
+        if record['origin_type'] == 'A':
+            cloudflare = ('cloudflare', self.cloudflare_calls * record['origins'])
+            steps.append(('Create Origin Record', ['route53:ChangeResourceRecordSets', cloudflare], None))
+        steps.append(('Create Web ACL', ['wafv2:CreateWebACL'], 'web_acls'))
+        steps.append(('Create CloudFront Distribution', ['cloudfront:CreateDistribution'], 'distributions'))
+        while True:
+            self.transitions += 2  # Provision Resources and Provisioning Outcome
+            deferred = False
+            for name, apis, quota in steps:
+                if name in done:
+                    continue
+                if (yield from self.task(name, apis, PROVISIONING_ADMISSION_RETRY, quota)):
+                    done.add(name)
+                else:
+                    deferred = True
+                    break
+            if not deferred:
+                return
+            yield from self.wait(PROVISIONING_DEFER_SECONDS)
+
+    def step(self, name, apis=(), quota=None):
+        # A parent task whose admission retries run out fails the record (Handle Error)
+        if not (yield from self.task(name, apis, quota=quota)):
+            raise AdmissionExhausted(name)
+
+    def record_workflow(self, record):
+        yield from self.step('Create ACM Certificate', ['acm:RequestCertificate'], quota='acm_certificates')
+        yield from self.wait(30)
+        yield from self.step('Create Validation Record in Cloudflare', ['route53:ChangeResourceRecordSets', ('cloudflare', self.cloudflare_calls)])
+        yield from self.poll('Check Validation Status', self.now + self.sample('validation'), 30)
+        yield from self.provision(record)
+        yield from self.wait(60)
+        yield from self.poll('Check CloudFront Distribution Status', self.now + self.sample('deploy'), 60)
+        yield from self.step('Update DNS Record', [('route53:ChangeResourceRecordSets', 2)])
+        yield from self.wait(10)
+        yield from self.poll('Check DNS Change Status', self.now + self.sample('dns_sync'), 10)
+        yield from self.step('Raise DNS TTL', ['route53:ChangeResourceRecordSets'])
+        yield from self.step('Verify Migration')
+
+    # --- event loop
+
+    def schedule(self, delay, process, started):
+        self.sequence += 1
+        heapq.heappush(self.events, (self.now + delay, self.sequence, process, started))
+
+    def start_next(self, pending):
+        if pending:
+            self.schedule(0, self.record_workflow(pending.pop()), self.now)
+
+    def run(self):
+        pending = list(reversed(self.records))
+        for _ in range(min(self.concurrency, len(pending))):
+            self.start_next(pending)
+
+        while self.events:
+            self.now, _, process, started = heapq.heappop(self.events)
+            try:
+                delay = next(process)
+            except StopIteration:
+                self.completion_times.append(self.now - started)
+                self.start_next(pending)
+                continue
+            except (QuotaExceeded, AdmissionExhausted) as e:
+                self.failures[str(e)] = self.failures.get(str(e), 0) + 1
+                self.start_next(pending)
+                continue
+            self.schedule(delay, process, started)
+        return self.now
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class AdmissionExhausted(Exception):
+    pass
+
+
+def percentile(values, p):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * p / 100) - 1)]
+
+
+def load_manifest(path):
+    with open(path) as f:
+        content = f.read()
+    try:
+        records = json.loads(content)
+    except json.JSONDecodeError:
+        records = [{'hostname': line.strip()} for line in content.splitlines() if line.strip()]
+    return [
+        {'hostname': record['hostname'], 'origin_type': record.get('origin_type', 'A'), 'origins': record.get('origins', 1)}
+        for record in records
+    ]
+
+
+def run_command(args):
+    rng = random.Random(args.seed)
+    if args.manifest:
+        records = load_manifest(args.manifest)
+    else:
+        records = [
+            {'hostname': f'record-{i}', 'origin_type': 'A' if rng.random() < args.ip_origin_share else 'CNAME', 'origins': 1}
+            for i in range(args.records)
+        ]
+
+    profile = {}
+    if args.profile:
+        with open(args.profile) as f:
+            profile = json.load(f)
+
+    quotas = dict(SERVICE_QUOTAS)
+    for override in args.quota:
+        name, value = override.split('=', 1)
+        quotas[name] = int(value)
+
+    rate_limits = load_rate_limits()
+    cloudflare_calls = load_constant(CLOUDFLARE_DNS, 'CALLS_PER_RECORD')
+    results = []
+    print(f"{len(records)} records, {args.runs} runs per concurrency level\n")
+    print(f"{'concurrency':>11} {'makespan (s)':>13} {'record p50':>11} {'record p95':>11} {'transitions':>12} {'invocations':>12} {'denials':>9} {'failed':>7}")
+    for concurrency in [int(value) for value in args.concurrency.split(',')]:
+        makespans, completions, transitions, invocations, denials, failures = [], [], 0, 0, {}, {}
+        wall_started = time.perf_counter()
+        for run in range(args.runs):
+            sim_rng = random.Random(rng.random())
+            simulation = Simulation(records, rate_limits, cloudflare_calls, Sampler(profile, sim_rng), quotas, concurrency, sim_rng)
+            makespans.append(simulation.run())
+            completions.extend(simulation.completion_times)
+            transitions += simulation.transitions
+            invocations += simulation.invocations
+            for name, count in simulation.denials.items():
+                denials[name] = denials.get(name, 0) + count
+            for name, count in simulation.failures.items():
+                failures[name] = failures.get(name, 0) + count
+        wall = time.perf_counter() - wall_started
+
+        result = {
+            'concurrency': concurrency,
+            'makespan_s': sum(makespans) / len(makespans),
+            'record_p50_s': percentile(completions, 50),
+            'record_p95_s': percentile(completions, 95),
+            'transitions_per_record': transitions / (len(records) * args.runs),
+            'invocations_per_record': invocations / (len(records) * args.runs),
+            'denials': {name: count / args.runs for name, count in denials.items()},
+            'failed': {name: count / args.runs for name, count in failures.items()},
+            'records_per_second': len(records) * args.runs / wall
+        }
+        results.append(result)
+        label = concurrency or 'all'
+        print(f"{label:>11} {result['makespan_s']:>13.0f} {result['record_p50_s']:>11.0f} {result['record_p95_s']:>11.0f} "
+              f"{result['transitions_per_record']:>12.1f} {result['invocations_per_record']:>12.1f} {sum(result['denials'].values()):>9.0f} {sum(result['failed'].values()):>7.0f}")
+
+    best = min(result['makespan_s'] for result in results)
+    # Most executions in flight cost transitions and Lambda invocations on admission retries, so prefer the lowest one
+    candidates = [result for result in results if result['makespan_s'] <= best * (1 + args.tolerance)]
+    optimal = min(candidates, key=lambda result: result['concurrency'] or len(records))
+    print(f"\nLowest concurrency within {args.tolerance:.0%} of the best completion time: {optimal['concurrency'] or 'all'}")
+
+    hot_spots = sorted(optimal['denials'].items(), key=lambda item: -item[1])
+    if hot_spots:
+        print("Admission denials at that level (throttle hot spots):")
+        for name, count in hot_spots:
+            print(f"  {name:40} {count:>9.0f}")
+    for name, count in optimal['failed'].items():
+        if name in quotas:
+            print(f"Records failing on the {name} quota ({quotas[name]}): {count:.0f}")
+        else:
+            print(f"Records failing when admission retries ran out on {name}: {count:.0f}")
+    print(f"\nSimulated {sum(result['records_per_second'] for result in results) / len(results):.0f} records per second")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+def profile_command(args):
+    # Task latencies and readiness times from the execution history of past migrations.
+    # Steps of the Express provisioning workflow are not in the parent's history and keep their defaults.
+    import boto3
+    from boto3.dynamodb.conditions import Key
+
+    table = boto3.resource('dynamodb').Table(args.table)
+    stepfunctions = boto3.client('stepfunctions')
+    samples = {}
+
+    def add(name, value):
+        if value is not None and value >= 0:
+            samples.setdefault(name, []).append(round(value, 3))
+
+    for migration_id in args.migration_id:
+        kwargs = {'KeyConditionExpression': Key('migration_id').eq(migration_id)}
+        while True:
+            response = table.query(**kwargs)
+            for row in response['Items']:
+                if not row.get('execution_arn'):
+                    continue
+                entered, exited = {}, {}
+                state, scheduled = None, None
+                paginator = stepfunctions.get_paginator('get_execution_history')
+                for page in paginator.paginate(executionArn=row['execution_arn']):
+                    for event in page['events']:
+                        timestamp = event['timestamp'].timestamp()
+                        if event['type'].endswith('StateEntered'):
+                            state = event['stateEnteredEventDetails']['name']
+                            entered.setdefault(state, timestamp)
+                        elif event['type'].endswith('StateExited'):
+                            exited[event['stateExitedEventDetails']['name']] = timestamp
+                        elif event['type'] in ('LambdaFunctionScheduled', 'TaskScheduled'):
+                            scheduled = timestamp
+                        elif event['type'] in ('LambdaFunctionSucceeded', 'TaskSucceeded') and scheduled and state in DEFAULT_PROFILE:
+                            add(state, timestamp - scheduled)
+                            scheduled = None
+
+                provisioning = entered.get('Provision Resources', entered.get('Check If Origin Is IP'))
+                if provisioning and 'Create Validation Record in Cloudflare' in exited:
+                    add('validation', provisioning - exited['Create Validation Record in Cloudflare'])
+                if 'Update DNS Record' in entered and 'Wait For CF Distribution' in entered:
+                    add('deploy', entered['Update DNS Record'] - entered['Wait For CF Distribution'])
+                if 'Raise DNS TTL' in entered and 'Wait For DNS Change' in entered:
+                    add('dns_sync', entered['Raise DNS TTL'] - entered['Wait For DNS Change'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    with open(args.output, 'w') as f:
+        json.dump(samples, f, indent=2)
+    for name, values in sorted(samples.items()):
+        print(f"{name:40} {len(values):>6} samples, median {percentile(values, 50):.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='simulate a migration')
+    run.add_argument('--manifest', help='JSON or text record manifest')
+    run.add_argument('--records', type=int, default=500, help='synthetic record count when there is no manifest')
+    run.add_argument('--ip-origin-share', type=float, default=0.5, help='share of synthetic records with A/AAAA origins')
+    run.add_argument('--profile', help='latency profile built with the profile command')
+    run.add_argument('--concurrency', default='10,25,50,100,0', help='comma-separated executions in flight, 0 for all at once')
+    run.add_argument('--runs', type=int, default=5, help='simulations per concurrency level')
+    run.add_argument('--quota', action='append', default=[], help='override a service quota, e.g. web_acls=1000')
+    run.add_argument('--tolerance', type=float, default=0.05, help='completion time slack when picking the concurrency')
+    run.add_argument('--seed', type=int, default=1)
+    run.add_argument('--output', help='write the results as JSON')
+
+    profile = commands.add_parser('profile', help='build a latency profile from past migrations')
+    profile.add_argument('--table', required=True, help='migration table name')
+    profile.add_argument('--migration-id', action='append', required=True)
+    profile.add_argument('-o', '--output', required=True)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        run_command(args)
+    else:
+        profile_command(args)
+
+
+if __name__ == '__main__':
+    main()